@@ -2,14 +2,16 @@ from flask import Flask
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_login import LoginManager
+from flask_login import LoginManager, user_logged_in
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from app.engines import RoutingSession, configure_engines
+from app.rate_limits import limiter
 
 """Creates and configures a Flask app
 using the given config class."""
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login_manager = LoginManager()
 jwt = JWTManager()
@@ -17,30 +19,80 @@ jwt = JWTManager()
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_engines(app)
     db.init_app(app)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     jwt.init_app(app)
+    limiter.init_app(app)
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-    from app.models import User
+    from app.identity import identity_cache, remember_login
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.get(user_id)
+
+    @jwt.user_lookup_loader
+    def load_jwt_user(jwt_header, jwt_data):
+        return identity_cache.get(jwt_data[app.config['JWT_IDENTITY_CLAIM']])
+
+    user_logged_in.connect(remember_login, app)
 
     from app.api.auth import auth_bp
     from app.api.habits import habits_bp
     from app.api.completions import completions_bp
+    from app.api.gamification import gamification_bp
+    from app.api.analytics import analytics_bp
+    from app.api.export import export_bp
     from app.web.routes import web_bp
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(habits_bp, url_prefix='/api/habits')
     app.register_blueprint(completions_bp, url_prefix='/api/completions')
+    app.register_blueprint(gamification_bp, url_prefix='/api/gamification')
+    app.register_blueprint(analytics_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api/export')
     app.register_blueprint(web_bp)
     
 
-    from app.utils import register_error_handlers
+    from app.utils import register_error_handlers, calendar_services
+    from app.cache import user_cache
+    from app.google_integration import google_integration
+    from app.passwords import password_hasher
+    from app.live import live_updates
+    from app.leaderboard import leaderboards
     register_error_handlers(app)
+    google_integration.configure(app)
+    calendar_services.configure(app)
+    user_cache.configure(app)
+    identity_cache.configure(app)
+    password_hasher.configure(app)
+    live_updates.configure(app)
+    leaderboards.configure(app)
+
+    if app.config.get('LEADERBOARD_PRELOAD'):
+        from app.leaderboard import preload
+        preload(app)
+
+    if app.config.get('INSTRUMENTATION_ENABLED'):
+        from app.instrumentation import init_instrumentation, metric_sources
+        from app.engines import pool_metrics
+        init_instrumentation(app)
+        metric_sources['calendar_services'] = calendar_services.stats
+        metric_sources['cache'] = user_cache.stats
+        metric_sources['identity'] = identity_cache.stats
+        metric_sources['passwords'] = password_hasher.stats
+        metric_sources['live_updates'] = live_updates.stats
+        metric_sources['db_pool'] = pool_metrics.stats
+
+    from app.stats import stats_cli
+    from app.calendar_sync import calendar_cli
+    from app.streaks import streaks_cli
+    from app.export import export_cli
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(calendar_cli)
+    app.cli.add_command(streaks_cli)
+    app.cli.add_command(export_cli)
 
     return app
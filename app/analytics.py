@@ -0,0 +1,211 @@
+"""Vectorized analytics over all of a user's habits for an arbitrary date range.
+
+The habits and their HabitStats history bitsets are loaded with one query and
+sliced into a habits x days 0/1 matrix; habits without a stats row fall back
+to a range query over their completions. Every series below is derived from
+that matrix with NumPy. Rates are relative to the days on which each habit
+existed, not to the range length.
+"""
+
+import numpy as np
+from datetime import timedelta
+from sqlalchemy import select, type_coerce, String
+from app import db
+from app.models import Habit, HabitCompletion, HabitStats
+from app import bitset
+
+SECTIONS = ('daily', 'weekly', 'monthly', 'rolling', 'streaks', 'weekdays')
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+def habits_query(user_id, habit_ids=None):
+    """Selects (id, habit_name, created_at, stats_id, history, history_start) for
+    the user's habits; stats_id is None when the habit has no stats row yet.
+    """
+    query = select(
+        Habit.id, Habit.habit_name, Habit.created_at,
+        HabitStats.habit_id.label('stats_id'), HabitStats.history, HabitStats.history_start
+    ).outerjoin(HabitStats, HabitStats.habit_id == Habit.id).where(Habit.user_id == user_id)
+    if habit_ids:
+        query = query.where(Habit.id.in_(habit_ids))
+    return query.order_by(Habit.id)
+
+
+def load_habits(user_id, habit_ids=None):
+    return db.session.execute(habits_query(user_id, habit_ids)).all()
+
+
+def matrix_query(user_id, habit_ids, start, end):
+    # Dates are converted by NumPy in one pass instead of row by row; the
+    # coercion skips SQLAlchemy's per-row date parsing on SQLite.
+    return select(HabitCompletion.habit_id, type_coerce(HabitCompletion.date_completed, String)).where(
+        HabitCompletion.user_id == user_id,
+        HabitCompletion.date_completed.between(start, end),
+        HabitCompletion.habit_id.in_(habit_ids)
+    )
+
+
+def load_matrix(user_id, habit_ids, start, end):
+    """Builds the habits x days completion matrix for `habit_ids` (sorted) from
+    a single range query over their completions.
+    """
+    return fill_matrix(db.session.execute(matrix_query(user_id, habit_ids, start, end)).all(), habit_ids, start, end)
+
+
+def fill_matrix(rows, habit_ids, start, end):
+    """Builds the completion matrix from matrix_query rows."""
+    matrix = np.zeros((len(habit_ids), (end - start).days + 1), dtype=np.uint8)
+    if rows:
+        owners, days = zip(*rows)
+        owners = np.array(owners, dtype=np.int64)
+        if isinstance(days[0], str):
+            offsets = (np.array(days, dtype='datetime64[D]') - np.datetime64(start)).astype(np.int64)
+        else:
+            offsets = np.fromiter((day.toordinal() for day in days), dtype=np.int64, count=len(days)) - start.toordinal()
+        matrix[np.searchsorted(np.array(habit_ids, dtype=np.int64), owners), offsets] = 1
+    return matrix
+
+
+def history_matrix(habits, start, end):
+    """Slices each habit's stored history bitset to [start, end]."""
+    matrix = np.zeros((len(habits), (end - start).days + 1), dtype=np.uint8)
+    for row, habit in enumerate(habits):
+        if habit.history_start:
+            matrix[row] = bitset.window(bitset.to_bits(habit.history), habit.history_start, start, end)
+    return matrix
+
+
+def streak_before(history, history_start, day):
+    """Returns the length of the run of completions ending on `day`, from the stored history."""
+    if not history_start:
+        return 0
+    bits = bitset.to_bits(history)
+    offset = (day - history_start).days
+    if offset < 0 or offset >= bits.size:
+        return 0
+    misses = np.flatnonzero(bits[:offset + 1] == 0)
+    return int(offset - misses[-1]) if misses.size else offset + 1
+
+
+def streak_series(matrix, carry):
+    """Returns the running streak at every day; `carry` holds each habit's
+    streak on the day before the range starts.
+    """
+    days = np.arange(matrix.shape[1])
+    last_miss = np.maximum.accumulate(np.where(matrix == 0, days, -1), axis=1)
+    series = days - last_miss
+    return np.where(last_miss < 0, series + carry[:, None], series)
+
+
+def rolling_rate(matrix, active, window):
+    """Returns completions / active days over the trailing `window` days, in
+    percent. Windows are cut off at the start of the range.
+    """
+    def trailing_sum(values):
+        sums = np.cumsum(values, axis=1, dtype=np.int64)
+        shifted = np.zeros_like(sums)
+        if window < sums.shape[1]:
+            shifted[:, window:] = sums[:, :-window]
+        return sums - shifted
+    return _percent(trailing_sum(matrix), trailing_sum(active))
+
+
+def _percent(counts, days):
+    return np.round(np.divide(counts * 100.0, days, out=np.zeros(counts.shape), where=days > 0), 2)
+
+
+def _grouped(matrix, active, boundaries):
+    counts = np.add.reduceat(matrix, boundaries, axis=1, dtype=np.int64)
+    return counts, _percent(counts, np.add.reduceat(active, boundaries, axis=1, dtype=np.int64))
+
+
+def missing_rows(habits):
+    """Returns the matrix rows of habits without a stats history."""
+    return [row for row, habit in enumerate(habits) if habit.stats_id is None]
+
+
+def range_analytics(user_id, start, end, habit_ids=None, window=7, sections=SECTIONS):
+    """Returns the requested analytics sections for the user's habits over [start, end]."""
+    habits = load_habits(user_id, habit_ids)
+    matrix = history_matrix(habits, start, end)
+    missing = missing_rows(habits)
+    if missing:
+        matrix[missing] = load_matrix(user_id, [habits[row].id for row in missing], start, end)
+    return compute_range_analytics(habits, matrix, start, end, window, sections)
+
+
+def compute_range_analytics(habits, matrix, start, end, window=7, sections=SECTIONS):
+    """Derives the analytics sections from the loaded habits and their completion matrix."""
+    ids = [habit.id for habit in habits]
+    dates = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+
+    # A habit is active from its creation, or its first stored completion if earlier
+    first_days = [
+        min(habit.created_at.date(), habit.history_start) if habit.history_start else habit.created_at.date()
+        for habit in habits
+    ]
+    active = (dates[None, :] >= np.array(first_days, dtype='datetime64[D]')[:, None]).astype(np.uint8)
+    active |= matrix
+
+    carry = np.array(
+        [streak_before(habit.history, habit.history_start, start - timedelta(days=1)) for habit in habits],
+        dtype=np.int64
+    )
+    streaks = streak_series(matrix, carry)
+    totals = matrix.sum(axis=1, dtype=np.int64)
+    active_days = active.sum(axis=1, dtype=np.int64)
+
+    result = {
+        'range': {'start': start.isoformat(), 'end': end.isoformat(), 'days': int(dates.size)},
+        'habits': [{'id': habit.id, 'habit_name': habit.habit_name} for habit in habits],
+        'summary': [
+            {
+                'habit_id': habit_id,
+                'completions': int(total),
+                'completion_rate': float(rate),
+                'current_streak': int(series[-1]) if series.size else 0,
+                'longest_streak': int(series.max()) if series.size else 0,
+            }
+            for habit_id, total, rate, series in zip(ids, totals, _percent(totals, active_days), streaks)
+        ],
+    }
+
+    if 'daily' in sections:
+        result['daily'] = {'start': start.isoformat(), 'matrix': matrix.tolist()}
+
+    if 'weekly' in sections:
+        weekdays = (dates.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        boundaries = np.flatnonzero((weekdays == 0) | (np.arange(dates.size) == 0))
+        counts, rates = _grouped(matrix, active, boundaries)
+        result['weekly'] = {
+            'weeks': [str(dates[index] - weekdays[index]) for index in boundaries],
+            'counts': counts.tolist(),
+            'rates': rates.tolist(),
+        }
+
+    if 'monthly' in sections:
+        months = dates.astype('datetime64[M]')
+        boundaries = np.flatnonzero(np.concatenate(([True], months[1:] != months[:-1])))
+        counts, rates = _grouped(matrix, active, boundaries)
+        result['monthly'] = {
+            'months': [str(months[index]) for index in boundaries],
+            'counts': counts.tolist(),
+            'rates': rates.tolist(),
+        }
+
+    if 'rolling' in sections:
+        result['rolling'] = {'window': window, 'rates': rolling_rate(matrix, active, window).tolist()}
+
+    if 'streaks' in sections:
+        result['streaks'] = {'matrix': streaks.tolist()}
+
+    if 'weekdays' in sections:
+        onehot = np.eye(7, dtype=np.int64)[(dates.astype(np.int64) + 3) % 7]
+        counts = matrix.astype(np.int64) @ onehot
+        result['weekdays'] = {
+            'weekdays': list(WEEKDAYS),
+            'counts': counts.tolist(),
+            'rates': _percent(counts, active.astype(np.int64) @ onehot).tolist(),
+        }
+
+    return result
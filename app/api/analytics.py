@@ -1,44 +1,113 @@
 """
-Provides API endpoints for habit analytics
-including completion data for the last 30 days.
+Provides API endpoints for habit analytics: a 30-day summary for one habit
+and completion matrices for all habits over any date range.
 """
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Habit, HabitCompletion
+from app import db
+from app.models import Habit
 from app.schemas import HabitSchema
-from datetime import datetime, timedelta
+from app.stats import recent_flags, completion_rate
+from app.cache import user_cache
+from app.analytics import range_analytics, SECTIONS
+from datetime import date, datetime, timedelta
+from app.engines import read_only
+from app.conditional import conditional
+from app.rate_limits import per_user, per_ip
 
 analytics_bp = Blueprint('analytics_api', __name__)
 habit_schema = HabitSchema()
 habits_schema = HabitSchema(many=True)
 
 @analytics_bp.route('/habits/<int:habit_id>/analytics', methods=['GET'])
+@per_user('RATELIMIT_ANALYTICS_PER_USER')
+@per_ip()
 @jwt_required()
+@conditional(daily=True)
+@read_only
 def get_habit_analytics(habit_id):
     """Returns analytics of a specific habit
     including total completions and completion rate over the last 30 days
     """
     user_id = get_jwt_identity()
-    habit = Habit.query.filter_by(id=habit_id, user_id=user_id).first()
-    if not habit:
+    data = user_cache.get_or_set(
+        user_id, 'analytics', lambda: load_analytics(db.session, user_id, habit_id), habit_id, date.today(),
+        coalesce=True
+    )
+    if not data:
         return jsonify({'message': 'Habit not found.'}), 404
+    return jsonify(data), 200
+
+
+def load_analytics(session, user_id, habit_id):
+    habit = session.query(Habit).filter_by(id=habit_id, user_id=user_id).first()
+    if not habit:
+        return None
 
-    # Example analytics: completions in the last 30 days
-    thirty_days_ago = datetime.utcnow().date() - timedelta(days=30)
-    completions = HabitCompletion.query.filter(
-        HabitCompletion.habit_id == habit_id,
-        HabitCompletion.date_completed >= thirty_days_ago
-    ).all()
-    
-    completion_dates = [completion.date_completed.strftime('%Y-%m-%d') for completion in completions]
-    total_completions = len(completions)
-    completion_rate = (total_completions / 30) * 100  # Simple rate over 30 days
-
-    return jsonify({
+    # Completions in the last 30 days, read from the stats rollup
+    total_completions = sum(recent_flags(habit.stats))
+    rate = completion_rate(habit.stats, 30)
+
+    return {
         'habit': habit_schema.dump(habit),
         'analytics': {
             'total_completions_last_30_days': total_completions,
-            'completion_rate_last_30_days': round(completion_rate, 2)
+            'completion_rate_last_30_days': round(rate, 2)
         }
-    }), 200
+    }
+
+
+@analytics_bp.route('/analytics', methods=['GET'])
+@per_user('RATELIMIT_ANALYTICS_PER_USER')
+@per_ip()
+@jwt_required()
+@conditional(daily=True)
+@read_only
+def get_range_analytics():
+    """Returns daily/weekly/monthly completion matrices, rolling rates, streak
+    series and weekday heatmaps for the user's habits over [start, end].
+
+    Query parameters: start, end (YYYY-MM-DD, default the last 30 days),
+    habit_id (repeatable), window (rolling window in days, default 7) and
+    include (comma-separated sections, default all).
+    """
+    user_id = get_jwt_identity()
+    try:
+        start, end, habit_ids, window, sections = parse_range_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    data = user_cache.get_or_set(
+        user_id, 'range_analytics',
+        lambda: range_analytics(user_id, start, end, habit_ids, window, sections),
+        start, end, window, habit_ids, ','.join(sorted(sections)), coalesce=True
+    )
+    return jsonify(data), 200
+
+
+def parse_range_args(args):
+    """Parses the /analytics query parameters into (start, end, habit_ids, window,
+    sections); raises ValueError with the message for the client when one is invalid.
+    """
+    try:
+        end = datetime.strptime(args['end'], '%Y-%m-%d').date() if args.get('end') else date.today()
+        start = (datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start')
+                 else end - timedelta(days=29))
+        window = args.get('window', 7, type=int)
+        habit_ids = sorted(set(int(habit_id) for habit_id in args.getlist('habit_id'))) or None
+    except ValueError:
+        raise ValueError('Invalid start, end or habit_id.')
+
+    sections = tuple(args['include'].split(',')) if args.get('include') else SECTIONS
+    max_days = current_app.config.get('ANALYTICS_MAX_RANGE_DAYS', 1096)
+    if start > end:
+        raise ValueError('start must not be after end.')
+    if (end - start).days + 1 > max_days:
+        raise ValueError(f'The range may span at most {max_days} days.')
+    if not window or window < 1:
+        raise ValueError('window must be a positive number of days.')
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f'Unknown sections: {", ".join(sorted(unknown))}.')
+    return start, end, habit_ids, window, sections
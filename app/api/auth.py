@@ -4,7 +4,10 @@ from flask import Blueprint, request, jsonify
 from app import db
 from app.models import User
 from app.schemas import UserSchema
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, unset_jwt_cookies
+from app.engines import read_only
+from app.conditional import conditional
+from app.identity import identity_cache
 
 auth_bp = Blueprint('auth_api', __name__)
 user_schema = UserSchema(session=db.session)
@@ -47,22 +50,16 @@ def login():
         return jsonify({'message': 'Username and password are required.'}), 400
     
     user = User.query.filter_by(username=data['username']).first()
-    if user:
-        print(f"User found: {user.username}")
-        print(f"Provided password: {data['password']}")
-        print(f"Stored hash: {user.password_hash}")
-    else:
-        print("User not found")
-
     if user and user.check_password(data['password']):
+        if db.session.is_modified(user):
+            # The stored hash was upgraded to the current PASSWORD_HASH_METHOD
+            db.session.commit()
         access_token = create_access_token(identity=user.id)
         return jsonify({
             'message': 'Logged in successfully.',
             'access_token': access_token
         }), 200
-        print(access_token)
     else:
-        print("Invalid login attempt")
         return jsonify({'message': 'Invalid username or password.'}), 401
 
 
@@ -77,11 +74,12 @@ def logout():
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@conditional()
+@read_only
 def profile():
     """Returns the current logged-in user's profile information."""
 
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = identity_cache.get(get_jwt_identity())
     if not user:
         return jsonify({'message': 'User not found.'}), 404
     
@@ -1,27 +1,139 @@
 """API endpoints for managing habit completions with JWT authentication."""
 
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_current_user
+from sqlalchemy import select, or_, and_
+from sqlalchemy.orm import selectinload
 from app import db
 from app.models import Habit, HabitCompletion
 from app.schemas import HabitCompletionSchema
-from app.gamification import check_and_award_badges
+from app.serializers import COMPLETION_COLUMNS, serialize_completion
+from app.instrumentation import track_serialization
+from app.cache import user_cache
+from app.gamification import evaluate_badges
+from app.stats import get_or_create_stats, record_completion, record_completions, record_deletion
 from datetime import datetime
+import base64
+import binascii
+import json
+from app.engines import read_only
+from app.conditional import conditional
+from app.rate_limits import per_user, per_ip
+from app.live import live_updates, completion_delta, uncompletion_delta
+from app.dml import insert_ignore
 
 completions_bp = Blueprint('completions_api', __name__)
 completion_schema = HabitCompletionSchema(session=db.session)
-completions_schema = HabitCompletionSchema(many=True)
+
+def encode_cursor(date_completed, completion_id):
+    """Encodes a (date_completed, id) keyset position as an opaque cursor."""
+    raw = f'{date_completed.isoformat()}:{completion_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodes a cursor from encode_cursor; raises ValueError if it is malformed."""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    day, completion_id = raw.split(':')
+    return datetime.strptime(day, '%Y-%m-%d').date(), int(completion_id)
+
+def _parse_completion_filters(args):
+    """Parses the start/end/habit_id query parameters into SQLAlchemy filter clauses."""
+    filters = []
+    if args.get('start'):
+        filters.append(HabitCompletion.date_completed >= datetime.strptime(args['start'], '%Y-%m-%d').date())
+    if args.get('end'):
+        filters.append(HabitCompletion.date_completed <= datetime.strptime(args['end'], '%Y-%m-%d').date())
+    if args.get('habit_id'):
+        filters.append(HabitCompletion.habit_id == int(args['habit_id']))
+    return filters
+
+def parse_completion_args(args):
+    """Parses the filter and paging query parameters of GET /api/completions/ into
+    (filters, limit); filters include the cursor position and limit is None for
+    ?format=ndjson, which streams everything. Raises ValueError with the message
+    for the client when a parameter is invalid.
+    """
+    try:
+        filters = _parse_completion_filters(args)
+    except ValueError:
+        raise ValueError('Invalid filter. Dates use YYYY-MM-DD and habit_id must be an integer.')
+    if args.get('format') == 'ndjson':
+        return filters, None
+
+    page_size = current_app.config.get('COMPLETIONS_PAGE_SIZE', 100)
+    max_page_size = current_app.config.get('COMPLETIONS_MAX_PAGE_SIZE', 1000)
+    try:
+        limit = min(max(int(args.get('limit', page_size)), 1), max_page_size)
+    except ValueError:
+        raise ValueError('limit must be an integer.')
+
+    cursor = args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError, binascii.Error):
+            raise ValueError('Invalid cursor.')
+        filters.append(or_(
+            HabitCompletion.date_completed < cursor_date,
+            and_(HabitCompletion.date_completed == cursor_date, HabitCompletion.id < cursor_id)
+        ))
+    return filters, limit
+
+def completions_select(user_id, filters):
+    """Selects the user's completions, newest first, as COMPLETION_COLUMNS rows."""
+    return select(*COMPLETION_COLUMNS).where(HabitCompletion.user_id == user_id, *filters).order_by(
+        HabitCompletion.date_completed.desc(), HabitCompletion.id.desc()
+    )
+
+def completion_page(rows, limit):
+    """Builds the page body from up to limit + 1 rows; the extra row only signals a next page."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date_completed, rows[-1].id)
+    with track_serialization():
+        completions = [serialize_completion(row) for row in rows]
+    return {'completions': completions, 'next_cursor': next_cursor}
+
+def _stream_completions(user_id, filters):
+    """Yields completions as NDJSON lines from a server-side cursor."""
+    rows = db.session.execute(
+        completions_select(user_id, filters).execution_options(
+            yield_per=current_app.config.get('COMPLETIONS_STREAM_BATCH', 1000)
+        )
+    )
+    for row in rows:
+        yield json.dumps(serialize_completion(row)) + '\n'
 
 @completions_bp.route('/', methods=['GET'])
+@per_user('RATELIMIT_COMPLETIONS_PER_USER')
+@per_ip()
 @jwt_required()
+@conditional()
+@read_only
 def get_completions():
-    """Retrieves all habit completions for the logged-in user."""
+    """Retrieves the logged-in user's habit completions, newest first.
+    Pages with ?limit= and ?cursor= (keyset on date_completed, id) and filters
+    with ?start=, ?end= and ?habit_id=. With ?format=ndjson the whole filtered
+    history is streamed one JSON object per line.
+    """
 
     user_id = get_jwt_identity()
-    completions = HabitCompletion.query.filter_by(user_id=user_id).all()
-    return jsonify({'completions': completions_schema.dump(completions)}), 200
+    try:
+        filters, limit = parse_completion_args(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    if limit is None:
+        return Response(stream_with_context(_stream_completions(user_id, filters)),
+                        mimetype='application/x-ndjson')
+
+    rows = db.session.execute(completions_select(user_id, filters).limit(limit + 1)).all()
+    return jsonify(completion_page(rows, limit)), 200
 
 @completions_bp.route('/', methods=['POST'])
+@per_user('RATELIMIT_COMPLETIONS_WRITE_PER_USER')
+@per_ip()
 @jwt_required()
 def create_completion():
     """Creates a new habit completion for the logged-in user."""
@@ -55,20 +167,125 @@ def create_completion():
         date_completed=date_completed
     )
     db.session.add(new_completion)
-    if date_completed = date.today():
-        habit.update_streak()
     try:
+        stats = record_completion(habit, date_completed)
+        # Check and award badges in the same transaction
+        awarded = evaluate_badges(user_id, commit=False)
+        delta = completion_delta(get_current_user().created_at, [(habit, stats, [date_completed])], awarded)
         db.session.commit()
-        # Check and award badges
-        check_and_award_badges(user_id, habit)
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'Error marking habit as completed.'}), 500
+    user_cache.bump(user_id)
+    live_updates.publish(user_id, delta)
     
     return jsonify({'completion': completion_schema.dump(new_completion)}), 201
 
+@completions_bp.route('/bulk', methods=['POST'])
+@per_user('RATELIMIT_COMPLETIONS_PER_USER')
+@per_ip()
+@jwt_required()
+def bulk_create_completions():
+    """Creates many habit completions in one request, e.g. offline check-ins.
+    Expects {"completions": [{"habit_id": 1, "date_completed": "YYYY-MM-DD"}, ...]}
+    and reports a status for every item in the same order.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    items = data.get('completions') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'completions must be a non-empty list.'}), 400
+    max_items = current_app.config.get('BULK_COMPLETIONS_MAX', 5000)
+    if len(items) > max_items:
+        return jsonify({'message': f'At most {max_items} completions per request.'}), 400
+
+    results = []
+    parsed = []
+    for index, item in enumerate(items):
+        result = {'index': index}
+        results.append(result)
+        # bool is an int subclass; JSON true must not pass as habit 1
+        if not isinstance(item, dict) or not isinstance(item.get('habit_id'), int) or isinstance(item['habit_id'], bool):
+            result.update(status='invalid', message='habit_id is required.')
+            continue
+        result['habit_id'] = item['habit_id']
+        date_completed = item.get('date_completed')
+        if date_completed:
+            try:
+                date_completed = datetime.strptime(date_completed, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                result.update(status='invalid', message='Invalid date format. Use YYYY-MM-DD.')
+                continue
+        else:
+            date_completed = datetime.utcnow().date()
+        result['date_completed'] = date_completed.isoformat()
+        parsed.append((result, item['habit_id'], date_completed))
+
+    habit_ids = {habit_id for _, habit_id, _ in parsed}
+    habits = {}
+    if habit_ids:
+        habits = {habit.id: habit for habit in Habit.query.options(selectinload(Habit.stats)).filter(
+            Habit.user_id == user_id, Habit.id.in_(habit_ids)
+        )}
+
+    keys = {(habit_id, day) for _, habit_id, day in parsed if habit_id in habits}
+    existing = set()
+    if keys:
+        # A range on _habit_date_uc; row-value IN lists are not index-friendly everywhere
+        days = [day for _, day in keys]
+        existing = keys & set(db.session.query(HabitCompletion.habit_id, HabitCompletion.date_completed).filter(
+            HabitCompletion.habit_id.in_({habit_id for habit_id, _ in keys}),
+            HabitCompletion.date_completed.between(min(days), max(days))
+        ))
+
+    pending = {}
+    for result, habit_id, day in parsed:
+        if habit_id not in habits:
+            result.update(status='not_found', message='Habit not found.')
+        elif (habit_id, day) in existing:
+            result.update(status='duplicate', message='Habit already marked as completed for this date.')
+        else:
+            existing.add((habit_id, day))
+            pending[(habit_id, day)] = result
+
+    created = 0
+    if pending:
+        try:
+            # Load every rollup before inserting: one built afterwards would already count the new rows
+            for habit_id in {habit_id for habit_id, _ in pending}:
+                get_or_create_stats(habits[habit_id])
+            inserted = insert_ignore(HabitCompletion.__table__, [
+                {'habit_id': habit_id, 'user_id': user_id, 'date_completed': day} for habit_id, day in pending
+            ], key=('habit_id', 'date_completed'))
+            new_dates = {}
+            for (habit_id, day), result in pending.items():
+                if (habit_id, day) in inserted:
+                    result['status'] = 'created'
+                    new_dates.setdefault(habit_id, []).append(day)
+                else:
+                    # A concurrent request completed it between our check and the insert
+                    result.update(status='duplicate', message='Habit already marked as completed for this date.')
+            created = len(inserted)
+            completed = [
+                (habits[habit_id], record_completions(habits[habit_id], dates), dates)
+                for habit_id, dates in new_dates.items()
+            ]
+            awarded = evaluate_badges(user_id, commit=False) if created else []
+            delta = completion_delta(get_current_user().created_at, completed, awarded)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'message': 'Error marking habits as completed.'}), 500
+        if created:
+            user_cache.bump(user_id)
+            live_updates.publish(user_id, delta)
+
+    return jsonify({'created': created, 'results': results}), 200
+
 @completions_bp.route('/<int:completion_id>', methods=['GET'])
 @jwt_required()
+@conditional()
+@read_only
 def get_completion(completion_id):
     """Retrieves a specific habit completion for the logged-in user by completion ID."""
 
@@ -88,8 +305,15 @@ def delete_completion(completion_id):
     if not completion:
         return jsonify({'message': 'Completion not found.'}), 404
     
+    # Load the habit before deleting: a lazy load afterwards would autoflush the
+    # delete, and a rollup rebuilt from the flushed rows would be decremented twice
+    habit, date_completed = completion.habit, completion.date_completed
     db.session.delete(completion)
+    stats = record_deletion(habit, date_completed)
+    delta = uncompletion_delta(habit, stats, get_current_user().created_at, date_completed)
     db.session.commit()
+    user_cache.bump(user_id)
+    live_updates.publish(user_id, delta)
     
     return jsonify({'message': 'Completion deleted successfully.'}), 200
 
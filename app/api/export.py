@@ -0,0 +1,51 @@
+"""API endpoint exporting the logged-in user's habit history as CSV or XLSX."""
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.export import DATASETS, FORMATS, csv_chunks, write_xlsx
+from datetime import date
+import tempfile
+from app.engines import read_only
+from app.rate_limits import per_user, per_ip
+
+export_bp = Blueprint('export_api', __name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+@export_bp.route('/', methods=['GET'])
+@per_user('RATELIMIT_EXPORT_PER_USER')
+@per_ip()
+@jwt_required()
+@read_only
+def export_history():
+    """Downloads the logged-in user's habits and completions.
+    ?format=csv (default) streams one dataset, ?dataset=completions (default)
+    or habits, while it is read. ?format=xlsx returns a workbook with a sheet
+    per dataset (or only ?dataset=), written to a temporary file first because
+    an XLSX file can only be finished once every row is in it.
+    """
+
+    user_id = get_jwt_identity()
+    export_format = request.args.get('format', 'csv')
+    dataset = request.args.get('dataset')
+    if export_format not in FORMATS:
+        return jsonify({'message': f"format must be one of {', '.join(FORMATS)}."}), 400
+    if dataset is not None and dataset not in DATASETS:
+        return jsonify({'message': f"dataset must be one of {', '.join(DATASETS)}."}), 400
+
+    filename = f'habit-history-{date.today().isoformat()}'
+    if export_format == 'csv':
+        dataset = dataset or 'completions'
+        return Response(stream_with_context(csv_chunks(dataset, user_id)), mimetype='text/csv', headers={
+            'Content-Disposition': f'attachment; filename={filename}-{dataset}.csv'
+        })
+
+    workbook = tempfile.TemporaryFile()
+    try:
+        write_xlsx(workbook, [dataset] if dataset else list(DATASETS), user_id)
+    except Exception:
+        workbook.close()
+        raise
+    workbook.seek(0)
+    # send_file streams the file in blocks and closes (and so deletes) it afterwards
+    return send_file(workbook, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=f'{filename}.xlsx')
@@ -1,17 +1,24 @@
 """Handles gamification features, including badge retrieval for users and general badge information."""
 
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import Badge, UserBadge
+from sqlalchemy import select
+from app import db
+from app.models import Badge, User
+from app.leaderboard import leaderboards, METRICS
 from app.schemas import BadgeSchema, UserBadgeSchema
+from app.serializers import user_badge_rows, serialize_user_badge
+from app.instrumentation import track_serialization
+from app.engines import read_only
+from app.conditional import conditional
 
 gamification_bp = Blueprint('gamification_api', __name__)
 badge_schema = BadgeSchema()
 badges_schema = BadgeSchema(many=True)
 user_badge_schema = UserBadgeSchema()
-user_badges_schema = UserBadgeSchema(many=True)
 
 @gamification_bp.route('/badges', methods=['GET'])
+@read_only
 def get_badges():
     """Retrieves all available badges from the database."""
 
@@ -20,11 +27,55 @@ def get_badges():
 
 @gamification_bp.route('/user_badges', methods=['GET'])
 @jwt_required()
+@conditional()
+@read_only
 def get_user_badges():
     """Retrieves badges awarded to the authenticated user
     """
     user_id = get_jwt_identity()
-    user_badges = UserBadge.query.filter_by(user_id=user_id).all()
-    return jsonify({'user_badges': user_badges_schema.dump(user_badges)}), 200
+    rows = user_badge_rows(user_id)
+    with track_serialization():
+        user_badges = [serialize_user_badge(row) for row in rows]
+    return jsonify({'user_badges': user_badges}), 200
+
+@gamification_bp.route('/leaderboards/<metric>', methods=['GET'])
+@jwt_required()
+@read_only
+def get_leaderboard(metric):
+    """Returns the top users for a metric (streak, week, month or badges)
+    and the authenticated user's own rank.
+    """
+    if metric not in METRICS:
+        return jsonify({'message': f'Unknown leaderboard. Choose one of: {", ".join(METRICS)}.'}), 404
+    user_id = get_jwt_identity()
+    limit, offset = leaderboard_args(request.args)
+
+    entries = leaderboards.top(metric, limit, offset)
+    rank, score, ranked_users = leaderboards.rank(metric, user_id)
+    usernames = dict(db.session.execute(usernames_select(entries)).all()) if entries else {}
+    return jsonify(leaderboard_body(metric, entries, (rank, score, ranked_users), usernames)), 200
+
+
+def leaderboard_args(args):
+    """Returns (limit, offset) from the query parameters, clamped to the allowed range."""
+    limit = max(min(args.get('limit', 10, type=int), current_app.config.get('LEADERBOARD_MAX_LIMIT', 100)), 1)
+    offset = max(args.get('offset', 0, type=int), 0)
+    return limit, offset
+
+
+def usernames_select(entries):
+    return select(User.id, User.username).where(User.id.in_([member for _, member, _ in entries]))
 
 
+def leaderboard_body(metric, entries, me, usernames):
+    rank, score, ranked_users = me
+    return {
+        'metric': metric,
+        'description': METRICS[metric],
+        'ranked_users': ranked_users,
+        'entries': [
+            {'rank': entry_rank, 'user_id': member, 'username': usernames.get(member), 'score': entry_score}
+            for entry_rank, member, entry_score in entries
+        ],
+        'me': {'rank': rank, 'score': score},
+    }
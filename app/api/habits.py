@@ -5,20 +5,38 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Habit
 from app.schemas import HabitSchema
+from app.serializers import habit_rows, serialize_habit
+from app.instrumentation import track_serialization
+from app.cache import user_cache
+from app.engines import read_only
+from app.conditional import conditional
+from app.live import live_updates, added_habit_delta, renamed_habit_delta, removed_habit_delta
 
 habits_bp = Blueprint('habits_api', __name__)
 habit_schema = HabitSchema(session=db.session)
-habits_schema = HabitSchema(many=True)
+
+
+def _load_habits(user_id):
+    rows = habit_rows(Habit.user_id == user_id)
+    with track_serialization():
+        return [serialize_habit(row) for row in rows]
+
+
+def _load_habit(user_id, habit_id):
+    rows = habit_rows(Habit.id == habit_id, Habit.user_id == user_id)
+    return serialize_habit(rows[0]) if rows else None
 
 
 @habits_bp.route('/', methods=['GET'])
 @jwt_required()
+@conditional()
+@read_only
 def get_habits():
     """Retrieves all habits for the logged-in user."""
 
     user_id = get_jwt_identity()
-    habits = Habit.query.filter_by(user_id=user_id).all()
-    return jsonify({'habits': habits_schema.dump(habits)}), 200
+    habits = user_cache.get_or_set(user_id, 'habits', lambda: _load_habits(user_id))
+    return jsonify({'habits': habits}), 200
 
 @habits_bp.route('/', methods=['POST'])
 @jwt_required()
@@ -36,20 +54,26 @@ def create_habit():
         habit_name=data['habit_name']
     )
     db.session.add(new_habit)
+    db.session.flush()
+    delta = added_habit_delta(new_habit)
     db.session.commit()
+    user_cache.bump(user_id)
+    live_updates.publish(user_id, delta)
     
     return jsonify({'habit': habit_schema.dump(new_habit)}), 201
 
 @habits_bp.route('/<int:habit_id>', methods=['GET'])
 @jwt_required()
+@conditional()
+@read_only
 def get_habit(habit_id):
     """Retrieves a specific habit for the logged-in user by habit ID."""
 
     user_id = get_jwt_identity()
-    habit = Habit.query.filter_by(id=habit_id, user_id=user_id).first()
+    habit = user_cache.get_or_set(user_id, 'habit', lambda: _load_habit(user_id, habit_id), habit_id)
     if not habit:
         return jsonify({'message': 'Habit not found.'}), 404
-    return jsonify({'habit': habit_schema.dump(habit)}), 200
+    return jsonify({'habit': habit}), 200
 
 @habits_bp.route('/<int:habit_id>', methods=['PUT'])
 @jwt_required()
@@ -68,8 +92,11 @@ def update_habit(habit_id):
     
     if 'habit_name' in data:
         habit.habit_name = data['habit_name']
+    delta = renamed_habit_delta(habit)
     
     db.session.commit()
+    user_cache.bump(user_id)
+    live_updates.publish(user_id, delta)
     
     return jsonify({'habit': habit_schema.dump(habit)}), 200
 
@@ -85,5 +112,7 @@ def delete_habit(habit_id):
     
     db.session.delete(habit)
     db.session.commit()
+    user_cache.bump(user_id)
+    live_updates.publish(user_id, removed_habit_delta(habit_id))
     
     return jsonify({'message': 'Habit deleted successfully.'}), 200
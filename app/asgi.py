@@ -0,0 +1,450 @@
+"""ASGI application serving the read API natively on asyncio.
+
+GET requests for habits, completions, analytics, badges and leaderboards run as
+coroutines on SQLAlchemy's asyncio extension (aiomysql, or aiosqlite for file
+SQLite databases), so a process holds thousands of concurrent clients without a
+thread each. They run inside a Flask request context: JWT checks, rate limits,
+error responses, CORS headers, instrumentation, cache keys and response bodies
+are the ones of the WSGI views, and @read_only's replica routing and the 304s
+of @conditional() apply too; an identity missing from the identity cache is
+loaded through the async session. Everything else (writes, auth, the web
+pages) is handed to the Flask WSGI app on a thread pool of ASGI_WSGI_THREADS
+threads.
+
+    uvicorn asgi:application
+
+Cache backends are still called synchronously; with the Redis backend each
+lookup holds the event loop for one round trip.
+"""
+
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from io import BytesIO
+from flask import Response, current_app, g, request, request_started
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import UserLookupError
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+from config import Config
+from app import create_app, db
+from app.analytics import compute_range_analytics, fill_matrix, habits_query, history_matrix, matrix_query, missing_rows
+from app.api.analytics import load_analytics, parse_range_args
+from app.api.completions import completion_page, completion_schema, completions_select, parse_completion_args
+from app.api.gamification import badges_schema, leaderboard_args, leaderboard_body, usernames_select
+from app.cache import user_cache
+from app.conditional import add_validators, enabled as conditional_enabled, revalidate
+from app.engines import TimedAsyncQueuePool, engine_options, wrote_recently
+from app.identity import identity_cache
+from app.instrumentation import track_serialization
+from app.leaderboard import leaderboards, METRICS
+from app.rate_limits import limiter
+from app.models import Badge, Habit, HabitCompletion
+from app.serializers import habit_select, serialize_completion, serialize_habit, serialize_user_badge, user_badge_select
+
+ASYNC_DRIVERS = {'mysql': 'aiomysql', 'sqlite': 'aiosqlite'}
+
+
+def async_url(url):
+    """Returns `url` with its driver swapped for the asyncio one."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}; supported: {', '.join(ASYNC_DRIVERS)}")
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        raise ValueError('The ASGI tier needs a file SQLite database; in-memory ones are not shared between engines.')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+class AsyncDatabase:
+    """Async engines for the primary database and the replica bind, if any,
+    pointing at the same databases as the Flask-SQLAlchemy engines. Pools follow
+    ASYNC_DB_ENGINE_PROFILE; ASYNC_SQLALCHEMY_ENGINE_OPTIONS overrides it the way
+    SQLALCHEMY_ENGINE_OPTIONS does for the sync engines.
+    """
+
+    def __init__(self, app):
+        with app.app_context():
+            urls = {key: engine.url for key, engine in db.engines.items() if key in (None, 'replica')}
+        profile = app.config.get('ASYNC_DB_ENGINE_PROFILE') or 'asgi'
+        self.engines = {}
+        for key, url in urls.items():
+            url = async_url(url)
+            name = 'async-replica' if key == 'replica' else 'async-primary'
+            options = engine_options(app.config, url, name, profile=profile, poolclass=TimedAsyncQueuePool)
+            options.update(app.config.get('ASYNC_SQLALCHEMY_ENGINE_OPTIONS') or {})
+            self.engines[key] = create_async_engine(url, **options)
+        self._sessions = {key: async_sessionmaker(engine, expire_on_commit=False) for key, engine in self.engines.items()}
+
+    def session(self, user_id):
+        """Returns a new AsyncSession on the replica, unless there is none or the user wrote recently."""
+        if 'replica' in self._sessions and not wrote_recently(user_id):
+            # Like @read_only, so the cache and ETags know the rows may lag
+            g.db_use_replica = True
+            return self._sessions['replica']()
+        return self._sessions[None]()
+
+    async def dispose(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+class AsyncStream(Response):
+    """Response whose body is sent from an async iterator of bytes after the headers."""
+
+    def __init__(self, chunks, **kwargs):
+        super().__init__(iter(()), **kwargs)
+        self.chunks = chunks
+
+
+async def get_habits(session, user_id):
+    async def load():
+        rows = (await session.execute(habit_select(Habit.user_id == user_id))).all()
+        with track_serialization():
+            return [serialize_habit(row) for row in rows]
+    return {'habits': await user_cache.aget_or_set(user_id, 'habits', load)}, 200
+
+
+async def get_habit(session, user_id, habit_id):
+    async def load():
+        rows = (await session.execute(habit_select(Habit.id == habit_id, Habit.user_id == user_id))).all()
+        return serialize_habit(rows[0]) if rows else None
+    habit = await user_cache.aget_or_set(user_id, 'habit', load, habit_id)
+    if not habit:
+        return {'message': 'Habit not found.'}, 404
+    return {'habit': habit}, 200
+
+
+async def get_completions(session, user_id):
+    try:
+        filters, limit = parse_completion_args(request.args)
+    except ValueError as e:
+        return {'message': str(e)}, 400
+
+    if limit is None:
+        query = completions_select(user_id, filters).execution_options(
+            yield_per=current_app.config.get('COMPLETIONS_STREAM_BATCH', 1000)
+        )
+        return AsyncStream(_stream_completions(session, query), mimetype='application/x-ndjson')
+
+    rows = (await session.execute(completions_select(user_id, filters).limit(limit + 1))).all()
+    return completion_page(rows, limit), 200
+
+
+async def _stream_completions(session, query):
+    result = await session.stream(query)
+    async for rows in result.partitions():
+        yield ''.join(json.dumps(serialize_completion(row)) + '\n' for row in rows).encode()
+
+
+async def get_completion(session, user_id, completion_id):
+    completion = await session.scalar(select(HabitCompletion).filter_by(id=completion_id, user_id=user_id))
+    if not completion:
+        return {'message': 'Completion not found.'}, 404
+    return {'completion': completion_schema.dump(completion)}, 200
+
+
+async def get_habit_analytics(session, user_id, habit_id):
+    data = await user_cache.aget_or_set(
+        user_id, 'analytics', lambda: session.run_sync(load_analytics, user_id, habit_id), habit_id, date.today(),
+        coalesce=True
+    )
+    if not data:
+        return {'message': 'Habit not found.'}, 404
+    return data, 200
+
+
+async def get_range_analytics(session, user_id):
+    try:
+        start, end, habit_ids, window, sections = parse_range_args(request.args)
+    except ValueError as e:
+        return {'message': str(e)}, 400
+
+    async def load():
+        habits = (await session.execute(habits_query(user_id, habit_ids))).all()
+        matrix = history_matrix(habits, start, end)
+        missing = missing_rows(habits)
+        if missing:
+            ids = [habits[row].id for row in missing]
+            rows = (await session.execute(matrix_query(user_id, ids, start, end))).all()
+            matrix[missing] = fill_matrix(rows, ids, start, end)
+        # NumPy work for long ranges is kept off the event loop
+        return await asyncio.to_thread(compute_range_analytics, habits, matrix, start, end, window, sections)
+
+    data = await user_cache.aget_or_set(
+        user_id, 'range_analytics', load, start, end, window, habit_ids, ','.join(sorted(sections)), coalesce=True
+    )
+    return data, 200
+
+
+async def get_badges(session, user_id):
+    badges = (await session.scalars(select(Badge))).all()
+    return {'badges': badges_schema.dump(badges)}, 200
+
+
+async def get_user_badges(session, user_id):
+    rows = (await session.execute(user_badge_select(user_id))).all()
+    with track_serialization():
+        user_badges = [serialize_user_badge(row) for row in rows]
+    return {'user_badges': user_badges}, 200
+
+
+async def get_leaderboard(session, user_id, metric):
+    if metric not in METRICS:
+        return {'message': f'Unknown leaderboard. Choose one of: {", ".join(METRICS)}.'}, 404
+    limit, offset = leaderboard_args(request.args)
+
+    def read():
+        return leaderboards.top(metric, limit, offset), leaderboards.rank(metric, user_id)
+
+    # A (re)build reads every user's stats through the sync session and shared
+    # rankings are Redis round trips; only in-memory reads stay on the loop
+    entries, me = read() if leaderboards.ready else await asyncio.to_thread(read)
+    usernames = dict((await session.execute(usernames_select(entries))).all()) if entries else {}
+    return leaderboard_body(metric, entries, me, usernames), 200
+
+
+# Flask endpoint -> (handler, requires a JWT). Only GET requests are served natively.
+NATIVE_ENDPOINTS = {
+    'habits_api.get_habits': (get_habits, True),
+    'habits_api.get_habit': (get_habit, True),
+    'completions_api.get_completions': (get_completions, True),
+    'completions_api.get_completion': (get_completion, True),
+    'analytics_api.get_habit_analytics': (get_habit_analytics, True),
+    'analytics_api.get_range_analytics': (get_range_analytics, True),
+    'gamification_api.get_badges': (get_badges, False),
+    'gamification_api.get_user_badges': (get_user_badges, True),
+    'gamification_api.get_leaderboard': (get_leaderboard, True),
+}
+
+
+def wsgi_environ(scope, body):
+    """Builds a WSGI environ for an ASGI HTTP request scope."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+class AsyncAPI:
+    """The ASGI application: native handlers for NATIVE_ENDPOINTS, the WSGI app for the rest."""
+
+    def __init__(self, app):
+        self.app = app
+        self.db = AsyncDatabase(app)
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_WSGI_THREADS', 32), thread_name_prefix='asgi-wsgi')
+        self.max_concurrency = app.config.get('ASGI_MAX_CONCURRENCY', 40)
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = await self._read_body(receive)
+            environ = wsgi_environ(scope, body)
+            route = self._match(environ)
+            if route:
+                if self._slots is None:
+                    # Created lazily so it belongs to the server's event loop
+                    self._slots = asyncio.Semaphore(self.max_concurrency)
+                async with self._slots:
+                    await self._call_native(environ, *route, send)
+            else:
+                await self._call_wsgi(environ, send)
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.db.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    def _match(self, environ):
+        """Returns (endpoint, view_args) when a native handler serves the request."""
+        if environ['REQUEST_METHOD'] != 'GET':
+            return None
+        adapter = self.app.url_map.bind_to_environ(environ, server_name=self.app.config.get('SERVER_NAME'))
+        try:
+            rule, view_args = adapter.match(return_rule=True)
+        except HTTPException:
+            # 404s, 405s and trailing-slash redirects are answered by Flask itself
+            return None
+        if rule.endpoint not in NATIVE_ENDPOINTS:
+            return None
+        return rule.endpoint, view_args
+
+    async def _call_native(self, environ, endpoint, view_args, send):
+        """Mirrors Flask.wsgi_app / full_dispatch_request around an async handler."""
+        app = self.app
+        handler, authenticated = NATIVE_ENDPOINTS[endpoint]
+        # Set by @conditional() on the Flask view; None when the endpoint has no validators
+        daily = getattr(app.view_functions[endpoint], 'conditional_daily', None)
+        tags = None
+        session = None
+        ctx = app.request_context(environ)
+        error = None
+        ctx.push()
+        try:
+            try:
+                try:
+                    request_started.send(app, _async_wrapper=app.ensure_sync)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        # Decorator limits are checked when the Flask view runs, which it does not here
+                        limiter.check()
+                        user_id = None
+                        if authenticated:
+                            user_id, session = await self._authenticate()
+                        modified = True
+                        if daily is not None and conditional_enabled():
+                            etag, last_modified, modified = revalidate(user_id, daily)
+                            tags = (etag, last_modified)
+                        if modified:
+                            session = session or self.db.session(user_id)
+                            rv = await handler(session, user_id, **view_args)
+                        else:
+                            rv = app.response_class(status=304)
+                except Exception as e:
+                    tags = None
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+                if tags is not None:
+                    add_validators(response, *tags)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            await self._send_response(environ, response, send)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if session is not None:
+                await session.close()
+            ctx.pop(error)
+
+    async def _authenticate(self):
+        """verify_jwt_in_request() without blocking the loop: an identity that is not
+        cached is loaded through an AsyncSession, which is returned for the handler
+        to reuse. Returns (user_id, session or None)."""
+        try:
+            with identity_cache.cached_only():
+                verify_jwt_in_request()
+            return get_jwt_identity(), None
+        except UserLookupError as e:
+            user_id = e.jwt_data[self.app.config['JWT_IDENTITY_CLAIM']]
+        session = self.db.session(user_id)
+        try:
+            snapshot = await identity_cache.aload(user_id, session)
+            # The handler's reads must not share this snapshot, taken before the cache version is read
+            await session.rollback()
+            # Raises UserLookupError again if the user no longer exists
+            with identity_cache.cached_only({snapshot.id: snapshot} if snapshot else None):
+                verify_jwt_in_request()
+        except BaseException:
+            await session.close()
+            raise
+        return get_jwt_identity(), session
+
+    @staticmethod
+    async def _send_response(environ, response, send):
+        headers = response.get_wsgi_headers(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.to_wsgi_list()],
+        })
+        if isinstance(response, AsyncStream):
+            async for chunk in response.chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        try:
+            body = b''.join(response.get_app_iter(environ))
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _call_wsgi(self, environ, send):
+        """Runs the Flask WSGI app on the thread pool, streaming its body back chunk by chunk."""
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None
+
+        def call():
+            iterable = self.app(environ, start_response)
+            chunks = iter(iterable)
+            # The first chunk comes along so most responses need a single hop
+            return iterable, chunks, next(chunks, None)
+
+        iterable, chunks, chunk = await loop.run_in_executor(self.executor, call)
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            if chunk is None:
+                await send({'type': 'http.response.body', 'body': b''})
+            while chunk is not None:
+                following = await loop.run_in_executor(self.executor, next, chunks, None)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': following is not None})
+                chunk = following
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(self.executor, iterable.close)
+
+
+def create_asgi_app(config_class=Config):
+    """Creates the Flask app and wraps it in the ASGI application."""
+    return AsyncAPI(create_app(config_class))
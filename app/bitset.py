@@ -0,0 +1,108 @@
+"""Day-indexed completion bitsets and vectorized streak/rate routines.
+
+Bit i of a history is set when the habit was completed on `start + i days`.
+Histories are packed little-endian, so a year fits in 46 bytes.
+"""
+
+import numpy as np
+from datetime import timedelta
+
+EMPTY = np.zeros(0, dtype=np.uint8)
+
+
+def to_bits(history):
+    """Unpacks a stored history into a 0/1 uint8 array."""
+    if not history:
+        return EMPTY
+    return np.unpackbits(np.frombuffer(history, dtype=np.uint8), bitorder='little')
+
+
+def from_bits(bits):
+    """Packs a 0/1 array into bytes for storage."""
+    return np.packbits(np.asarray(bits, dtype=np.uint8), bitorder='little').tobytes()
+
+
+def pack_dates(dates, start):
+    """Builds a packed history from completion dates on or after `start`."""
+    offsets = np.fromiter(((day - start).days for day in dates), dtype=np.int64)
+    bits = np.zeros(int(offsets.max()) + 1 if offsets.size else 0, dtype=np.uint8)
+    bits[offsets] = 1
+    return from_bits(bits)
+
+
+def set_days(history, start, days, completed=True):
+    """Sets or clears the bits for `days`, growing the history in either direction.
+    Returns the new (history, start) pair.
+    """
+    days = list(days)
+    if not days:
+        return history, start
+    bits = to_bits(history)
+    first, last = min(days), max(days)
+    if first < start:
+        bits = np.concatenate([np.zeros((start - first).days, dtype=np.uint8), bits])
+        start = first
+    size = (last - start).days + 1
+    if size > bits.size:
+        bits = np.concatenate([bits, np.zeros(size - bits.size, dtype=np.uint8)])
+    else:
+        bits = bits.copy()
+    offsets = np.fromiter(((day - start).days for day in days), dtype=np.int64)
+    bits[offsets] = 1 if completed else 0
+    return from_bits(bits), start
+
+
+def set_day(history, start, day, completed=True):
+    """Sets or clears the bit for a single day; see set_days."""
+    return set_days(history, start, [day], completed)
+
+
+def runs(bits):
+    """Returns (starts, ends) offsets of every run of set bits; run i covers [starts[i], ends[i])."""
+    edges = np.diff(np.concatenate(([0], bits, [0])).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def longest_streak(bits):
+    starts, ends = runs(bits)
+    return int((ends - starts).max()) if starts.size else 0
+
+
+def streak_summary(bits, start):
+    """Returns (current_streak, longest_streak, last_completed), where the current
+    streak is the run ending at the last completion.
+    """
+    starts, ends = runs(bits)
+    if not starts.size:
+        return 0, 0, None
+    return int(ends[-1] - starts[-1]), int((ends - starts).max()), start + timedelta(days=int(ends[-1]) - 1)
+
+
+def current_streak(bits, start, today):
+    """Returns the streak as of `today`: the run ending today or yesterday, else zero."""
+    starts, ends = runs(bits)
+    if not starts.size:
+        return 0
+    last_day = start + timedelta(days=int(ends[-1]) - 1)
+    if (today - last_day).days > 1:
+        return 0
+    return int(ends[-1] - starts[-1])
+
+
+def window(bits, start, window_start, window_end):
+    """Returns the 0/1 flags for every day in [window_start, window_end], zero-filled
+    where the window falls outside the stored history.
+    """
+    days = (window_end - window_start).days + 1
+    out = np.zeros(max(days, 0), dtype=np.uint8)
+    lo = (window_start - start).days
+    src_lo, src_hi = max(lo, 0), min(lo + days, bits.size)
+    if src_hi > src_lo:
+        out[src_lo - lo:src_hi - lo] = bits[src_lo:src_hi]
+    return out
+
+
+def completion_rate(bits, start, window_start, window_end):
+    """Returns the percentage of days in [window_start, window_end] with a completion."""
+    flags = window(bits, start, window_start, window_end)
+    return float(flags.mean() * 100) if flags.size else 0.0
@@ -0,0 +1,405 @@
+"""Read-through cache for user-scoped data such as habit lists, analytics and
+the dashboard. Keys embed a per-user version that every write bumps after it
+commits. On a miss the request's transaction is ended before the loader runs,
+so the loader's snapshot is no older than the version it is stored under and
+an entry built before a write is never read after it.
+Values loaded from a read replica are not stored: the replica may not have
+applied the write whose version the key carries.
+
+Expensive loaders can also be coalesced: concurrent misses on the same key in
+one process share a single computation instead of each querying the database.
+"""
+
+import asyncio
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from app.engines import end_read_transaction, using_replica
+
+logger = logging.getLogger(__name__)
+
+
+class NullBackend:
+    """Stores nothing; every lookup is a miss."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def get_version(self, key):
+        return None
+
+    def add_version(self, key, version):
+        return version
+
+    def bump_version(self, key, now_ns):
+        pass
+
+
+class LRUBackend:
+    """In-process LRU with per-entry expiry. Only safe for a single process:
+    versions bumped in one worker are not seen by the others.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._put(key, expires_at, value)
+
+    def _put(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_version(self, key):
+        return self.get(key)
+
+    def add_version(self, key, version):
+        """Stores `version` unless the key has one; returns the stored version."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._put(key, None, version)
+            return version
+
+    def bump_version(self, key, now_ns):
+        """Sets the version to now_ns, or one past the stored one if that is not older."""
+        with self._lock:
+            entry = self._entries.get(key)
+            self._put(key, None, max(now_ns, entry[1] + 1) if entry is not None else now_ns)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Sets KEYS[1] to ARGV[1] unless the stored version is as new, then increments it
+# instead. Both are decimal strings of non-negative integers, compared by length
+# and then lexically: nanosecond versions do not fit in a Lua number exactly.
+BUMP_VERSION = """
+local current = redis.call('GET', KEYS[1])
+local now = ARGV[1]
+if not current or #now > #current or (#now == #current and now > current) then
+    redis.call('SET', KEYS[1], now)
+else
+    redis.call('INCR', KEYS[1])
+end
+"""
+
+
+class RedisBackend:
+    """Redis (or any server speaking its protocol) shared by all processes.
+    Values are pickled, so the server must not be writable by untrusted clients.
+    Versions are stored as plain integers so they can be bumped atomically.
+    """
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._bump_version = self._client.register_script(BUMP_VERSION)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._client.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl or None)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def clear(self):
+        self._client.flushdb()
+
+    def get_version(self, key):
+        raw = self._client.get(key)
+        return int(raw) if raw is not None else None
+
+    def add_version(self, key, version):
+        if self._client.set(key, version, nx=True):
+            return version
+        return self.get_version(key) or version
+
+    def bump_version(self, key, now_ns):
+        # One server-side step, so concurrent bumps from hosts with skewed clocks never go back
+        self._bump_version(keys=[key], args=[now_ns])
+
+
+BACKENDS = {'null': NullBackend, 'lru': LRUBackend, 'redis': RedisBackend}
+
+_FAILED = object()
+
+
+class _Call:
+    __slots__ = ('done', 'value')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _FAILED
+
+
+class SingleFlight:
+    """While a call for a key is running, other threads calling with the same
+    key wait for it and share its result. If it fails, or takes longer than
+    `timeout` seconds, the waiting threads make the call themselves.
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Returns (value, shared), where shared tells whether another call produced the value."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if call.done.wait(self.timeout) and call.value is not _FAILED:
+                return call.value, True
+            return fn(), False
+        try:
+            call.value = fn()
+            return call.value, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop; `fn` is a coroutine function."""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self._calls = {}
+
+    async def do(self, key, fn):
+        loop = asyncio.get_running_loop()
+        call = self._calls.get(key)
+        if call is not None and call.get_loop() is loop:
+            try:
+                value = await asyncio.wait_for(asyncio.shield(call), self.timeout)
+            except asyncio.TimeoutError:
+                value = _FAILED
+            if value is not _FAILED:
+                return value, True
+            return await fn(), False
+
+        call = self._calls[key] = loop.create_future()
+        value = _FAILED
+        try:
+            value = await fn()
+            return value, False
+        finally:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.set_result(value)
+
+
+class UserCache:
+    """Versioned read-through cache keyed by user id. Loaders must not return None."""
+
+    def __init__(self, backend=None, ttl=300, prefix='ht'):
+        self.backend = backend or NullBackend()
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.errors = 0
+        self.flights = SingleFlight()
+        self.async_flights = AsyncSingleFlight()
+
+    def configure(self, app):
+        config = app.config
+        name = config.get('CACHE_BACKEND', 'null')
+        if name == 'redis':
+            self.backend = RedisBackend(config['CACHE_REDIS_URL'])
+        elif name == 'lru':
+            self.backend = LRUBackend(config.get('CACHE_MAX_ENTRIES', 10000))
+        else:
+            self.backend = BACKENDS[name]()
+        self.ttl = config.get('CACHE_DEFAULT_TTL', 300)
+        self.prefix = config.get('CACHE_KEY_PREFIX', 'ht')
+        self.flights.timeout = self.async_flights.timeout = config.get('CACHE_COALESCE_TIMEOUT', 30)
+
+    def _version_key(self, user_id):
+        return f'{self.prefix}:version:{user_id}'
+
+    def version(self, user_id):
+        """Returns the user's current version. A missing version (never set, or
+        evicted) is replaced with a clock-based one newer than any earlier value,
+        so entries written under an older version stay unreachable.
+        """
+        key = self._version_key(user_id)
+        version = self.backend.get_version(key)
+        if version is None:
+            version = self.backend.add_version(key, time.time_ns())
+        return version
+
+    @property
+    def tracks_writes(self):
+        """False when the backend keeps no versions, so last_write_ns() knows nothing."""
+        return not isinstance(self.backend, NullBackend)
+
+    @property
+    def shares_versions(self):
+        """True when every process reads and bumps the same versions (the redis backend)."""
+        return isinstance(self.backend, RedisBackend)
+
+    def last_write_ns(self, user_id):
+        """Returns the user's stored version, roughly the time of their last write
+        in nanoseconds, or None if nothing is stored. Errors count as a recent write.
+        """
+        try:
+            return self.backend.get_version(self._version_key(user_id))
+        except Exception as e:
+            logger.error(f"Could not read cache version for user {user_id}: {e}")
+            return time.time_ns()
+
+    def bump(self, user_id):
+        """Invalidates everything cached for the user. Call after the write commits."""
+        key = self._version_key(user_id)
+        try:
+            self.backend.bump_version(key, time.time_ns())
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Could not bump cache version for user {user_id}: {e}")
+            try:
+                self.backend.delete(key)
+            except Exception:
+                pass
+
+    def get_or_set(self, user_id, kind, loader, *parts, ttl=None, coalesce=False):
+        """Returns the cached value for (user_id, kind, *parts), calling `loader`
+        and storing its result on a miss. Backend errors fall through to the loader.
+        With `coalesce`, concurrent misses on the same key share one loader call.
+        This needs stored versions, so nothing is shared with the null backend.
+        """
+        try:
+            key, value = self._lookup(user_id, kind, parts)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Cache lookup failed: {e}")
+            return loader()
+        if value is not None:
+            return value
+        if self.tracks_writes:
+            end_read_transaction()
+        if coalesce:
+            value, shared = self.flights.do(key, loader)
+            if shared:
+                self._count_coalesced(kind)
+                return value
+        else:
+            value = loader()
+        self._store(key, value, ttl)
+        return value
+
+    async def aget_or_set(self, user_id, kind, loader, *parts, ttl=None, coalesce=False):
+        """get_or_set for the ASGI tier: `loader` is a coroutine function. Keys
+        are shared with get_or_set, so both tiers read each other's entries.
+        The loader's session must not have queried before the lookup.
+        """
+        try:
+            key, value = self._lookup(user_id, kind, parts)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Cache lookup failed: {e}")
+            return await loader()
+        if value is not None:
+            return value
+        if coalesce:
+            value, shared = await self.async_flights.do(key, loader)
+            if shared:
+                self._count_coalesced(kind)
+                return value
+        else:
+            value = await loader()
+        self._store(key, value, ttl)
+        return value
+
+    def _lookup(self, user_id, kind, parts):
+        key = ':'.join([self.prefix, kind, str(user_id), str(self.version(user_id))] + [str(part) for part in parts])
+        value = self.backend.get(key)
+        self._count(kind, value is not None)
+        return key, value
+
+    def _store(self, key, value, ttl):
+        if value is not None and not using_replica():
+            try:
+                self.backend.set(key, value, ttl or self.ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Cache store failed: {e}")
+
+    def _count(self, kind, hit):
+        with self._lock:
+            counters = self._counters.setdefault(kind, [0, 0, 0])
+            counters[0 if hit else 1] += 1
+
+    def _count_coalesced(self, kind):
+        with self._lock:
+            self._counters[kind][2] += 1
+
+    def stats(self):
+        with self._lock:
+            kinds = {
+                kind: {
+                    'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 4),
+                    'coalesced': coalesced,
+                }
+                for kind, (hits, misses, coalesced) in sorted(self._counters.items())
+            }
+        hits = sum(kind['hits'] for kind in kinds.values())
+        lookups = hits + sum(kind['misses'] for kind in kinds.values())
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': hits,
+            'misses': lookups - hits,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            'coalesced': sum(kind['coalesced'] for kind in kinds.values()),
+            'errors': self.errors,
+            'kinds': kinds,
+        }
+
+
+user_cache = UserCache()
@@ -0,0 +1,203 @@
+"""Transactional outbox for Google Calendar operations and the background
+worker that drains it, so web requests never wait on Google."""
+
+import click
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from app import db
+from app.cache import user_cache
+from app.identity import identity_cache
+from app.models import CalendarOutbox, User
+from app.utils import build_habit_event, insert_google_event, calendar_services
+
+logger = logging.getLogger(__name__)
+
+calendar_cli = AppGroup('calendar', help='Run the Google Calendar outbox worker.')
+
+_workers = {}
+_workers_lock = threading.Lock()
+
+
+def enqueue_calendar_event(user, habit, event_type='add'):
+    """Adds a calendar insert for `habit` to the outbox in the current transaction.
+    Nothing is sent until the caller commits and the worker picks the row up.
+    """
+    entry = CalendarOutbox(
+        user_id=user.id,
+        habit_id=habit.id,
+        operation='insert',
+        payload={'event': build_habit_event(habit.habit_name, event_type)}
+    )
+    db.session.add(entry)
+    if current_app.config.get('CALENDAR_WORKER_IN_PROCESS'):
+        ensure_worker(current_app._get_current_object())
+    return entry
+
+
+def backoff_delay(attempts, base, maximum):
+    """Exponential backoff with jitter: roughly base * 2^(attempts - 1), capped at maximum."""
+    delay = min(maximum, base * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class CalendarOutboxWorker:
+    """Claims due outbox rows in batches and sends them to Google on a thread pool,
+    retrying failures with exponential backoff.
+    """
+
+    def __init__(self, app, max_workers=None, batch_size=None, poll_interval=None):
+        config = app.config
+        self.app = app
+        self.batch_size = batch_size or config.get('CALENDAR_OUTBOX_BATCH_SIZE', 50)
+        self.poll_interval = poll_interval or config.get('CALENDAR_OUTBOX_POLL_INTERVAL', 1.0)
+        self.max_attempts = config.get('CALENDAR_OUTBOX_MAX_ATTEMPTS', 8)
+        self.backoff_base = config.get('CALENDAR_OUTBOX_BACKOFF_BASE', 5)
+        self.backoff_max = config.get('CALENDAR_OUTBOX_BACKOFF_MAX', 3600)
+        self.lease_seconds = config.get('CALENDAR_OUTBOX_LEASE_SECONDS', 300)
+        self.stats_interval = config.get('CALENDAR_STATS_LOG_INTERVAL', 300)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.get('CALENDAR_WORKER_THREADS', 4),
+            thread_name_prefix='calendar-outbox'
+        )
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim_batch(self):
+        """Marks up to batch_size due rows as in progress and returns their IDs.
+        Rows left in progress longer than the lease are claimed again.
+        """
+        now = datetime.utcnow()
+        query = CalendarOutbox.query.filter(
+            CalendarOutbox.status.in_(('pending', 'in_progress')),
+            CalendarOutbox.next_attempt_at <= now
+        ).order_by(CalendarOutbox.next_attempt_at).limit(self.batch_size)
+        if db.session.get_bind().dialect.name in ('mysql', 'postgresql'):
+            query = query.with_for_update(skip_locked=True)
+        entries = query.all()
+        for entry in entries:
+            entry.status = 'in_progress'
+            entry.next_attempt_at = now + timedelta(seconds=self.lease_seconds)
+        db.session.commit()
+        return [entry.id for entry in entries]
+
+    def process(self, entry_id):
+        """Sends one outbox row to Google and records the outcome."""
+        with self.app.app_context():
+            entry = db.session.get(CalendarOutbox, entry_id)
+            if entry is None or entry.status != 'in_progress':
+                return
+            user = credentials = None
+            try:
+                user = db.session.get(User, entry.user_id)
+                if user is None:
+                    raise ValueError('User no longer exists.')
+                credentials = user.google_credentials
+                entry.event_id = insert_google_event(user, entry.payload['event'])
+                entry.status = 'done'
+                entry.last_error = None
+            except Exception as e:
+                entry.attempts += 1
+                entry.last_error = str(e)
+                if entry.attempts >= self.max_attempts:
+                    entry.status = 'failed'
+                    logger.error(f"Calendar outbox entry {entry.id} failed permanently: {e}")
+                else:
+                    entry.status = 'pending'
+                    delay = backoff_delay(entry.attempts, self.backoff_base, self.backoff_max)
+                    entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    logger.warning(f"Calendar outbox entry {entry.id} failed, retrying in {delay:.0f}s: {e}")
+            refreshed = user is not None and user.google_credentials != credentials
+            user_id = entry.user_id
+            db.session.commit()
+            if refreshed:
+                # The client refreshed the token and the commit stored it on the user
+                user_cache.bump(user_id)
+                identity_cache.invalidate(user_id)
+
+    def run_once(self):
+        """Claims and processes one batch. Returns the number of rows processed."""
+        with self.app.app_context():
+            entry_ids = self.claim_batch()
+        list(self._executor.map(self.process, entry_ids))
+        return len(entry_ids)
+
+    def drain(self):
+        """Processes batches until no row is due. Returns the number of rows processed."""
+        total = 0
+        while True:
+            processed = self.run_once()
+            if not processed:
+                return total
+            total += processed
+
+    def run_forever(self):
+        last_report = time.monotonic()
+        while not self._stop.is_set():
+            if time.monotonic() - last_report >= self.stats_interval:
+                logger.info(f"Calendar service cache: {calendar_services.stats()}")
+                last_report = time.monotonic()
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                logger.error(f"Calendar outbox worker error: {e}")
+                processed = 0
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        """Runs the worker loop on a daemon thread."""
+        self._thread = threading.Thread(target=self.run_forever, name='calendar-outbox-poller', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+
+def ensure_worker(app):
+    """Starts the in-process worker for `app` on first use."""
+    with _workers_lock:
+        worker = _workers.get(app)
+        if worker is None:
+            worker = _workers[app] = CalendarOutboxWorker(app).start()
+    return worker
+
+
+def start_in_process_worker(app):
+    """Starts the in-process worker when CALENDAR_WORKER_IN_PROCESS is set. The
+    server entry points call it at startup, so rows still due from before a
+    restart are sent without waiting for the next enqueue. CLI commands do not.
+    """
+    if app.config.get('CALENDAR_WORKER_IN_PROCESS'):
+        return ensure_worker(app)
+    return None
+
+
+@calendar_cli.command('worker')
+@click.option('--threads', type=int, default=None, help='Concurrent Google API calls.')
+def worker_command(threads):
+    """Runs the outbox worker in the foreground until interrupted."""
+    worker = CalendarOutboxWorker(current_app._get_current_object(), max_workers=threads)
+    click.echo('Calendar outbox worker started.')
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+@calendar_cli.command('drain')
+def drain_command():
+    """Processes every due outbox row once and exits."""
+    worker = CalendarOutboxWorker(current_app._get_current_object())
+    processed = worker.drain()
+    worker.stop()
+    click.echo(f'Processed {processed} calendar operations.')
@@ -0,0 +1,100 @@
+"""Conditional GETs for per-user data.
+
+Every write path bumps the user's cache version after it commits
+(user_cache.bump), so the version changes whenever anything the user can read
+changes. Views decorated with @conditional() send it as a strong ETag, with
+Last-Modified taken from the same version, and answer a matching
+If-None-Match with 304 Not Modified before the view runs; If-Modified-Since
+is only used when the request has no If-None-Match. A client polling data it
+already has costs a version lookup in the cache backend and no database
+queries. Last-Modified has one-second resolution, so it is left out while the
+version's second is still running: a second write within it would not change
+the date.
+
+The version is read before the view runs, so a write that commits while the
+view is reading leaves the response with the older tag and the next poll gets
+a 200. Bodies read from the replica are sent without a tag, since the replica
+may not have applied the write that set the version. This needs versions
+shared by every process, so it only runs with the redis cache backend: with
+`lru` each process keeps its own version and one that did not see a write
+would keep answering 304. CONDITIONAL_GET_LRU allows `lru` where a single
+process serves the app.
+"""
+
+import time
+from datetime import date, datetime, timezone
+from functools import wraps
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+from app.cache import LRUBackend, user_cache
+from app.engines import request_user_id, using_replica
+
+
+def validators(user_id, daily=False):
+    """Returns (etag, last_modified) for the user's data as it is now, with
+    last_modified None while writes could still land in the version's second.
+    With `daily`, the response also depends on today's date and changes at midnight."""
+    version = user_cache.version(user_id)
+    etag = f'{user_id}-{version}'
+    seconds = version // 10**9
+    last_modified = datetime.fromtimestamp(seconds, timezone.utc) if seconds < int(time.time()) else None
+    if daily:
+        today = date.today()
+        etag += f'-{today:%Y%m%d}'
+        if last_modified is not None:
+            last_modified = max(last_modified, datetime.combine(today, datetime.min.time()).astimezone(timezone.utc))
+    return etag, last_modified
+
+
+def enabled():
+    config = current_app.config
+    if not config.get('CONDITIONAL_GET_ENABLED', True):
+        return False
+    if not (user_cache.shares_versions or (config.get('CONDITIONAL_GET_LRU') and isinstance(user_cache.backend, LRUBackend))):
+        return False
+    # Flashed messages are shown once and are not part of the tagged data
+    return request.blueprint != 'web' or not session.get('_flashes')
+
+
+def revalidate(user_id, daily=False):
+    """Returns (etag, last_modified, modified) for the current request by `user_id`;
+    `modified` is False when the client's copy is current and a 304 will do."""
+    etag, last_modified = validators(user_id, daily)
+    # If-None-Match takes precedence (RFC 9110, 13.2.2); the date is only compared without it
+    compare_date = last_modified if 'HTTP_IF_NONE_MATCH' not in request.environ else None
+    return etag, last_modified, is_resource_modified(request.environ, etag=f'"{etag}"', last_modified=compare_date)
+
+
+def add_validators(response, etag, last_modified):
+    """Sets ETag, Last-Modified and the caching headers on a 200 or 304 response.
+    A body read from the replica gets neither: it may predate the version."""
+    if response.status_code not in (200, 304):
+        return response
+    if response.status_code == 304 or not using_replica():
+        response.set_etag(etag)
+        response.last_modified = last_modified
+    # Per-user data: browsers may keep it but must revalidate, shared caches must not store it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Authorization' if request.blueprint != 'web' else 'Cookie')
+    return response
+
+
+def conditional(daily=False):
+    """Decorator for GET views whose response depends only on the user's data
+    (and, with `daily`, on today's date). Apply it below the auth decorators.
+    The ASGI app reads `conditional_daily` off the view to do the same."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return view(*args, **kwargs)
+            etag, last_modified, modified = revalidate(request_user_id(), daily)
+            if modified:
+                response = make_response(view(*args, **kwargs))
+            else:
+                response = current_app.response_class(status=304)
+            return add_validators(response, etag, last_modified)
+        wrapper.conditional_daily = daily
+        return wrapper
+    return decorator
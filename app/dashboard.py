@@ -0,0 +1,92 @@
+"""Aggregates the data shown on the user dashboard in a fixed number of queries."""
+
+from app import db
+from app.models import Habit, HabitCompletion, HabitStats
+from app.cache import user_cache
+from collections import namedtuple
+from flask import current_app
+from datetime import date, timedelta
+
+# Plain rows rather than ORM objects, so the dashboard data can be cached.
+DashboardHabit = namedtuple('DashboardHabit', 'id habit_name created_at current_streak longest_streak')
+RecentCompletion = namedtuple('RecentCompletion', 'habit_id habit_name date_completed')
+
+
+def get_completion_counts(user_id):
+    """Returns a {habit_id: completion_count} mapping for all of the user's habits,
+    read from the HabitStats rollup in a single query.
+    """
+    rows = db.session.query(
+        HabitStats.habit_id,
+        HabitStats.total_completions
+    ).filter(
+        HabitStats.user_id == user_id
+    ).all()
+    return {habit_id: count for habit_id, count in rows}
+
+
+def get_recent_completions(user_id, since):
+    """Returns (habit_id, habit_name, date_completed) rows completed on or after
+    `since`, newest first, without loading full ORM objects.
+    """
+    rows = db.session.query(
+        HabitCompletion.habit_id,
+        Habit.habit_name,
+        HabitCompletion.date_completed
+    ).join(
+        Habit, Habit.id == HabitCompletion.habit_id
+    ).filter(
+        HabitCompletion.user_id == user_id,
+        HabitCompletion.date_completed >= since
+    ).order_by(HabitCompletion.date_completed.desc())
+    return [RecentCompletion(*row) for row in rows]
+
+
+def get_dashboard_habits(user_id):
+    rows = db.session.query(
+        Habit.id,
+        Habit.habit_name,
+        Habit.created_at,
+        Habit.current_streak,
+        Habit.longest_streak
+    ).filter(
+        Habit.user_id == user_id
+    ).order_by(Habit.id)
+    return [DashboardHabit(*row) for row in rows]
+
+
+def completion_progress(completed, created_at, today):
+    """Percentage of the days since the account was created on which the habit was completed."""
+    total_days = (today - created_at.date()).days or 1
+    return min((completed / total_days) * 100, 100)
+
+
+def get_dashboard_data(user):
+    """Collects habits, per-habit completion counts, progress percentages and
+    recent completions for the dashboard. Runs three queries regardless of
+    how many habits the user has, or none when the user's cached copy is current;
+    concurrent requests that miss the cache share one build.
+    """
+    today = date.today()
+    return user_cache.get_or_set(
+        user.id, 'dashboard', lambda: _build_dashboard_data(user, today), today, coalesce=True
+    )
+
+
+def _build_dashboard_data(user, today):
+    habits = get_dashboard_habits(user.id)
+    completion_counts = get_completion_counts(user.id)
+
+    habit_progress = {
+        habit.id: completion_progress(completion_counts.get(habit.id, 0), user.created_at, today) for habit in habits
+    }
+
+    recent_days = current_app.config.get('DASHBOARD_RECENT_DAYS', 180)
+    completions = get_recent_completions(user.id, today - timedelta(days=recent_days))
+
+    return {
+        'habits': habits,
+        'completion_counts': completion_counts,
+        'habit_progress': habit_progress,
+        'completions': completions,
+    }
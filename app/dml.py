@@ -0,0 +1,48 @@
+"""Dialect-specific DML helpers for statements SQLAlchemy has no portable form of."""
+
+from sqlalchemy import insert, tuple_
+from app import db
+
+
+def insert_ignore(table, rows, key, chunk_size=1000):
+    """Inserts rows with multi-row INSERT statements, skipping rows that collide
+    with a unique constraint (INSERT IGNORE on MySQL, ON CONFLICT DO NOTHING elsewhere).
+    Returns the `key` column tuples of the rows actually inserted, so callers
+    act only on their own rows when a concurrent request inserted some first.
+    """
+    dialect = db.session.get_bind().dialect
+    key_columns = [table.c[name] for name in key]
+    inserted = set()
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        if dialect.insert_returning:
+            # SQLite, PostgreSQL and MariaDB return only the rows they inserted
+            stmt = _insert_ignore_stmt(table, dialect.name).values(chunk).returning(*key_columns)
+            inserted.update(tuple(row) for row in db.session.execute(stmt))
+            continue
+        result = db.session.execute(_insert_ignore_stmt(table, dialect.name).values(chunk))
+        chunk_keys = {tuple(row[name] for name in key) for row in chunk}
+        if result.rowcount == len(chunk):
+            inserted |= chunk_keys
+        else:
+            # Some rows were skipped. Under InnoDB's REPEATABLE READ this transaction
+            # sees its own rows but not those committed since its first read.
+            inserted |= chunk_keys & set(
+                tuple(row) for row in db.session.query(*key_columns).filter(tuple_(*key_columns).in_(chunk_keys))
+            )
+    return inserted
+
+
+def _insert_ignore_stmt(table, dialect):
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table).prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        stmt = postgresql_insert(table).on_conflict_do_nothing()
+    else:
+        stmt = insert(table)
+    return stmt
@@ -0,0 +1,237 @@
+"""Database engine profiles, read-replica routing and connection pool metrics.
+
+DB_ENGINE_PROFILE picks pool settings suited to how the app is deployed; the
+DB_POOL_* / DB_STATEMENT_TIMEOUT_MS settings override single values and an
+explicit SQLALCHEMY_ENGINE_OPTIONS overrides both. When a 'replica' bind is
+configured, views wrapped in @read_only run their queries against it, except
+for users who wrote within DB_REPLICA_READ_YOUR_WRITES_SECONDS. The async
+engines of the ASGI tier (app/asgi.py) use ASYNC_DB_ENGINE_PROFILE and the
+same overrides.
+"""
+
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Pool settings per deployment style. 'gunicorn' keeps pools small because
+# every worker process has its own; recycle stays below typical MySQL
+# wait_timeout values on managed servers so idle connections are never stale.
+PROFILES = {
+    'default': {
+        'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 3600,
+        'pool_pre_ping': True, 'statement_timeout_ms': None,
+    },
+    'gunicorn': {
+        'pool_size': 2, 'max_overflow': 3, 'pool_timeout': 10, 'pool_recycle': 280,
+        'pool_pre_ping': True, 'statement_timeout_ms': 10000,
+    },
+    'threaded': {
+        'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 280,
+        'pool_pre_ping': True, 'statement_timeout_ms': 10000,
+    },
+    'batch': {
+        'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 60, 'pool_recycle': 3600,
+        'pool_pre_ping': True, 'statement_timeout_ms': None,
+    },
+    # One event loop per process serves many requests at once, so its pool is
+    # the only one in the process and is sized for that concurrency.
+    'asgi': {
+        'pool_size': 20, 'max_overflow': 20, 'pool_timeout': 10, 'pool_recycle': 280,
+        'pool_pre_ping': True, 'statement_timeout_ms': 10000,
+    },
+}
+
+OVERRIDES = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+    'DB_POOL_PRE_PING': 'pool_pre_ping',
+    'DB_STATEMENT_TIMEOUT_MS': 'statement_timeout_ms',
+}
+
+# Checkout wait buckets in milliseconds; the last bucket is unbounded.
+WAIT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 30000)
+
+
+class PoolMetrics:
+    """Checkout wait histograms and timeout counts per pool, plus the pools'
+    current sizes when a snapshot is taken."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = {}
+        self._timeouts = {}
+        self._pools = {}
+
+    def observe(self, pool, wait_ms, timed_out=False):
+        from app.instrumentation import Histogram
+
+        name = pool.logging_name or 'default'
+        with self._lock:
+            self._pools[name] = pool
+            if name not in self._waits:
+                self._waits[name] = Histogram(WAIT_BUCKETS)
+                self._timeouts[name] = 0
+            self._waits[name].observe(wait_ms)
+            if timed_out:
+                self._timeouts[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'checkout_wait_ms': self._waits[name].snapshot(),
+                    'timeouts': self._timeouts[name],
+                    'size': pool.size(),
+                    'checked_out': pool.checkedout(),
+                    'overflow': pool.overflow(),
+                }
+                for name, pool in sorted(self._pools.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+            self._timeouts.clear()
+            self._pools.clear()
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedCheckout:
+    """Pool mixin that records how long each checkout took, including waiting
+    for a free connection, opening a new one and the pre-ping."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.observe(self, (time.perf_counter() - start) * 1000, timed_out=True)
+            raise
+        pool_metrics.observe(self, (time.perf_counter() - start) * 1000)
+        return connection
+
+
+class TimedQueuePool(TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(config, url, name, profile=None, poolclass=TimedQueuePool):
+    """Returns create_engine() options for `url` from the configured profile and overrides."""
+    if make_url(url).get_backend_name() == 'sqlite':
+        # SQLite pools are chosen by SQLAlchemy / Flask-SQLAlchemy and take none of these options
+        return {}
+    profile = profile or config.get('DB_ENGINE_PROFILE') or 'default'
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown engine profile {profile!r}; expected one of {', '.join(PROFILES)}")
+    settings = dict(PROFILES[profile])
+    for key, option in OVERRIDES.items():
+        if config.get(key) is not None:
+            settings[option] = config[key]
+
+    timeout_ms = settings.pop('statement_timeout_ms')
+    options = dict(settings, poolclass=poolclass, pool_logging_name=name)
+    if timeout_ms and make_url(url).get_backend_name() == 'mysql':
+        # pymysql, mysqlclient and aiomysql all run init_command on every new connection
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={int(timeout_ms)}'}
+    return options
+
+
+def configure_engines(app):
+    """Fills in SQLALCHEMY_ENGINE_OPTIONS and the replica bind options; call before db.init_app."""
+    config = app.config
+    explicit = config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+        engine_options(config, config['SQLALCHEMY_DATABASE_URI'], 'primary'), **explicit
+    )
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    replica = binds.get('replica')
+    if replica is not None:
+        replica = {'url': replica} if isinstance(replica, str) else dict(replica)
+        binds['replica'] = dict(engine_options(config, replica['url'], 'replica'), **explicit)
+        binds['replica'].update(pool_logging_name='replica', **replica)
+    config['SQLALCHEMY_BINDS'] = binds
+
+
+class RoutingSession(Session):
+    """Session that sends the statements of @read_only views to the replica
+    bind. Flushes, and every model with its own bind key, keep their engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('db_use_replica'):
+            engine = self._db.engines.get('replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def request_user_id():
+    """The id of the user the request is authenticated as, by JWT or session, or None."""
+    from flask_jwt_extended import get_jwt_identity
+    from flask_login import current_user
+
+    try:
+        user_id = get_jwt_identity()
+    except RuntimeError:
+        user_id = None
+    if user_id is None and current_user and current_user.is_authenticated:
+        user_id = current_user.id
+    return user_id
+
+
+def using_replica():
+    """True when the current request's reads go to the replica, which may not
+    have applied the user's latest write yet."""
+    return has_app_context() and bool(g.get('db_use_replica'))
+
+
+def end_read_transaction():
+    """Rolls back the session's open transaction, if any, so the next query
+    starts a new one. Under REPEATABLE READ (MySQL's default) a transaction
+    reads the snapshot taken by its first query, which may predate writes seen
+    since. Only call on read paths: uncommitted changes are discarded.
+    """
+    from app import db
+
+    if has_app_context():
+        session = db.session()
+        if session.in_transaction():
+            session.rollback()
+
+
+def read_only(view):
+    """Runs the view's queries on the replica when one is configured. Apply it
+    below the auth decorators so the user is known; users whose last write is
+    more recent than DB_REPLICA_READ_YOUR_WRITES_SECONDS stay on the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if 'replica' in current_app.extensions['sqlalchemy'].engines:
+            g.db_use_replica = not wrote_recently(request_user_id())
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def wrote_recently(user_id):
+    from app.cache import user_cache
+
+    if user_id is None:
+        return False
+    if not user_cache.tracks_writes:
+        # Without stored versions a recent write cannot be ruled out
+        return True
+    written_ns = user_cache.last_write_ns(user_id)
+    window = current_app.config.get('DB_REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+    return written_ns is not None and time.time_ns() - written_ns < window * 1e9
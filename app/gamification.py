@@ -1,31 +1,88 @@
-"""Contains utility functions for awarding badges based on user habit completions."""
+"""Contains the rule-driven engine that awards badges based on user habit progress."""
 
-from app.models import Badge, UserBadge, Habit, HabitCompletion
+from app.models import Badge, UserBadge, HabitStats
 from app import db
-from datetime import datetime
+from app.cache import user_cache
+from app.dml import insert_ignore
+from app.leaderboard import badges_changed
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import func
+import time
 
-def check_and_award_badges(user_id, habit):
-    """Checks if a user qualifies for specific badges based on habit completions
-    and awards them if criteria are met
+BadgeInfo = namedtuple('BadgeInfo', 'id name description icon')
+StatsSnapshot = namedtuple('StatsSnapshot', 'habit_count total_completions max_habit_completions max_current_streak')
+
+# Badge name -> predicate over a StatsSnapshot. Rules only read the snapshot,
+# so adding one never adds a query to the completion path.
+BADGE_RULES = {
+    'Beginner': lambda snapshot: snapshot.max_habit_completions >= 5,
+    'Consistency': lambda snapshot: snapshot.max_current_streak >= 7,
+    'Pro': lambda snapshot: snapshot.max_habit_completions >= 30,
+}
+
+_catalog = {'badges': None, 'loaded_at': 0.0}
+
+
+def get_badge_catalog():
+    """Returns {badge_name: BadgeInfo}, cached in-process for BADGE_CATALOG_TTL seconds."""
+    ttl = current_app.config.get('BADGE_CATALOG_TTL', 300)
+    if _catalog['badges'] is None or time.monotonic() - _catalog['loaded_at'] > ttl:
+        badges = db.session.query(Badge.id, Badge.name, Badge.description, Badge.icon).all()
+        _catalog['badges'] = {badge.name: BadgeInfo(*badge) for badge in badges}
+        _catalog['loaded_at'] = time.monotonic()
+    return _catalog['badges']
+
+
+def invalidate_badge_catalog():
+    """Drops the cached catalog, e.g. after badges are added or renamed."""
+    _catalog['badges'] = None
+
+
+def get_earned_badge_ids(user_id):
+    return {row[0] for row in db.session.query(UserBadge.badge_id).filter(UserBadge.user_id == user_id)}
+
+
+def get_stats_snapshot(user_id):
+    """Aggregates the user's HabitStats rows into a single snapshot with one query."""
+    row = db.session.query(
+        func.count(HabitStats.habit_id),
+        func.coalesce(func.sum(HabitStats.total_completions), 0),
+        func.coalesce(func.max(HabitStats.total_completions), 0),
+        func.coalesce(func.max(HabitStats.current_streak), 0)
+    ).filter(HabitStats.user_id == user_id).one()
+    return StatsSnapshot(*row)
+
+
+def evaluate_badges(user_id, commit=True):
+    """Evaluates every badge rule against one stats snapshot and awards all
+    newly earned badges together. Returns the awarded BadgeInfo list.
     """
-    beginner_badge = Badge.query.filter_by(name='Beginner').first()
-    consistency_badge = Badge.query.filter_by(name='Consistency').first()
-    pro_badge = Badge.query.filter_by(name='Pro').first()
-    
-    if beginner_badge and not UserBadge.query.filter_by(user_id=user_id, badge_id=beginner_badge.id).first():
-        completions_count = HabitCompletion.query.filter_by(habit_id=habit.id, user_id=user_id).count()
-        if completions_count >= 5:
-            user_badge = UserBadge(user_id=user_id, badge_id=beginner_badge.id)
-            db.session.add(user_badge)
-            db.session.commit()
-    
-    if consistency_badge and not UserBadge.query.filter_by(user_id=user_id, badge_id=consistency_badge.id).first():
-        if habit.current_streak >= 7:
-            user_badge = UserBadge(user_id=user_id, badge_id=consistency_badge.id)
-            db.session.add(user_badge)
+    catalog = get_badge_catalog()
+    earned = get_earned_badge_ids(user_id)
+    pending = [catalog[name] for name in BADGE_RULES if name in catalog and catalog[name].id not in earned]
+    if not pending:
+        return []
+
+    snapshot = get_stats_snapshot(user_id)
+    awarded = [badge for badge in pending if BADGE_RULES[badge.name](snapshot)]
+    if awarded:
+        # A concurrent request may award the same badge first; skip it instead of
+        # failing the transaction (and the completion it belongs to) on _user_badge_uc
+        inserted = insert_ignore(UserBadge.__table__, [
+            {'user_id': user_id, 'badge_id': badge.id} for badge in awarded
+        ], key=('user_id', 'badge_id'))
+        awarded = [badge for badge in awarded if (user_id, badge.id) in inserted]
+        if awarded:
+            badges_changed(db.session, user_id)
+        if commit and awarded:
             db.session.commit()
-    
-    if pro_badge and not UserBadge.query.filter_by(user_id=user_id, badge_id=pro_badge.id).first():
-        completions_count = HabitCompletion.query.filter_by(habit_id=habit.id, user_id=user_id).count()
-        if completions_count >= 30:
-            user_badge = UserBadge(user_id=user_id, badge_id=pro_badge.id)
+            user_cache.bump(user_id)
+    return awarded
+
+
+def check_and_award_badges(user_id, habit=None):
+    """Checks if a user qualifies for badges and awards them if criteria are met.
+    Kept for existing callers; `habit` is no longer needed.
+    """
+    return evaluate_badges(user_id)
@@ -0,0 +1,78 @@
+"""Google OAuth and Calendar integration, loaded on first use.
+
+Neither the Google client libraries nor the OAuth client file are touched
+until a request actually needs them (the OAuth flow, stored credentials or a
+Calendar call), so app startup, CLI commands and workers that never talk to
+Google do not pay for them, and a missing credentials.json only breaks the
+Google features.
+"""
+
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/calendar',
+    'https://www.googleapis.com/auth/calendar.events'
+]
+
+
+class GoogleNotConfigured(RuntimeError):
+    """Raised when a Google feature is used without OAuth client credentials."""
+
+
+class GoogleIntegration:
+    """Lazily loads the OAuth client config and the Google libraries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client_config = None
+        self._credentials_file = 'credentials.json'
+
+    def configure(self, app):
+        self._credentials_file = app.config.get('GOOGLE_CREDENTIALS_FILE') or self._credentials_file
+        self._client_config = app.config.get('GOOGLE_CREDENTIALS')
+
+    @property
+    def client_config(self):
+        """The 'web' section of the OAuth client file, read on first access."""
+        if self._client_config is None:
+            with self._lock:
+                if self._client_config is None:
+                    try:
+                        with open(self._credentials_file) as f:
+                            self._client_config = json.load(f)['web']
+                    except (OSError, ValueError, KeyError) as e:
+                        raise GoogleNotConfigured(
+                            f"Google OAuth client credentials could not be loaded from {self._credentials_file}: {e}"
+                        ) from e
+                    logger.info(f"Loaded Google OAuth client config from {self._credentials_file}")
+        return self._client_config
+
+    def flow(self, redirect_uri):
+        from google_auth_oauthlib.flow import Flow
+
+        flow = Flow.from_client_config({'web': self.client_config}, scopes=SCOPES)
+        flow.redirect_uri = redirect_uri
+        return flow
+
+    def credentials_from_json(self, raw):
+        from google.oauth2.credentials import Credentials
+
+        return Credentials.from_authorized_user_info(json.loads(raw))
+
+    def refresh(self, creds):
+        from google.auth.transport.requests import Request
+
+        creds.refresh(Request())
+
+    def build_calendar(self, creds, api_endpoint=None):
+        from googleapiclient.discovery import build
+
+        client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+        return build('calendar', 'v3', credentials=creds, client_options=client_options, cache_discovery=False)
+
+
+google_integration = GoogleIntegration()
@@ -0,0 +1,164 @@
+"""Short-lived, size-bounded cache of user identities for the Flask-Login
+user loader and the JWT user lookup, so authenticating a request does not
+query the user table every time.
+
+Requests get a UserSnapshot, an immutable copy of the identity columns, rather
+than a User instance bound to another request's session. Views that change the
+user load the row themselves and call identity_cache.invalidate(); other
+processes see the change once their entry is IDENTITY_CACHE_TTL seconds old.
+
+Code on an event loop authenticates inside cached_only(), so a miss is not
+loaded with a blocking query, and loads the snapshot with aload() instead.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask_login import UserMixin
+from sqlalchemy import select
+from app import db
+from app.models import User
+
+SNAPSHOT_COLUMNS = (User.id, User.username, User.email, User.created_at, User.google_credentials)
+
+
+class UserSnapshot(UserMixin, namedtuple('UserSnapshot', 'id username email created_at google_credentials')):
+    """The identity columns of a User; what current_user is on web requests."""
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(*(getattr(user, column.key) for column in SNAPSHOT_COLUMNS))
+
+
+# {user_id: snapshot} inside cached_only(), None otherwise
+_cached_only = ContextVar('identity_cached_only', default=None)
+
+
+def snapshot_select(user_id):
+    return select(*SNAPSHOT_COLUMNS).where(User.id == user_id)
+
+
+def load_snapshot(user_id):
+    row = db.session.execute(snapshot_select(user_id)).first()
+    return UserSnapshot(*row) if row is not None else None
+
+
+class IdentityCache:
+    """Bounded LRU of UserSnapshots keyed by user id, each used for at most
+    `ttl` seconds after it was loaded. A ttl of 0 disables caching."""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a load that raced with one is not stored
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def configure(self, app):
+        self.max_size = app.config.get('IDENTITY_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def get(self, user_id):
+        """Returns the user's snapshot, loading it with one query on a miss, or None if there is no such user.
+        Inside cached_only() a miss returns None without querying."""
+        user_id = int(user_id)
+        preloaded = _cached_only.get()
+        if preloaded is not None and user_id in preloaded:
+            return preloaded[user_id]
+        if not self.ttl:
+            return load_snapshot(user_id) if preloaded is None else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        if preloaded is not None:
+            return None
+        snapshot = load_snapshot(user_id)
+        if snapshot is not None:
+            self._store(snapshot, now, generation)
+        return snapshot
+
+    @contextmanager
+    def cached_only(self, preloaded=None):
+        """Within the block, get() returns the snapshots in `preloaded` ({user_id:
+        snapshot}) or cached ones and never queries the database."""
+        token = _cached_only.set(preloaded or {})
+        try:
+            yield
+        finally:
+            _cached_only.reset(token)
+
+    async def aload(self, user_id, session):
+        """Loads the user's snapshot through an AsyncSession and caches it; the
+        event-loop counterpart of a miss in get()."""
+        user_id = int(user_id)
+        with self._lock:
+            generation = self._generation
+        now = time.monotonic()
+        row = (await session.execute(snapshot_select(user_id))).first()
+        snapshot = UserSnapshot(*row) if row is not None else None
+        if snapshot is not None and self.ttl:
+            self._store(snapshot, now, generation)
+        return snapshot
+
+    def put(self, user):
+        """Caches a snapshot of `user`, a User just read from the database (e.g. at login)."""
+        if self.ttl:
+            with self._lock:
+                generation = self._generation
+            self._store(UserSnapshot.from_user(user), time.monotonic(), generation)
+
+    def _store(self, snapshot, now, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[snapshot.id] = (snapshot, now + self.ttl)
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        """Drops the user's snapshot; call after committing a change to the user."""
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+            self._generation += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+identity_cache = IdentityCache()
+
+
+def remember_login(sender, user, **extra):
+    """user_logged_in receiver: the User was just read to check the password, so keep it."""
+    identity_cache.put(user)
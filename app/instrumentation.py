@@ -0,0 +1,199 @@
+"""Opt-in per-request instrumentation: query count, DB time, serialization time
+and wall time per endpoint, aggregated into in-memory histograms and exposed
+on /metrics. Optionally writes cProfile dumps for slow requests."""
+
+import cProfile
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import Blueprint, current_app, g, jsonify, request, has_app_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded.
+MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# Extra sections for /metrics, e.g. cache statistics: name -> zero-argument callable.
+metric_sources = {}
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the q-quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0.0,
+            'max': round(self.max, 3),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': [[bound, count] for bound, count in zip(list(self.bounds) + ['+Inf'], self.buckets)],
+        }
+
+
+class RequestMetrics:
+    """Thread-safe per-endpoint histograms of the request measurements."""
+
+    FIELDS = (('wall_ms', MS_BUCKETS), ('db_ms', MS_BUCKETS), ('serialization_ms', MS_BUCKETS), ('queries', COUNT_BUCKETS))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, values):
+        with self._lock:
+            histograms = self._endpoints.get(endpoint)
+            if histograms is None:
+                histograms = self._endpoints[endpoint] = {name: Histogram(bounds) for name, bounds in self.FIELDS}
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                endpoint: {name: histogram.snapshot() for name, histogram in histograms.items()}
+                for endpoint, histograms in sorted(self._endpoints.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+request_metrics = RequestMetrics()
+
+
+def _current():
+    return g.get('_instrumentation') if has_app_context() else None
+
+
+@contextmanager
+def track_serialization():
+    """Adds the time spent in the block to the request's serialization time."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current = _current()
+        if current is not None:
+            current['serialization_ms'] += (time.perf_counter() - start) * 1000
+
+
+class InstrumentedJSONProvider(DefaultJSONProvider):
+    """JSON provider that counts encoding time as serialization time."""
+
+    def dumps(self, obj, **kwargs):
+        with track_serialization():
+            return super().dumps(obj, **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's execution context, which is discarded with the
+    # statement, so one that raises leaves nothing behind on the connection
+    if context is not None and _current() is not None:
+        context._instrumentation_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = _current()
+    start = getattr(context, '_instrumentation_start', None)
+    if current is not None and start is not None:
+        current['queries'] += 1
+        current['db_ms'] += (time.perf_counter() - start) * 1000
+
+
+def _start_request():
+    g._instrumentation = {'start': time.perf_counter(), 'queries': 0, 'db_ms': 0.0, 'serialization_ms': 0.0}
+    if current_app.config.get('INSTRUMENTATION_PROFILE_DIR'):
+        g._instrumentation_profiler = cProfile.Profile()
+        g._instrumentation_profiler.enable()
+
+
+def _finish_request(response):
+    current = g.pop('_instrumentation', None)
+    if current is None:
+        return response
+    wall_ms = (time.perf_counter() - current.pop('start')) * 1000
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.record(endpoint, dict(current, wall_ms=wall_ms))
+
+    profiler = g.pop('_instrumentation_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        if wall_ms >= current_app.config.get('INSTRUMENTATION_PROFILE_THRESHOLD_MS', 500):
+            _dump_profile(profiler, endpoint, wall_ms)
+    return response
+
+
+def _dump_profile(profiler, endpoint, wall_ms):
+    directory = current_app.config['INSTRUMENTATION_PROFILE_DIR']
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{endpoint}-{int(time.time() * 1000)}-{int(wall_ms)}ms.prof')
+        profiler.dump_stats(path)
+        logger.info(f"Slow request profile written to {path}")
+    except OSError as e:
+        logger.error(f"Could not write request profile: {e}")
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Returns the per-endpoint request histograms and registered metric sources.
+    Requires INSTRUMENTATION_METRICS_TOKEN; without one it is only served in debug mode.
+    """
+    token = current_app.config.get('INSTRUMENTATION_METRICS_TOKEN')
+    if not token and not current_app.debug:
+        return jsonify({'message': 'Resource not found.'}), 404
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'message': 'Unauthorized.'}), 401
+    data = {'endpoints': request_metrics.snapshot()}
+    for name, source in metric_sources.items():
+        data[name] = source()
+    return jsonify(data), 200
+
+
+def init_instrumentation(app):
+    """Hooks request timing, SQL counting and the /metrics endpoint into `app`."""
+    app.json_provider_class = InstrumentedJSONProvider
+    app.json = InstrumentedJSONProvider(app)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.register_blueprint(metrics_bp)
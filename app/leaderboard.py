@@ -0,0 +1,556 @@
+"""Cross-user leaderboards served from ranking indexes.
+
+Each metric keeps a ranking of user scores, built from HabitStats and
+UserBadge on first use (never from HabitCompletion) and then updated on every
+commit that touches those tables, with the user's scores recomputed from the
+committed rows. With CACHE_BACKEND=redis the rankings are Redis sorted sets
+that every process reads and updates. Otherwise each process keeps its own
+RankIndex per metric. Those only see the commits of their own process, so
+they are rebuilt every LEADERBOARD_REBUILD_INTERVAL seconds and are only
+exact with a single process.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models import HabitStats, UserBadge
+from app.stats import month_key, shift_bitmap
+
+logger = logging.getLogger(__name__)
+
+METRICS = {
+    'streak': 'Longest current streak',
+    'week': 'Completions this week',
+    'month': 'Completions this month',
+    'badges': 'Badges earned',
+}
+
+
+class RankIndex:
+    """Scores kept sorted by (-score, member) in bounded buckets, so updates move
+    at most one bucket and rank lookups are two binary searches plus a sum over
+    bucket sizes. Members with a score of zero are not stored.
+    """
+
+    LOAD = 1000
+
+    def __init__(self):
+        self._buckets = []
+        self._maxes = []
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    def score(self, member):
+        return self._scores.get(member, 0)
+
+    def update(self, member, score):
+        old = self._scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._remove((-old, member))
+            del self._scores[member]
+        if score:
+            self._insert((-score, member))
+            self._scores[member] = score
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            return
+        index = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        insort(bucket, key)
+        self._maxes[index] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self._buckets[index:index + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[index:index + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+
+    def _remove(self, key):
+        index = bisect_left(self._maxes, key)
+        bucket = self._buckets[index]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[index] = bucket[-1]
+        else:
+            del self._buckets[index]
+            del self._maxes[index]
+
+    def _position(self, key):
+        """Number of stored keys that sort before `key`."""
+        index = bisect_left(self._maxes, key)
+        before = sum(len(bucket) for bucket in self._buckets[:index])
+        if index < len(self._buckets):
+            before += bisect_left(self._buckets[index], key)
+        return before
+
+    def rank(self, member):
+        """Returns (rank, score); members tied on score share a rank."""
+        score = self._scores.get(member, 0)
+        return self._position((-score,)) + 1, score
+
+    def top(self, limit, offset=0):
+        """Returns [(rank, member, score)] for positions offset .. offset + limit - 1."""
+        entries = []
+        skipped = 0
+        for bucket in self._buckets:
+            if skipped + len(bucket) <= offset:
+                skipped += len(bucket)
+                continue
+            for key in bucket[max(offset - skipped, 0):]:
+                entries.append((-key[0], key[1]))
+                if len(entries) == limit:
+                    break
+            skipped += len(bucket)
+            if len(entries) == limit:
+                break
+        ranks = {}
+        return [(ranks.setdefault(score, self._position((-score,)) + 1), member, score) for score, member in entries]
+
+    @classmethod
+    def from_scores(cls, scores):
+        """Builds an index from a {member: score} mapping in one sort."""
+        index = cls()
+        keys = sorted((-score, member) for member, score in scores.items() if score)
+        index._buckets = [keys[i:i + cls.LOAD] for i in range(0, len(keys), cls.LOAD)]
+        index._maxes = [bucket[-1] for bucket in index._buckets]
+        index._scores = {member: -negative for negative, member in keys}
+        return index
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def week_completions(recent_bitmap, bitmap_date, today):
+    """Counts the completions since Monday from a habit's recent-completions bitmap."""
+    bitmap = shift_bitmap(recent_bitmap or 0, bitmap_date, today)
+    return bin(bitmap & ((1 << (today.weekday() + 1)) - 1)).count('1')
+
+
+class RedisLeaderboards:
+    """The leaderboards as Redis sorted sets, shared by every process on the same
+    server: web workers, CLI jobs and the calendar worker update the same scores.
+    Updates set each user's score from the committed rows (ZADD) rather than
+    adding to it, so applying one twice is harmless. A score that drops to zero
+    is kept as 0 and not listed or counted. Week and month scores go to a set
+    per period, so they start empty when the period changes.
+    """
+
+    BUILD_LOCK_SECONDS = 300
+    PERIOD_TTL = 40 * 86400
+
+    # Zeroes the streaks whose last counting day (ordinal in KEYS[2]) is before ARGV[1]
+    EXPIRE_STREAKS = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. ARGV[1])
+    for _, member in ipairs(expired) do
+        redis.call('ZADD', KEYS[1], 0, member)
+        redis.call('ZREM', KEYS[2], member)
+    end
+    return #expired
+    """
+
+    # Swaps freshly built sets in for the live ones; KEYS holds (built, live,
+    # touched) for each set. Users updated in a set while the build read the
+    # database are in its touched set and keep their live score, which is newer.
+    FINISH_BUILD = """
+    for i = 1, #KEYS - 1, 3 do
+        local built, live = KEYS[i], KEYS[i + 1]
+        for _, member in ipairs(redis.call('SMEMBERS', KEYS[i + 2])) do
+            local score = redis.call('ZSCORE', live, member)
+            if score then
+                redis.call('ZADD', built, score, member)
+            else
+                redis.call('ZREM', built, member)
+            end
+        end
+        if redis.call('EXISTS', built) == 1 then
+            redis.call('RENAME', built, live)
+        else
+            redis.call('DEL', live)
+        end
+    end
+    redis.call('SET', KEYS[#KEYS], 1)
+    """
+
+    def __init__(self, url, prefix='ht'):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self.prefix = f'{prefix}:lb'
+        self._expire_streaks = self._client.register_script(self.EXPIRE_STREAKS)
+        self._finish_build = self._client.register_script(self.FINISH_BUILD)
+        self._built = False
+        self._rolled_on = None
+
+    def _key(self, metric, today):
+        if metric == 'week':
+            return f'{self.prefix}:week:{week_start(today).isoformat()}'
+        if metric == 'month':
+            return f'{self.prefix}:month:{month_key(today)}'
+        return f'{self.prefix}:{metric}'
+
+    def _sets(self, today, scores, badge_counts):
+        """{key: {user_id: score}} for every set, from LeaderboardService.read_scores()."""
+        return {
+            self._key('streak', today): {user_id: value[0] for user_id, value in scores.items()},
+            self._key('streak_until', today): {user_id: value[1].toordinal() for user_id, value in scores.items() if value[0]},
+            self._key('week', today): {user_id: value[2] for user_id, value in scores.items()},
+            self._key('month', today): {user_id: value[3] for user_id, value in scores.items()},
+            self._key('badges', today): badge_counts,
+        }
+
+    def ensure_loaded(self, read_scores):
+        """Builds the sets from `read_scores()` once per Redis server. One process
+        builds while the others wait for it."""
+        if self._built:
+            return
+        built_key, lock_key = f'{self.prefix}:built', f'{self.prefix}:building'
+        if not self._client.exists(built_key):
+            if self._client.set(lock_key, 1, nx=True, ex=self.BUILD_LOCK_SECONDS):
+                try:
+                    self.load(read_scores, built_key)
+                finally:
+                    self._client.delete(lock_key)
+            else:
+                deadline = time.monotonic() + self.BUILD_LOCK_SECONDS
+                while (time.monotonic() < deadline and self._client.exists(lock_key)
+                       and not self._client.exists(built_key)):
+                    time.sleep(0.1)
+        self._built = bool(self._client.exists(built_key))
+
+    def load(self, read_scores, built_key):
+        today = date.today()
+        live_keys = list(self._sets(today, {}, {}))
+        # Users updated from here on keep their live scores
+        self._client.delete(*[f'{key}:touched' for key in live_keys])
+        today, scores, badge_counts = read_scores()
+        keys = []
+        pipe = self._client.pipeline(transaction=False)
+        for key, members in self._sets(today, scores, badge_counts).items():
+            members = {user_id: score for user_id, score in members.items() if score}
+            pipe.delete(f'{key}:build')
+            if members:
+                pipe.zadd(f'{key}:build', members)
+            keys += [f'{key}:build', key, f'{key}:touched']
+        pipe.execute()
+        self._finish_build(keys=keys + [built_key])
+        for metric in ('week', 'month'):
+            self._client.expire(self._key(metric, today), self.PERIOD_TTL)
+
+    def _roll(self, today):
+        """Zeroes streaks that ended before today, once a day per process."""
+        if self._rolled_on != today:
+            self._expire_streaks(keys=[self._key('streak', today), self._key('streak_until', today)],
+                                 args=[today.toordinal()])
+            self._rolled_on = today
+
+    def top(self, metric, limit, offset, today):
+        self._roll(today)
+        key = self._key(metric, today)
+        rows = self._client.zrevrangebyscore(key, '+inf', '(0', start=offset, num=limit, withscores=True)
+        scores = sorted({score for _, score in rows}, reverse=True)
+        pipe = self._client.pipeline(transaction=False)
+        for score in scores:
+            pipe.zcount(key, f'({score}', '+inf')
+        ranks = dict(zip(scores, pipe.execute()))
+        return [(ranks[score] + 1, int(member), int(score)) for member, score in rows]
+
+    def rank(self, metric, user_id, today):
+        self._roll(today)
+        key = self._key(metric, today)
+        score, size = self._client.pipeline(transaction=False).zscore(key, user_id).zcount(key, '(0', '+inf').execute()
+        score = int(score or 0)
+        return self._client.zcount(key, f'({score}', '+inf') + 1, score, size
+
+    def apply(self, today, updates):
+        keys = {metric: self._key(metric, today) for metric in ('streak', 'streak_until', 'week', 'month', 'badges')}
+        current = date.today()
+        touched = {}
+        pipe = self._client.pipeline(transaction=False)
+
+        def zadd(metric, user_id, score):
+            pipe.zadd(keys[metric], {user_id: score})
+            touched.setdefault(metric, set()).add(user_id)
+
+        for user_id, values in updates.items():
+            if 'stats' in values:
+                streak, until, week, month = values['stats']
+                if streak and until >= current:
+                    zadd('streak', user_id, streak)
+                    zadd('streak_until', user_id, until.toordinal())
+                else:
+                    zadd('streak', user_id, 0)
+                    pipe.zrem(keys['streak_until'], user_id)
+                    touched.setdefault('streak_until', set()).add(user_id)
+                zadd('week', user_id, week)
+                zadd('month', user_id, month)
+            if 'badges' in values:
+                zadd('badges', user_id, values['badges'])
+        # Read by a build that is running now; see FINISH_BUILD
+        for metric, user_ids in touched.items():
+            pipe.sadd(f'{keys[metric]}:touched', *user_ids)
+            pipe.expire(f'{keys[metric]}:touched', self.BUILD_LOCK_SECONDS)
+        pipe.expire(keys['week'], self.PERIOD_TTL)
+        pipe.expire(keys['month'], self.PERIOD_TTL)
+        pipe.execute()
+
+
+class LeaderboardService:
+    """Holds one RankIndex per metric plus each user's streak expiry, and rolls
+    the periodic metrics over when the day, week or month changes. With
+    CACHE_BACKEND=redis the scores live in RedisLeaderboards instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._indexes = None
+        self._streak_expiry = {}
+        self._today = None
+        self._built_at = 0.0
+        self.rebuild_interval = 300
+        self.shared = None
+
+    def configure(self, app):
+        config = app.config
+        self.rebuild_interval = config.get('LEADERBOARD_REBUILD_INTERVAL', 300)
+        if config.get('CACHE_BACKEND') == 'redis':
+            self.shared = RedisLeaderboards(config['CACHE_REDIS_URL'], config.get('CACHE_KEY_PREFIX', 'ht'))
+        else:
+            self.shared = None
+
+    @property
+    def loaded(self):
+        """True when commits should update the scores."""
+        return self.shared is not None or self._indexes is not None
+
+    @property
+    def ready(self):
+        """True when reads are served from memory without touching the database or Redis."""
+        return self.shared is None and self._indexes is not None and not self._stale()
+
+    def _stale(self):
+        return bool(self.rebuild_interval) and time.monotonic() - self._built_at > self.rebuild_interval
+
+    def _stats_scores(self, rows, today):
+        """Aggregates HabitStats rows into {user_id: (streak, streak_until, week, month)}."""
+        scores = {}
+        month = month_key(today)
+        monday = week_start(today)
+        for user_id, streak, last_completed, recent_bitmap, bitmap_date, monthly_counts in rows:
+            best, until, week, month_count = scores.get(user_id, (0, None, 0, 0))
+            # A streak still counts today if the habit was completed today or yesterday
+            if last_completed and last_completed >= today - timedelta(days=1) and streak > best:
+                best, until = streak, last_completed + timedelta(days=1)
+            if last_completed and last_completed >= monday:
+                week += week_completions(recent_bitmap, bitmap_date, today)
+            month_count += (monthly_counts or {}).get(month, 0)
+            scores[user_id] = (best, until, week, month_count)
+        return scores
+
+    @staticmethod
+    def _stats_query():
+        return select(
+            HabitStats.user_id, HabitStats.current_streak, HabitStats.last_completed,
+            HabitStats.recent_bitmap, HabitStats.bitmap_date, HabitStats.monthly_counts
+        )
+
+    def read_scores(self):
+        """Reads every user's scores: (today, {user_id: (streak, streak_until, week, month)}, {user_id: badges})."""
+        today = date.today()
+        since = min(today - timedelta(days=1), week_start(today), today.replace(day=1))
+        rows = db.session.execute(
+            self._stats_query().where(HabitStats.last_completed >= since).execution_options(yield_per=10000)
+        )
+        scores = self._stats_scores(rows, today)
+        badge_counts = dict(db.session.execute(
+            select(UserBadge.user_id, func.count(UserBadge.id)).group_by(UserBadge.user_id)
+        ).all())
+        return today, scores, badge_counts
+
+    def rebuild(self):
+        """Rebuilds every in-process index from HabitStats and UserBadge."""
+        today, scores, badge_counts = self.read_scores()
+        indexes = {
+            'streak': RankIndex.from_scores({user_id: value[0] for user_id, value in scores.items()}),
+            'week': RankIndex.from_scores({user_id: value[2] for user_id, value in scores.items()}),
+            'month': RankIndex.from_scores({user_id: value[3] for user_id, value in scores.items()}),
+            'badges': RankIndex.from_scores(badge_counts),
+        }
+        expiry = {user_id: value[1] for user_id, value in scores.items() if value[0]}
+        with self._lock:
+            self._indexes, self._streak_expiry, self._today = indexes, expiry, today
+            self._built_at = time.monotonic()
+        logger.info(f"Leaderboards rebuilt: {len(scores)} active users, {len(badge_counts)} with badges")
+
+    def _roll(self, today):
+        """Drops expired streaks and resets period metrics when the date moves on."""
+        if today == self._today:
+            return
+        if week_start(today) != week_start(self._today):
+            self._indexes['week'] = RankIndex()
+        if today.month != self._today.month or today.year != self._today.year:
+            self._indexes['month'] = RankIndex()
+        streaks = self._indexes['streak']
+        for user_id, until in list(self._streak_expiry.items()):
+            if until < today:
+                streaks.update(user_id, 0)
+                del self._streak_expiry[user_id]
+        self._today = today
+
+    def ensure_loaded(self):
+        """Builds the indexes on first use. In-process indexes are rebuilt every
+        LEADERBOARD_REBUILD_INTERVAL seconds to pick up changes that other
+        processes made; readers keep using the old ones meanwhile."""
+        if self.shared is not None:
+            self.shared.ensure_loaded(self.read_scores)
+        elif self._indexes is None:
+            with self._lock:
+                if self._indexes is None:
+                    self.rebuild()
+        elif self._stale() and self._refresh_lock.acquire(blocking=False):
+            try:
+                if self._stale():
+                    self.rebuild()
+            finally:
+                self._refresh_lock.release()
+
+    def top(self, metric, limit=10, offset=0):
+        self.ensure_loaded()
+        if self.shared is not None:
+            return self.shared.top(metric, limit, offset, date.today())
+        with self._lock:
+            self._roll(date.today())
+            return self._indexes[metric].top(limit, offset)
+
+    def rank(self, metric, user_id):
+        self.ensure_loaded()
+        if self.shared is not None:
+            return self.shared.rank(metric, user_id, date.today())
+        with self._lock:
+            self._roll(date.today())
+            index = self._indexes[metric]
+            rank, score = index.rank(user_id)
+            return rank, score, len(index)
+
+    def compute_updates(self, session, stats_users, badge_users):
+        """Reads the current scores of the given users inside the committing transaction."""
+        today = date.today()
+        updates = {}
+        if stats_users:
+            rows = session.execute(self._stats_query().where(HabitStats.user_id.in_(stats_users))).all()
+            scores = self._stats_scores(rows, today)
+            for user_id in stats_users:
+                updates[user_id] = {'stats': scores.get(user_id, (0, None, 0, 0))}
+        if badge_users:
+            counts = dict(session.execute(
+                select(UserBadge.user_id, func.count(UserBadge.id)).where(
+                    UserBadge.user_id.in_(badge_users)
+                ).group_by(UserBadge.user_id)
+            ).all())
+            for user_id in badge_users:
+                updates.setdefault(user_id, {})['badges'] = counts.get(user_id, 0)
+        return today, updates
+
+    def apply(self, today, updates):
+        """Applies committed scores from compute_updates."""
+        if self.shared is not None:
+            try:
+                self.shared.apply(today, updates)
+            except Exception as e:
+                # The commit has happened; the scores catch up on the user's next change
+                logger.error(f"Updating the shared leaderboards failed: {e}")
+            return
+        with self._lock:
+            if self._indexes is None:
+                return
+            self._roll(max(today, self._today))
+            if today != self._today:
+                # Computed for a period that has just rolled over; the next
+                # commit for these users brings them up to date.
+                return
+            for user_id, values in updates.items():
+                if 'stats' in values:
+                    streak, until, week, month = values['stats']
+                    self._indexes['streak'].update(user_id, streak)
+                    if streak:
+                        self._streak_expiry[user_id] = until
+                    else:
+                        self._streak_expiry.pop(user_id, None)
+                    self._indexes['week'].update(user_id, week)
+                    self._indexes['month'].update(user_id, month)
+                if 'badges' in values:
+                    self._indexes['badges'].update(user_id, values['badges'])
+
+    def reset(self):
+        with self._lock:
+            self._indexes = None
+            self._streak_expiry = {}
+            self._built_at = 0.0
+
+
+leaderboards = LeaderboardService()
+
+
+def badges_changed(session, user_id):
+    """Marks the user's badge score for recomputation at commit, for badges
+    inserted without the ORM (which the flush listener below does not see)."""
+    if leaderboards.loaded:
+        session.info.setdefault('leaderboard_badge_users', set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_touched_users(session, flush_context):
+    if not leaderboards.loaded:
+        return
+    stats_users = session.info.setdefault('leaderboard_stats_users', set())
+    badge_users = session.info.setdefault('leaderboard_badge_users', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, HabitStats):
+            stats_users.add(instance.user_id)
+        elif isinstance(instance, UserBadge):
+            badge_users.add(instance.user_id)
+
+
+@event.listens_for(Session, 'before_commit')
+def _compute_leaderboard_updates(session):
+    if not leaderboards.loaded:
+        return
+    session.flush()
+    stats_users = session.info.pop('leaderboard_stats_users', None)
+    badge_users = session.info.pop('leaderboard_badge_users', None)
+    if stats_users or badge_users:
+        session.info['leaderboard_updates'] = leaderboards.compute_updates(session, stats_users, badge_users)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_leaderboard_updates(session):
+    pending = session.info.pop('leaderboard_updates', None)
+    if pending:
+        leaderboards.apply(*pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_leaderboard_updates(session):
+    for key in ('leaderboard_stats_users', 'leaderboard_badge_users', 'leaderboard_updates'):
+        session.info.pop(key, None)
+
+
+def preload(app):
+    """Builds the indexes on a background thread so the first read does not wait."""
+    def build():
+        with app.app_context():
+            try:
+                leaderboards.ensure_loaded()
+            except Exception as e:
+                logger.error(f"Leaderboard preload failed: {e}")
+    threading.Thread(target=build, name='leaderboard-preload', daemon=True).start()
@@ -0,0 +1,118 @@
+"""Live dashboard updates over Socket.IO.
+
+A dashboard page joins its user's room when it connects. After a write
+commits, the view publishes a small delta to that room (the habit fields that
+changed, calendar entries added or removed, badges just earned) and scripts.js
+patches the page, so completing a habit no longer reloads and rebuilds the
+whole dashboard. Build deltas before the commit, while the objects are still
+loaded, and publish them after it.
+
+Each process delivers to the browsers connected to it. With several worker
+processes set LIVE_UPDATES_MESSAGE_QUEUE (e.g. a Redis URL) so a delta
+published by one reaches browsers connected to another.
+"""
+
+import logging
+from datetime import date
+from flask import get_template_attribute
+from flask_login import current_user
+from flask_socketio import SocketIO, join_room
+from app.dashboard import completion_progress
+
+logger = logging.getLogger(__name__)
+
+socketio = SocketIO()
+
+
+def user_room(user_id):
+    return f'user:{user_id}'
+
+
+@socketio.on('connect')
+def connect(auth=None):
+    """Puts a logged-in browser in its user's room; refuses anonymous connections."""
+    if not current_user.is_authenticated:
+        return False
+    join_room(user_room(current_user.id))
+
+
+def habit_state(habit, stats, created_at, today=None):
+    """The counters a dashboard card shows for `habit`, from its in-memory rollup."""
+    completed = stats.total_completions or 0
+    return {
+        'id': habit.id,
+        'current_streak': habit.current_streak,
+        'longest_streak': habit.longest_streak,
+        'completed': completed,
+        'progress': round(completion_progress(completed, created_at, today or date.today()), 2),
+    }
+
+
+def completion_delta(created_at, completed, badges=(), today=None):
+    """Delta for new completions; `completed` holds (habit, stats, dates) for each habit
+    that got some and `badges` the BadgeInfo list evaluate_badges() awarded."""
+    return {
+        'habits': [habit_state(habit, stats, created_at, today) for habit, stats, _ in completed],
+        'completions': [
+            {'habit_id': habit.id, 'habit_name': habit.habit_name, 'date': day.isoformat()}
+            for habit, _, dates in completed for day in dates
+        ],
+        'badges': [{'name': badge.name, 'description': badge.description, 'icon': badge.icon} for badge in badges],
+    }
+
+
+def uncompletion_delta(habit, stats, created_at, day):
+    return {
+        'habits': [habit_state(habit, stats, created_at)],
+        'uncompleted': [{'habit_id': habit.id, 'date': day.isoformat()}],
+    }
+
+
+def added_habit_delta(habit):
+    """Delta for a new habit, carrying its rendered dashboard card."""
+    habit_card = get_template_attribute('_habit_card.html', 'habit_card')
+    return {'added': [{'id': habit.id, 'html': str(habit_card(habit, 0, 0))}]}
+
+
+def renamed_habit_delta(habit):
+    return {'habits': [{'id': habit.id, 'habit_name': habit.habit_name}]}
+
+
+def removed_habit_delta(habit_id):
+    return {'removed': [habit_id]}
+
+
+class LiveUpdates:
+    """Publishes dashboard deltas to the browsers a user has connected."""
+
+    def __init__(self):
+        self.enabled = False
+        self.published = self.failures = 0
+
+    def configure(self, app):
+        self.enabled = app.config.get('LIVE_UPDATES_ENABLED', False)
+        if self.enabled:
+            # Threads, like the WSGI servers this app runs under; WebSockets are served by simple-websocket
+            socketio.init_app(app, async_mode='threading', message_queue=app.config.get('LIVE_UPDATES_MESSAGE_QUEUE'))
+
+    def publish(self, user_id, delta):
+        """Sends `delta` to the user's connected dashboards; call after the change is committed."""
+        if not self.enabled:
+            return
+        try:
+            socketio.emit('dashboard', delta, to=user_room(user_id))
+            self.published += 1
+        except Exception as e:
+            # The change is committed; a lost delta only leaves a page stale until it reloads
+            self.failures += 1
+            logger.error(f"Publishing a dashboard update for user {user_id} failed: {e}")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'published': self.published,
+            'failures': self.failures,
+        }
+
+
+live_updates = LiveUpdates()
@@ -2,10 +2,8 @@
 
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.passwords import password_hasher
 from datetime import datetime, date
-import json
-from google.oauth2.credentials import Credentials
 
 class User(UserMixin, db.Model):
     """User model with hashed password, authentication"""
@@ -22,11 +20,18 @@ class User(UserMixin, db.Model):
 
     def set_password(self, password):
         """Hashes and sets the user's password."""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Checks if the given password matches the stored hashed password."""
-        return check_password_hash(self.password_hash, password)
+        """Checks if the given password matches the stored hashed password.
+        A match on a hash made with outdated parameters re-hashes the password
+        with the configured ones; the caller's commit stores it."""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+            password_hasher.rehashed += 1
+        return True
 
     def set_google_credentials(self, credentials):
         """Sets Google credentials by converting them to a JSON string."""
@@ -37,7 +42,8 @@ class User(UserMixin, db.Model):
         """Retrieves Google credentials from JSON string, returning None if not set."""
 
         if self.google_credentials:
-            return Credentials.from_authorized_user_info(json.loads(self.google_credentials))
+            from app.google_integration import google_integration
+            return google_integration.credentials_from_json(self.google_credentials)
         return None
 
 class Habit(db.Model):
@@ -53,6 +59,11 @@ class Habit(db.Model):
     longest_streak = db.Column(db.Integer, default=0)
     last_completed = db.Column(db.Date, nullable=True)
 
+    # InnoDB already indexes the foreign key column; other databases need their own
+    __table_args__ = (
+        db.Index('ix_habit_user_id', 'user_id').ddl_if(callable_=lambda *args, dialect, **kw: dialect.name != 'mysql'),
+    )
+
     def update_streak(self):
         today = date.today()
         if self.last_completed:
@@ -83,10 +94,53 @@ class UserBadge(db.Model):
     earned_at = db.Column(db.DateTime, default=datetime.utcnow)
     badge = db.relationship('Badge', back_populates='user_badges', lazy=True)
 
+    __table_args__ = (db.UniqueConstraint('user_id', 'badge_id', name='_user_badge_uc'),)
+
 class HabitCompletion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     habit_id = db.Column(db.Integer, db.ForeignKey('habit.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date_completed = db.Column(db.Date, nullable=False, default=date.today)
 
-    __table_args__ = (db.UniqueConstraint('habit_id', 'date_completed', name='_habit_date_uc'),)
+    # _habit_date_uc also serves (habit_id, date range) lookups; the user index
+    # serves per-user listings ordered by (date_completed, id) and date ranges.
+    __table_args__ = (
+        db.UniqueConstraint('habit_id', 'date_completed', name='_habit_date_uc'),
+        db.Index('ix_habit_completion_user_date', 'user_id', 'date_completed', 'id'),
+    )
+
+class HabitStats(db.Model):
+    """Per-habit rollup of completion history, updated in the same transaction
+    as every completion write so readers never scan HabitCompletion."""
+
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    total_completions = db.Column(db.Integer, nullable=False, default=0)
+    monthly_counts = db.Column(db.JSON, nullable=False, default=dict)  # {'YYYY-MM': count}
+    recent_bitmap = db.Column(db.Integer, nullable=False, default=0)  # Bit i set if completed on bitmap_date - i days
+    bitmap_date = db.Column(db.Date, nullable=True)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_completed = db.Column(db.Date, nullable=True, index=True)  # Indexed for leaderboard rebuilds of recently active users
+    history = db.Column(db.LargeBinary, nullable=True)  # Packed day bitset, see app/bitset.py
+    history_start = db.Column(db.Date, nullable=True)  # Day represented by bit 0 of history
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    habit = db.relationship('Habit', backref=db.backref('stats', uselist=False, lazy=True, cascade='all, delete-orphan'))
+
+class CalendarOutbox(db.Model):
+    """Pending Google Calendar operation, written in the same transaction as the
+    habit change and drained asynchronously by app.calendar_sync."""
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id', ondelete='SET NULL'), nullable=True)
+    operation = db.Column(db.String(20), nullable=False, default='insert')
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, in_progress, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    event_id = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_calendar_outbox_status_next_attempt', 'status', 'next_attempt_at'),)
@@ -0,0 +1,120 @@
+"""Password hashing off the request threads.
+
+Hashes are computed with werkzeug.security in a small pool of worker
+processes (PASSWORD_HASH_WORKERS per app process), so a burst of logins keeps
+at most that many cores busy with key derivation while request threads only
+wait on a pipe. At most PASSWORD_HASH_MAX_PENDING hashes are queued or running;
+a request that gets no slot within PASSWORD_HASH_QUEUE_TIMEOUT seconds fails
+with 503 instead of piling up behind the others. PASSWORD_HASH_METHOD picks the
+algorithm and cost (any Werkzeug method, e.g. 'scrypt:32768:8:1' or
+'pbkdf2:sha256:600000'); hashes made with other parameters are replaced the
+next time their user logs in.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(ServiceUnavailable):
+    """Raised when no hashing slot frees up within PASSWORD_HASH_QUEUE_TIMEOUT."""
+
+    description = 'Too many sign-ins are being processed. Please try again in a moment.'
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a lazily started process pool."""
+
+    def __init__(self):
+        self.method = 'scrypt'
+        self.workers = 0
+        self.max_pending = 1
+        self.queue_timeout = 10
+        self._stored_method = None
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.hashed = self.verified = self.rehashed = self.rejected = self.fallbacks = 0
+
+    def configure(self, app):
+        self.shutdown()
+        self.method = app.config.get('PASSWORD_HASH_METHOD') or self.method
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING') or max(self.workers, 1) * 8
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', self.queue_timeout)
+        self._stored_method = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn, not fork: the app process has threads (and their locks) by now
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise HashingBusy()
+        try:
+            if not self.workers:
+                return fn(*args)
+            try:
+                return self._executor().submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed by the OOM killer); start a new pool next time
+                logger.error("Password hashing pool broke; hashing this password in the request thread")
+                with self._lock:
+                    self._pool = None
+                self.fallbacks += 1
+                return fn(*args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        self.hashed += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        self.verified += 1
+        return self._run(check_password_hash, pwhash, password)
+
+    @property
+    def stored_method(self):
+        """The method as Werkzeug writes it into hashes, defaults filled in
+        ('scrypt' -> 'scrypt:32768:8:1'); found once by hashing an empty password."""
+        if self._stored_method is None:
+            self._stored_method = self._run(generate_password_hash, '', self.method).split('$', 1)[0]
+        return self._stored_method
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.stored_method
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'hashed': self.hashed,
+            'verified': self.verified,
+            'rehashed': self.rehashed,
+            'rejected': self.rejected,
+            'fallbacks': self.fallbacks,
+        }
+
+
+password_hasher = PasswordHasher()
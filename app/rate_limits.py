@@ -0,0 +1,50 @@
+"""Per-user and per-IP rate limits for the expensive endpoints.
+
+Counters are kept in RATELIMIT_STORAGE_URI: 'memory://' counts per process,
+'redis://host:port/db' (or any server speaking the Redis protocol) shares the
+counts between all workers. If that server is unreachable the limits fall back
+to in-process counters instead of failing requests. Limit strings such as
+'30/minute;500/day' are read from the config on every request; an empty one
+disables that limit.
+"""
+
+from flask import current_app
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+limiter = Limiter(key_func=get_remote_address)
+
+
+def user_key():
+    """Keys a request by its JWT identity or logged-in user, or by client IP
+    when it carries neither (the view then rejects it anyway)."""
+    from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+    from flask_login import current_user
+
+    # Limits are checked before the view's own auth decorators run
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception:
+        user_id = None
+    if user_id is None and current_user and current_user.is_authenticated:
+        user_id = current_user.id
+    return f'user:{user_id}' if user_id is not None else f'ip:{get_remote_address()}'
+
+
+def _limit(setting, key_func):
+    return limiter.limit(
+        lambda: current_app.config.get(setting) or '',
+        key_func=key_func,
+        exempt_when=lambda: not current_app.config.get(setting),
+    )
+
+
+def per_user(setting):
+    """Limits the view per user to the rate in config[setting]."""
+    return _limit(setting, user_key)
+
+
+def per_ip(setting='RATELIMIT_PER_IP'):
+    """Limits the view per client IP to the rate in config[setting]."""
+    return _limit(setting, get_remote_address)
@@ -19,7 +19,7 @@ class UserSchema(SQLAlchemyAutoSchema):
 class HabitSchema(SQLAlchemyAutoSchema):
     """Schema for the Habit model, excluding user_id from input and including foreign keys."""
 
-    user_id = fields.Int(dump_only=Truer
+    user_id = fields.Int(dump_only=True)
     current_streak = fields.Int(dump_only=True)
     longest_streak = fields.Int(dump_only=True)
 
@@ -37,7 +37,7 @@ class HabitCompletionSchema(SQLAlchemyAutoSchema):
         include_fk = True
 
 class BadgeSchema(SQLAlchemyAutoSchema):
-"""Schema for serializing and deserializing Badge instances."""
+    """Schema for serializing and deserializing Badge instances."""
     class Meta:
         model = Badge
         load_instance = True
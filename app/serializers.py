@@ -0,0 +1,82 @@
+"""Fast serializers for hot list endpoints. They select only the needed columns
+and build the same JSON shape as the Marshmallow schemas in app/schemas.py,
+which remain in use for validation and loading."""
+
+from app import db
+from app.models import Habit, HabitCompletion, Badge, UserBadge
+from sqlalchemy import select
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def compile_serializer(fields):
+    """Builds a row -> dict function from (key, converter) pairs, where row
+    values are in the same order as `fields` and converter may be None.
+    """
+    keys = tuple(key for key, _ in fields)
+    converters = tuple((index, converter) for index, (_, converter) in enumerate(fields) if converter)
+
+    def serialize(row):
+        if not converters:
+            return dict(zip(keys, row))
+        values = list(row)
+        for index, converter in converters:
+            values[index] = converter(values[index])
+        return dict(zip(keys, values))
+    return serialize
+
+
+HABIT_FIELDS = (
+    ('created_at', Habit.created_at, _isoformat),
+    ('current_streak', Habit.current_streak, None),
+    ('google_credentials', Habit.google_credentials, None),
+    ('habit_name', Habit.habit_name, None),
+    ('id', Habit.id, None),
+    ('last_completed', Habit.last_completed, _isoformat),
+    ('longest_streak', Habit.longest_streak, None),
+    ('user_id', Habit.user_id, None),
+)
+
+COMPLETION_FIELDS = (
+    ('date_completed', HabitCompletion.date_completed, _isoformat),
+    ('habit_id', HabitCompletion.habit_id, None),
+    ('id', HabitCompletion.id, None),
+    ('user_id', HabitCompletion.user_id, None),
+)
+
+HABIT_COLUMNS = tuple(column for _, column, _ in HABIT_FIELDS)
+COMPLETION_COLUMNS = tuple(column for _, column, _ in COMPLETION_FIELDS)
+
+serialize_habit = compile_serializer([(key, converter) for key, _, converter in HABIT_FIELDS])
+serialize_completion = compile_serializer([(key, converter) for key, _, converter in COMPLETION_FIELDS])
+_serialize_badge = compile_serializer([('description', None), ('icon', None), ('id', None), ('name', None)])
+
+
+def serialize_user_badge(row):
+    """Serializes (id, earned_at, description, icon, badge_id, name) rows like UserBadgeSchema."""
+    return {
+        'badge': _serialize_badge(row[2:]),
+        'earned_at': _isoformat(row[1]),
+        'id': row[0],
+    }
+
+
+def habit_select(*filters):
+    return select(*HABIT_COLUMNS).where(*filters).order_by(Habit.id)
+
+
+def user_badge_select(user_id):
+    return select(
+        UserBadge.id, UserBadge.earned_at,
+        Badge.description, Badge.icon, Badge.id, Badge.name
+    ).join(Badge, Badge.id == UserBadge.badge_id).where(UserBadge.user_id == user_id).order_by(UserBadge.id)
+
+
+def habit_rows(*filters):
+    return db.session.execute(habit_select(*filters)).all()
+
+
+def user_badge_rows(user_id):
+    return db.session.execute(user_badge_select(user_id)).all()
@@ -59,4 +59,140 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Expose showToast to global scope for inline scripts
     window.showToast = showToast;
+
+    // Live Dashboard Updates
+    const habitCards = document.getElementById('habit-cards');
+    if (!habitCards) {
+        return;
+    }
+    let socket = null;
+
+    // Applies a delta from the server; values are absolute, so applying one twice is harmless
+    function applyDashboardDelta(delta) {
+        const calendar = window.habitCalendar;
+
+        (delta.added || []).forEach(function(habit) {
+            if (habitCards.querySelector(`[data-habit-id="${habit.id}"]`)) {
+                return;
+            }
+            const noHabits = document.getElementById('no-habits');
+            if (noHabits) {
+                noHabits.remove();
+            }
+            habitCards.insertAdjacentHTML('beforeend', habit.html);
+        });
+
+        (delta.habits || []).forEach(function(habit) {
+            const card = habitCards.querySelector(`[data-habit-id="${habit.id}"]`);
+            if (!card) {
+                return;
+            }
+            ['habit_name', 'current_streak', 'longest_streak', 'completed'].forEach(function(field) {
+                if (field in habit) {
+                    card.querySelector(`[data-field="${field}"]`).textContent = habit[field];
+                }
+            });
+            if ('progress' in habit) {
+                const bar = card.querySelector('[data-field="progress"]');
+                bar.style.width = `${habit.progress}%`;
+                bar.setAttribute('aria-valuenow', habit.progress);
+                bar.querySelector('.progress-bar-text').textContent = `${habit.progress}%`;
+            }
+            if ('habit_name' in habit && calendar) {
+                calendar.getEvents().forEach(function(event) {
+                    if (event.extendedProps.habitId === habit.id) {
+                        event.setProp('title', habit.habit_name);
+                    }
+                });
+            }
+        });
+
+        (delta.removed || []).forEach(function(habitId) {
+            const card = habitCards.querySelector(`[data-habit-id="${habitId}"]`);
+            if (card) {
+                card.remove();
+            }
+            if (calendar) {
+                calendar.getEvents().forEach(function(event) {
+                    if (event.extendedProps.habitId === habitId) {
+                        event.remove();
+                    }
+                });
+            }
+        });
+
+        if (calendar) {
+            (delta.completions || []).forEach(function(completion) {
+                const id = `${completion.habit_id}:${completion.date}`;
+                if (!calendar.getEventById(id)) {
+                    calendar.addEvent({
+                        id: id,
+                        title: completion.habit_name,
+                        start: completion.date,
+                        allDay: true,
+                        color: '#0d6efd',
+                        extendedProps: { habitId: completion.habit_id }
+                    });
+                }
+            });
+            (delta.uncompleted || []).forEach(function(completion) {
+                const event = calendar.getEventById(`${completion.habit_id}:${completion.date}`);
+                if (event) {
+                    event.remove();
+                }
+            });
+        }
+
+        (delta.badges || []).forEach(function(badge) {
+            showToast(`<i class="fa-solid fa-award"></i> Badge earned: ${escapeHtml(badge.name)}`, 'success');
+        });
+    }
+
+    function escapeHtml(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    }
+
+    // Complete habits without reloading the page; the form still works without JavaScript
+    habitCards.addEventListener('submit', function(e) {
+        const form = e.target;
+        if (!form.classList.contains('complete-habit-form')) {
+            return;
+        }
+        e.preventDefault();
+        fetch(form.action, { method: 'POST', headers: { 'Accept': 'application/json' }, credentials: 'same-origin' })
+            .then(function(response) {
+                if (!response.ok && response.status !== 409) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(function(result) {
+                // The same delta also arrives over the socket when it is connected
+                if (result.delta && !(socket && socket.connected)) {
+                    applyDashboardDelta(result.delta);
+                }
+                showToast(escapeHtml(result.message), result.category);
+            })
+            .catch(function() {
+                form.submit();
+            });
+    });
+
+    if (habitCards.dataset.liveUpdates === 'on' && typeof io !== 'undefined') {
+        // WebSocket only, so no sticky sessions are needed behind a load balancer
+        socket = io({ transports: ['websocket'] });
+        let disconnected = false;
+        socket.on('dashboard', applyDashboardDelta);
+        socket.on('disconnect', function() {
+            disconnected = true;
+        });
+        socket.on('connect', function() {
+            // Deltas sent while disconnected are lost; reload to catch up
+            if (disconnected) {
+                window.location.reload();
+            }
+        });
+    }
 });
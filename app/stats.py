@@ -0,0 +1,221 @@
+"""Maintains the HabitStats rollup incrementally on completion writes,
+and provides a CLI command to rebuild it from raw completions.
+Streaks are always recomputed from the history bitset, so backdated
+completions and deletions keep them correct."""
+
+import click
+from flask.cli import AppGroup
+from app import db
+from app.models import Habit, HabitCompletion, HabitStats
+from app import bitset
+from app.cache import user_cache
+from datetime import date, timedelta
+
+RECENT_DAYS = 30
+RECENT_MASK = (1 << RECENT_DAYS) - 1
+
+stats_cli = AppGroup('stats', help='Maintain the per-habit statistics rollup.')
+
+
+def month_key(day):
+    return day.strftime('%Y-%m')
+
+
+def shift_bitmap(bitmap, bitmap_date, today):
+    """Re-anchors a recent-completions bitmap from bitmap_date to today."""
+    if bitmap_date is None or bitmap_date >= today:
+        return bitmap
+    delta = (today - bitmap_date).days
+    if delta >= RECENT_DAYS:
+        return 0
+    return (bitmap << delta) & RECENT_MASK
+
+
+def recent_flags(stats, today=None, days=RECENT_DAYS):
+    """Returns completion flags for the last `days` days, oldest first."""
+    today = today or date.today()
+    bitmap = shift_bitmap(stats.recent_bitmap, stats.bitmap_date, today) if stats else 0
+    return [1 if bitmap & (1 << i) else 0 for i in range(days - 1, -1, -1)]
+
+
+def effective_current_streak(stats, today=None):
+    """Returns the streak as of today: zero once a full day has been missed."""
+    if not stats or not stats.history_start:
+        return 0
+    return bitset.current_streak(bitset.to_bits(stats.history), stats.history_start, today or date.today())
+
+
+def completion_rate(stats, days, today=None):
+    """Returns the completion percentage over the last `days` days, from the history bitset."""
+    if not stats or not stats.history_start:
+        return 0.0
+    today = today or date.today()
+    return bitset.completion_rate(
+        bitset.to_bits(stats.history), stats.history_start, today - timedelta(days=days - 1), today
+    )
+
+
+def get_or_create_stats(habit):
+    """Returns the habit's stats row. A missing row is built from the habit's
+    stored completions, excluding changes still pending in the session.
+    """
+    with db.session.no_autoflush:
+        stats = habit.stats
+        if stats is None:
+            dates = [row[0] for row in db.session.query(HabitCompletion.date_completed).filter(
+                HabitCompletion.habit_id == habit.id
+            ).order_by(HabitCompletion.date_completed).all()]
+            stats = HabitStats(**_build_stats(habit, dates, date.today()))
+            habit.stats = stats
+    return stats
+
+
+def _apply_history(stats, habit, days, completed):
+    """Updates the history bitset for `days` and recomputes both streaks from it."""
+    start = stats.history_start or min([habit.created_at.date()] + list(days))
+    stats.history, stats.history_start = bitset.set_days(stats.history, start, days, completed)
+    stats.current_streak, stats.longest_streak, stats.last_completed = bitset.streak_summary(
+        bitset.to_bits(stats.history), stats.history_start
+    )
+
+
+def _sync_habit(habit, stats):
+    habit.current_streak = stats.current_streak
+    habit.longest_streak = stats.longest_streak
+    habit.last_completed = stats.last_completed
+
+
+def _update_bitmap(stats, day, completed, today):
+    bitmap = shift_bitmap(stats.recent_bitmap or 0, stats.bitmap_date, today)
+    offset = (today - day).days
+    if 0 <= offset < RECENT_DAYS:
+        if completed:
+            bitmap |= 1 << offset
+        else:
+            bitmap &= ~(1 << offset)
+    stats.recent_bitmap = bitmap
+    stats.bitmap_date = today
+
+
+def record_completion(habit, date_completed):
+    """Applies a new completion to the habit's rollup and streak columns.
+    Must be called in the same transaction that adds the HabitCompletion.
+    """
+    return record_completions(habit, [date_completed])
+
+
+def record_completions(habit, dates):
+    """Applies a batch of new, distinct completion dates to the habit's rollup.
+    Streaks are recomputed once for the whole batch.
+    """
+    stats = get_or_create_stats(habit)
+    today = date.today()
+    stats.total_completions = (stats.total_completions or 0) + len(dates)
+    monthly = dict(stats.monthly_counts or {})
+    for day in dates:
+        key = month_key(day)
+        monthly[key] = monthly.get(key, 0) + 1
+        _update_bitmap(stats, day, True, today)
+    stats.monthly_counts = monthly
+    _apply_history(stats, habit, dates, True)
+    _sync_habit(habit, stats)
+    return stats
+
+
+def record_deletion(habit, date_completed):
+    """Removes a deleted completion from the habit's rollup and streak columns.
+    Must be called in the same transaction that deletes the HabitCompletion.
+    """
+    stats = get_or_create_stats(habit)
+    today = date.today()
+    stats.total_completions = max((stats.total_completions or 0) - 1, 0)
+    monthly = dict(stats.monthly_counts or {})
+    key = month_key(date_completed)
+    if monthly.get(key, 0) > 1:
+        monthly[key] -= 1
+    else:
+        monthly.pop(key, None)
+    stats.monthly_counts = monthly
+    _update_bitmap(stats, date_completed, False, today)
+    _apply_history(stats, habit, [date_completed], False)
+    _sync_habit(habit, stats)
+    return stats
+
+
+def _build_stats(habit, dates, today):
+    """Builds the rollup values for a habit from its ascending completion dates."""
+    monthly = {}
+    bitmap = 0
+    for day in dates:
+        key = month_key(day)
+        monthly[key] = monthly.get(key, 0) + 1
+        offset = (today - day).days
+        if 0 <= offset < RECENT_DAYS:
+            bitmap |= 1 << offset
+    start = min(habit.created_at.date(), dates[0]) if dates else habit.created_at.date()
+    history = bitset.pack_dates(dates, start)
+    current, longest, last = bitset.streak_summary(bitset.to_bits(history), start)
+    return {
+        'habit_id': habit.id,
+        'user_id': habit.user_id,
+        'total_completions': len(dates),
+        'monthly_counts': monthly,
+        'recent_bitmap': bitmap,
+        'bitmap_date': today,
+        'current_streak': current,
+        'longest_streak': longest,
+        'last_completed': last,
+        'history': history,
+        'history_start': start,
+    }
+
+
+def rebuild_stats(habit_ids=None, chunk_size=500):
+    """Rebuilds HabitStats (and the streak columns on Habit) from HabitCompletion.
+    Processes habits in chunks of `chunk_size`; returns the number of habits rebuilt.
+    """
+    today = date.today()
+    query = Habit.query.order_by(Habit.id)
+    if habit_ids is not None:
+        query = query.filter(Habit.id.in_(habit_ids))
+
+    rebuilt = 0
+    last_id = 0
+    while True:
+        habits = query.filter(Habit.id > last_id).limit(chunk_size).all()
+        if not habits:
+            break
+        ids = [habit.id for habit in habits]
+        dates_by_habit = {habit_id: [] for habit_id in ids}
+        rows = db.session.query(HabitCompletion.habit_id, HabitCompletion.date_completed).filter(
+            HabitCompletion.habit_id.in_(ids)
+        ).order_by(HabitCompletion.habit_id, HabitCompletion.date_completed)
+        for habit_id, day in rows:
+            dates_by_habit[habit_id].append(day)
+
+        existing = {stats.habit_id: stats for stats in HabitStats.query.filter(HabitStats.habit_id.in_(ids))}
+        for habit in habits:
+            values = _build_stats(habit, dates_by_habit[habit.id], today)
+            stats = existing.get(habit.id)
+            if stats is None:
+                stats = HabitStats(habit_id=habit.id)
+                db.session.add(stats)
+            for column, value in values.items():
+                setattr(stats, column, value)
+            _sync_habit(habit, stats)
+        user_ids = {habit.user_id for habit in habits}
+        db.session.commit()
+        for user_id in user_ids:
+            user_cache.bump(user_id)
+        rebuilt += len(habits)
+        last_id = ids[-1]
+    return rebuilt
+
+
+@stats_cli.command('rebuild')
+@click.option('--habit-id', 'habit_ids', type=int, multiple=True, help='Only rebuild these habits.')
+@click.option('--chunk-size', default=500, show_default=True, help='Habits processed per transaction.')
+def rebuild_command(habit_ids, chunk_size):
+    """Backfills or rebuilds the statistics rollup from raw completions."""
+    rebuilt = rebuild_stats(list(habit_ids) or None, chunk_size=chunk_size)
+    click.echo(f'Rebuilt statistics for {rebuilt} habits.')
@@ -0,0 +1,229 @@
+"""Batch reconciliation of the streak columns on Habit with the recorded
+completions, meant to run nightly so streaks of habits that were not
+completed yesterday drop to zero without waiting for the next completion.
+
+The same pass checks each habit's HabitStats rollup against the completions
+it reads (total, monthly counts, recent bitmap, longest streak, last
+completion) and rebuilds the rollups that disagree, so a missed or doubled
+incremental update is repaired overnight."""
+
+import click
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select, update, func, type_coerce, String
+from app import db
+from app.models import Habit, HabitCompletion, HabitStats
+from app.cache import user_cache
+from app.stats import RECENT_DAYS, month_key, rebuild_stats, shift_bitmap
+
+streaks_cli = AppGroup('streaks', help='Reconcile habit streaks with recorded completions.')
+
+_worker_app = None
+
+
+def _ordinal(value):
+    # SQLite returns the coerced dates as ISO strings, MySQL as date objects
+    return value.toordinal() if isinstance(value, date) else date.fromisoformat(value).toordinal()
+
+
+def scan_streaks(rows, today):
+    """Yields (habit_id, current_streak, longest_streak, last_completed) in one
+    pass over (habit_id, date_completed) rows ordered by habit then date.
+    The current streak is zero unless the habit was completed today or yesterday.
+    """
+    today_ordinal = today.toordinal()
+    habit_id = None
+    run = longest = last = 0
+    for row_habit_id, value in rows:
+        day = _ordinal(value)
+        if row_habit_id != habit_id:
+            if habit_id is not None:
+                yield habit_id, run if today_ordinal - last <= 1 else 0, longest, date.fromordinal(last)
+            habit_id, run, longest, last = row_habit_id, 1, 1, day
+            continue
+        run = run + 1 if day == last + 1 else 1
+        longest = max(longest, run)
+        last = day
+    if habit_id is not None:
+        yield habit_id, run if today_ordinal - last <= 1 else 0, longest, date.fromordinal(last)
+
+
+def reconcile_users(first_user_id, last_user_id, chunk_size=1000, today=None):
+    """Recomputes the streaks of every habit owned by users in [first_user_id,
+    last_user_id], chunk_size habits at a time, and writes the differences with
+    one bulk UPDATE per chunk. Rollups that disagree with the completions are
+    rebuilt. Returns a Counter of completions, habits, corrected and stats_rebuilt.
+    """
+    today = today or date.today()
+    totals = Counter()
+    last_id = 0
+    while True:
+        habits = db.session.execute(
+            select(Habit.id, Habit.user_id, Habit.current_streak, Habit.longest_streak, Habit.last_completed).where(
+                Habit.user_id.between(first_user_id, last_user_id), Habit.id > last_id
+            ).order_by(Habit.id).limit(chunk_size)
+        ).all()
+        if not habits:
+            break
+        last_id = habits[-1].id
+
+        rows = db.session.execute(
+            select(HabitCompletion.habit_id, type_coerce(HabitCompletion.date_completed, String)).where(
+                HabitCompletion.habit_id.between(habits[0].id, last_id),
+                HabitCompletion.user_id.between(first_user_id, last_user_id)
+            ).order_by(HabitCompletion.habit_id, HabitCompletion.date_completed).execution_options(yield_per=chunk_size)
+        )
+        tallies = {}
+        streaks = {}
+        for habit_id, current, longest, last_completed in scan_streaks(_tallied(rows, totals, tallies, today), today):
+            streaks[habit_id] = (current, longest, last_completed)
+
+        stale = stale_rollups(habits, streaks, tallies, today)
+        if stale:
+            # Rewrites the rollups and, from them, the streak columns; the UPDATE below
+            # then puts back the streaks as of today
+            rebuild_stats(stale)
+
+        corrections = []
+        corrected_users = set()
+        for habit in habits:
+            expected = streaks.get(habit.id, (0, 0, None))
+            wrong = (habit.current_streak or 0, habit.longest_streak or 0, habit.last_completed) != expected
+            if wrong or habit.id in stale:
+                corrections.append({
+                    'id': habit.id,
+                    'current_streak': expected[0],
+                    'longest_streak': expected[1],
+                    'last_completed': expected[2],
+                })
+                corrected_users.add(habit.user_id)
+                totals['corrected'] += wrong
+        if corrections:
+            db.session.execute(update(Habit), corrections)
+        db.session.commit()
+        for user_id in corrected_users:
+            user_cache.bump(user_id)
+        totals['habits'] += len(habits)
+        totals['stats_rebuilt'] += len(stale)
+    return totals
+
+
+def stale_rollups(habits, streaks, tallies, today):
+    """Returns the ids of `habits` whose HabitStats row is missing or disagrees
+    with the tallies and streaks computed from their completions."""
+    stored = {stats.habit_id: stats for stats in db.session.execute(
+        select(
+            HabitStats.habit_id, HabitStats.total_completions, HabitStats.monthly_counts,
+            HabitStats.recent_bitmap, HabitStats.bitmap_date, HabitStats.current_streak,
+            HabitStats.longest_streak, HabitStats.last_completed
+        ).where(HabitStats.habit_id.in_([habit.id for habit in habits]))
+    )}
+    stale = []
+    for habit in habits:
+        stats = stored.get(habit.id)
+        if stats is None:
+            stale.append(habit.id)
+            continue
+        count, monthly, bitmap = tallies.get(habit.id, (0, {}, 0))
+        current, longest, last_completed = streaks.get(habit.id, (0, 0, None))
+        # The rollup keeps the run ending at the last completion; it only matches the
+        # reconciled streak while that run is still going
+        stale_current = current and stats.current_streak != current
+        if (
+            (stats.total_completions or 0) != count
+            or (stats.monthly_counts or {}) != monthly
+            or shift_bitmap(stats.recent_bitmap or 0, stats.bitmap_date, today) != bitmap
+            or (stats.longest_streak or 0) != longest
+            or stats.last_completed != last_completed
+            or stale_current
+        ):
+            stale.append(habit.id)
+    return stale
+
+
+def _tallied(rows, totals, tallies, today):
+    """Passes rows through, counting them into `totals` and collecting
+    tallies[habit_id] = [completions, monthly counts, recent bitmap]."""
+    today_ordinal = today.toordinal()
+    for row in rows:
+        habit_id, value = row
+        tally = tallies.get(habit_id)
+        if tally is None:
+            tally = tallies[habit_id] = [0, {}, 0]
+        tally[0] += 1
+        key = month_key(value) if isinstance(value, date) else value[:7]
+        tally[1][key] = tally[1].get(key, 0) + 1
+        offset = today_ordinal - _ordinal(value)
+        if 0 <= offset < RECENT_DAYS:
+            tally[2] |= 1 << offset
+        totals['completions'] += 1
+        yield row
+
+
+def user_id_ranges(partitions):
+    """Splits the users owning habits into at most `partitions` contiguous id ranges."""
+    low, high = db.session.execute(select(func.min(Habit.user_id), func.max(Habit.user_id))).one()
+    if low is None:
+        return []
+    step = max((high - low + 1) // partitions, 1)
+    bounds = list(range(low, high + 1, step)) + [high + 1]
+    return [(start, end - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def _init_worker(config):
+    global _worker_app
+    from app import create_app
+    from config import Config
+
+    worker_config = type('ReconcileWorkerConfig', (Config,), dict(config, CALENDAR_WORKER_IN_PROCESS=False))
+    _worker_app = create_app(worker_config)
+
+
+def _reconcile_partition(user_range, chunk_size, today):
+    with _worker_app.app_context():
+        return reconcile_users(*user_range, chunk_size=chunk_size, today=today)
+
+
+def reconcile_all(chunk_size=1000, workers=1, today=None):
+    """Reconciles every habit, in this process or across `workers` processes,
+    each handling a share of the user id ranges. Returns the combined Counter.
+    """
+    today = today or date.today()
+    ranges = user_id_ranges(max(workers, 1) * 4)
+    if workers <= 1:
+        totals = Counter()
+        for user_range in ranges:
+            totals.update(reconcile_users(*user_range, chunk_size=chunk_size, today=today))
+        return totals
+
+    config = {'SQLALCHEMY_DATABASE_URI': current_app.config['SQLALCHEMY_DATABASE_URI']}
+    totals = Counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(config,)
+    ) as pool:
+        for result in pool.map(_reconcile_partition, ranges, [chunk_size] * len(ranges), [today] * len(ranges)):
+            totals.update(result)
+    return totals
+
+
+@streaks_cli.command('reconcile')
+@click.option('--chunk-size', default=1000, show_default=True, help='Habits per query and bulk UPDATE.')
+@click.option('--workers', default=1, show_default=True, help='Processes, each taking a share of the user id ranges.')
+def reconcile_command(chunk_size, workers):
+    """Recomputes streaks for all habits from their completions and repairs stale rollups."""
+    started = time.perf_counter()
+    totals = reconcile_all(chunk_size=chunk_size, workers=workers)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    click.echo(
+        f"Checked {totals['habits']} habits ({totals['completions']} completions) in {elapsed:.2f}s: "
+        f"{totals['completions'] / elapsed:,.0f} completions/s, {totals['habits'] / elapsed:,.0f} habits/s. "
+        f"Corrected {totals['corrected']} habits, rebuilt {totals['stats_rebuilt']} statistics rollups."
+    )
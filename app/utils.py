@@ -3,31 +3,25 @@
 from flask import jsonify, render_template, current_app, redirect, url_for, session, request
 import os
 import json
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from functools import wraps
 from flask_login import current_user
 from datetime import datetime, timedelta
-from google.auth.transport.requests import Request
+from collections import OrderedDict
+from contextlib import contextmanager
 import logging
+import threading
+from app import db
+from app.cache import user_cache
+from app.google_integration import google_integration
+from app.identity import identity_cache
+from app.models import User
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_google_flow():
-    flow = Flow.from_client_config(
-        {
-            "web": current_app.config['GOOGLE_CREDENTIALS']
-        },
-        scopes=[
-            'https://www.googleapis.com/auth/calendar',
-            'https://www.googleapis.com/auth/calendar.events'
-        ]
-    )
-    flow.redirect_uri = url_for('web.oauth2callback', _external=True)
-    return flow
+    return google_integration.flow(url_for('web.oauth2callback', _external=True))
 
 def login_required_google(func):
     """
@@ -38,67 +32,174 @@ def login_required_google(func):
         if not current_user.is_authenticated:
             return redirect(url_for('web.login'))
 
-        creds = current_user.get_google_credentials()
+        # current_user is a cached snapshot; the credentials are read and refreshed on the row
+        user = db.session.get(User, current_user.id)
+        creds = user.get_google_credentials()
 
         # Check if credentials exist or need to be refreshed
         if not creds or not creds.valid:
             if creds and creds.expired and creds.refresh_token:
                 try:
-                    creds.refresh(Request())
-                    current_user.set_google_credentials(creds)
+                    google_integration.refresh(creds)
+                    user.set_google_credentials(creds)
                     db.session.commit()
+                    # The profile shows the credentials, so its cached copies and ETags are stale
+                    user_cache.bump(user.id)
+                    identity_cache.invalidate(user.id)
                     logger.info("Google credentials refreshed successfully.")
                 except Exception as e:
                     logger.error(f"Error refreshing Google credentials: {e}")
-                    return redirect(url_for('google_auth'))
+                    return redirect(url_for('web.google_auth'))
             else:
                 logger.info("Redirecting to Google OAuth because credentials are missing or invalid.")
-                return redirect(url_for('google_auth'))
+                return redirect(url_for('web.google_auth'))
         return func(*args, **kwargs)
     return wrapper
 
-def create_google_event(user, habit, event_type='add'):
+def get_calendar_service(creds):
     """
-    Create a Google Calendar event for the user's habit.
+    Build a Google Calendar API client. GOOGLE_CALENDAR_API_ENDPOINT overrides
+    the API host, e.g. to point at a local fake Calendar server.
     """
-    creds = user.get_google_credentials()
-    if not creds:
-        logger.error("No Google credentials found for user.")
-        return None
+    return google_integration.build_calendar(creds, current_app.config.get('GOOGLE_CALENDAR_API_ENDPOINT'))
 
-    try:
-        service = build('calendar', 'v3', credentials=creds)
-
-        event = {
-            'summary': habit.habit_name,
-            'description': f'Habit Tracker - {habit.habit_name}',
-            'start': {
-                'dateTime': datetime.utcnow().isoformat(),
-                'timeZone': 'UTC',
-            },
-            'end': {
-                'dateTime': (datetime.utcnow() + timedelta(hours=1)).isoformat(),
-                'timeZone': 'UTC',
-            },
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},
-                    {'method': 'popup', 'minutes': 10},
-                ],
-            },
+class CalendarServiceCache:
+    """
+    Bounded LRU of built Calendar API clients keyed by user id. Credentials are
+    refreshed shortly before they expire and written back to the user only when
+    the token actually changes. Clients are not thread-safe, so each entry is
+    used under its own lock.
+    """
+
+    def __init__(self, max_size=256, refresh_margin=300):
+        self.max_size = max_size
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.refreshes = self.persisted = 0
+
+    def configure(self, app):
+        self.max_size = app.config.get('GOOGLE_SERVICE_CACHE_SIZE', self.max_size)
+        self.refresh_margin = timedelta(seconds=app.config.get('GOOGLE_TOKEN_REFRESH_MARGIN', 300))
+
+    def _get_entry(self, user):
+        with self._lock:
+            entry = self._entries.get(user.id)
+            if entry is not None and entry['raw'] == user.google_credentials:
+                self._entries.move_to_end(user.id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        creds = user.get_google_credentials()
+        if not creds:
+            raise ValueError("No Google credentials found for user.")
+        entry = {
+            'service': get_calendar_service(creds),
+            'credentials': creds,
+            'raw': user.google_credentials,
+            'lock': threading.Lock(),
         }
+        with self._lock:
+            self._entries[user.id] = entry
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def _persist_if_changed(self, user, entry, token):
+        creds = entry['credentials']
+        if creds.token != token:
+            user.set_google_credentials(creds)
+            entry['raw'] = user.google_credentials
+            self.persisted += 1
+
+    @contextmanager
+    def service_for(self, user):
+        """
+        Yield a Calendar client for the user. Refreshed tokens are set on
+        user.google_credentials; the caller's commit persists them.
+        """
+        entry = self._get_entry(user)
+        with entry['lock']:
+            creds = entry['credentials']
+            token = creds.token
+            if creds.refresh_token and creds.expiry and creds.expiry - datetime.utcnow() < self.refresh_margin:
+                google_integration.refresh(creds)
+                self.refreshes += 1
+            try:
+                yield entry['service']
+            finally:
+                # The client may also refresh on its own when a call returns 401
+                self._persist_if_changed(user, entry, token)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes,
+            'persisted': self.persisted,
+        }
+
+calendar_services = CalendarServiceCache()
 
-        if event_type == 'add':
-            # No recurrence when adding a habit; this ensures it’s a one-time event
-            pass
-        elif event_type == 'complete':
-            # When a habit is completed, modify the event description
-            event['summary'] += ' - Completed'
+def build_habit_event(habit_name, event_type='add'):
+    """
+    Build the Google Calendar event body for a habit.
+    """
+    event = {
+        'summary': habit_name,
+        'description': f'Habit Tracker - {habit_name}',
+        'start': {
+            'dateTime': datetime.utcnow().isoformat(),
+            'timeZone': 'UTC',
+        },
+        'end': {
+            'dateTime': (datetime.utcnow() + timedelta(hours=1)).isoformat(),
+            'timeZone': 'UTC',
+        },
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 24 * 60},
+                {'method': 'popup', 'minutes': 10},
+            ],
+        },
+    }
 
+    if event_type == 'add':
+        # No recurrence when adding a habit; this ensures it’s a one-time event
+        pass
+    elif event_type == 'complete':
+        # When a habit is completed, modify the event description
+        event['summary'] += ' - Completed'
+    return event
+
+def insert_google_event(user, event):
+    """
+    Insert an event into the user's primary calendar, raising on failure.
+    """
+    with calendar_services.service_for(user) as service:
         created_event = service.events().insert(calendarId='primary', body=event).execute()
-        logger.info(f"Event created successfully: {created_event.get('id')}")
-        return created_event.get('id')
+    logger.info(f"Event created successfully: {created_event.get('id')}")
+    return created_event.get('id')
+
+def create_google_event(user, habit, event_type='add'):
+    """
+    Create a Google Calendar event for the user's habit.
+    """
+    try:
+        return insert_google_event(user, build_habit_event(habit.habit_name, event_type))
     except Exception as e:
         logger.error(f"Error creating Google Calendar event: {e}")
         return None
@@ -107,19 +208,18 @@ def update_google_event(user, event_id, updates):
     """
     Update an existing Google Calendar event with new information.
     """
-    creds = user.get_google_credentials()
-    if not creds:
+    if not user.google_credentials:
         logger.error("No Google credentials found for user.")
         return None
 
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
+        with calendar_services.service_for(user) as service:
+            event = service.events().get(calendarId='primary', eventId=event_id).execute()
 
-        for key, value in updates.items():
-            event[key] = value
+            for key, value in updates.items():
+                event[key] = value
 
-        updated_event = service.events().update(calendarId='primary', eventId=event['id'], body=event).execute()
+            updated_event = service.events().update(calendarId='primary', eventId=event['id'], body=event).execute()
         logger.info(f"Event updated successfully: {event_id}")
         return updated_event
     except Exception as e:
@@ -151,6 +251,20 @@ def register_error_handlers(app):
             return jsonify({'message': 'Resource not found.'}), 404
         return render_template('404.html'), 404
 
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        logger.warning(f"Rate limit exceeded for {request.path}: {error.description}")
+        if request.path.startswith('/api/'):
+            return jsonify({'message': f'Too many requests, limit is {error.description}. Try again later.'}), 429
+        return render_template('429.html', limit=error.description), 429
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        logger.warning(f"Service unavailable for {request.path}: {error.description}")
+        if request.path.startswith('/api/'):
+            return jsonify({'message': error.description}), 503
+        return render_template('503.html', message=error.description), 503
+
     @app.errorhandler(500)
     def internal_error(error):
         logger.error(f"Internal server error: {error}")
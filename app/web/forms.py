@@ -2,7 +2,7 @@
 
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
+from wtforms.validators import DataRequired, Email, EqualTo, Optional, Length, ValidationError
 from app.models import User
 from flask_login import current_user
 
@@ -37,3 +37,27 @@ class RegisterForm(FlaskForm):
         if user:
             raise ValidationError('Email already registered. Please choose a different one.')
 
+class UpdateProfileForm(FlaskForm):
+    """Form for changing the username, email and optionally the password,
+    confirmed with the current password."""
+
+    username = StringField('Username', validators=[DataRequired()])
+    email = StringField('Email', validators=[DataRequired(), Email()])
+    current_password = PasswordField('Current Password', validators=[DataRequired()])
+    new_password = PasswordField('New Password', validators=[Optional(), Length(min=6)])
+    confirm = PasswordField('Confirm New Password', validators=[EqualTo('new_password', message='Passwords must match.')])
+    submit = SubmitField('Update Profile')
+
+    def validate_username(self, username):
+        """Validates that no other user has the username."""
+
+        user = User.query.filter_by(username=username.data).first()
+        if user and user.id != current_user.id:
+            raise ValidationError('Username already exists. Please choose a different one.')
+
+    def validate_email(self, email):
+        """Validates that no other user has the email."""
+
+        user = User.query.filter_by(email=email.data).first()
+        if user and user.id != current_user.id:
+            raise ValidationError('Email already registered. Please choose a different one.')
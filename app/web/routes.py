@@ -1,13 +1,24 @@
 """Defines routes for user authentication, registration, and dashboard access."""
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.web.forms import LoginForm, RegisterForm, UpdateProfileForm
-from werkzeug.security import generate_password_hash, check_password_hash
 from app.models import User, Habit, HabitCompletion, UserBadge, Badge
+from sqlalchemy.orm import joinedload
 from datetime import date, datetime, timedelta
-from app.utils import get_google_flow, create_google_event
+from app.utils import get_google_flow
+from app.google_integration import GoogleNotConfigured
+from app.calendar_sync import enqueue_calendar_event
+from app.dashboard import get_dashboard_data
+from app.stats import record_completion, recent_flags
+from app.gamification import evaluate_badges
+from app.cache import user_cache
+from app.identity import identity_cache
+from app.engines import read_only
+from app.conditional import conditional
+from app.rate_limits import per_user, per_ip
+from app.live import live_updates, completion_delta, added_habit_delta, renamed_habit_delta, removed_habit_delta
 import json
 
 web_bp = Blueprint('web', __name__)
@@ -20,30 +31,25 @@ def index():
     return render_template('index.html')
 
 @web_bp.route('/dashboard')
+@per_user('RATELIMIT_DASHBOARD_PER_USER')
+@per_ip()
 @login_required
+@conditional(daily=True)
+@read_only
 def dashboard():
     """Renders the user dashboard, accessible only to logged-in users."""
 
-    print(f"Current user authenticated: {current_user.is_authenticated}")
-    print(f"Current user: {current_user}")
-    user = current_user
-    habits = Habit.query.filter_by(user_id=user.id).all()
-    completions = HabitCompletion.query.filter_by(user_id=user.id).all()
-
-    today = date.today()
-    total_days = (today - user.created_at.date()).days or 1
-    habit_progress = {}
-    for habit in habits:
-        completed_days = HabitCompletion.query.filter_by(habit_id=habit.id).count()
-        progress = (completed_days / total_days) * 100
-        habit_progress[habit.id] = min(progress, 100)
-
-   google_connected = True if current_user.google_credentials else False
-   return render_template('dashboard.html', habits=habits, completions=completions, habit_progress=habit_progress, google_connected=google_connected)
+    data = get_dashboard_data(current_user)
+    google_connected = True if current_user.google_credentials else False
+    return render_template('dashboard.html', google_connected=google_connected, live_updates=live_updates.enabled, **data)
 
 
 @web_bp.route('/analytics/<int:habit_id>')
+@per_user('RATELIMIT_ANALYTICS_PER_USER')
+@per_ip()
 @login_required
+@conditional(daily=True)
+@read_only
 def habit_analytics(habit_id):
     """Displays the analytics for a specific habit
     including completions and completion rate for the last 30 days
@@ -58,18 +64,10 @@ def habit_analytics(habit_id):
 
     date_list = [start_date + timedelta(days=x) for x in range(0, 30)]
 
-    completions = HabitCompletion.query.filter(
-        HabitCompletion.habit_id == habit_id,
-        HabitCompletion.date_completed >= start_date,
-        HabitCompletion.date_completed <= today
-    ).all()
-
-    completion_dates = {completion.date_completed for completion in completions}
-
-    chart_data = [1 if single_date in completion_dates else 0 for single_date in date_list]
+    chart_data = recent_flags(habit.stats, today)
     chart_labels = [single_date.strftime('%Y-%m-%d') for single_date in date_list]
 
-    total_completions = len(completions)
+    total_completions = sum(chart_data)
     completion_rate = (total_completions / 30) * 100
 
     return render_template(
@@ -89,16 +87,19 @@ def add_habit():
 
     if request.method == 'POST':
         habit_name = request.form['habit_name']
-        new_habit = Habit(user_id=current_user.id, habit_name=habit_name)
+        user_id = current_user.id
+        new_habit = Habit(user_id=user_id, habit_name=habit_name)
         try:
             db.session.add(new_habit)
+            db.session.flush()
+            # Synchronize with Google Calendar in the background
+            if current_user.google_credentials:
+                enqueue_calendar_event(current_user, new_habit, event_type='add')
+            delta = added_habit_delta(new_habit)
             db.session.commit()
+            user_cache.bump(user_id)
+            live_updates.publish(user_id, delta)
             flash('Habit added successfully!', 'success')
-            # Synchronize with Google Calendar
-            if current_user.google_credentials:
-                event_id = create_google_event(current_user, new_habit, event_type='add')
-                new_habit.google_event_id = event_id
-                db.session.commit()
         except Exception as e:
             print(e)
             db.session.rollback()
@@ -109,32 +110,49 @@ def add_habit():
 @web_bp.route('/complete_habit/<int:habit_id>', methods=['POST'])
 @login_required
 def complete_habit(habit_id):
-    """Marks a habit as completed for the current user on the current date."""
+    """Marks a habit as completed for the current user on the current date.
+    The dashboard posts with Accept: application/json and gets the message and
+    the dashboard delta back instead of a redirect to a re-rendered dashboard.
+    """
 
+    wants_json = request.accept_mimetypes.best == 'application/json'
     habit = Habit.query.get_or_404(habit_id)
     if habit.user_id != current_user.id:
-        flash('You do not have permission to complete this habit.', 'danger')
+        message, category = 'You do not have permission to complete this habit.', 'danger'
+        if wants_json:
+            return jsonify({'message': message, 'category': category}), 403
+        flash(message, category)
         return redirect(url_for('web.dashboard'))
 
     today = date.today()
     completion = HabitCompletion.query.filter_by(habit_id=habit_id, date_completed=today).first()
 
+    delta = None
     if completion:
-        flash('Habit already completed for today!', 'warning')
+        message, category, status = 'Habit already completed for today!', 'warning', 409
     else:
-        new_completion = HabitCompletion(habit_id=habit.id, user_id=current_user.id)
+        user_id = current_user.id
+        new_completion = HabitCompletion(habit_id=habit.id, user_id=user_id, date_completed=today)
         try:
-            habit.update_streak()
             db.session.add(new_completion)
+            stats = record_completion(habit, today)
+            awarded = evaluate_badges(user_id, commit=False)
+            if current_user.google_credentials:
+                enqueue_calendar_event(current_user, habit, event_type='complete')
+            delta = completion_delta(current_user.created_at, [(habit, stats, [today])], awarded, today)
             db.session.commit()
-            # Ensure that completion does not create a new event, but modifies the existing one
-            create_google_event(current_user, habit, event_type='complete')
+            user_cache.bump(user_id)
+            live_updates.publish(user_id, delta)
 
-            flash('Habit marked as completed!', 'success')
+            message, category, status = 'Habit marked as completed!', 'success', 200
         except Exception as e:
             db.session.rollback()
-            flash('Error marking habit as completed. Please try again.', 'danger')
+            delta = None
+            message, category, status = 'Error marking habit as completed. Please try again.', 'danger', 500
 
+    if wants_json:
+        return jsonify({'message': message, 'category': category, 'delta': delta}), status
+    flash(message, category)
     return redirect(url_for('web.dashboard'))
 
 @web_bp.route('/delete_habit/<int:habit_id>', methods=['GET', 'POST'])
@@ -149,8 +167,11 @@ def delete_habit(habit_id):
 
     if request.method == 'POST':
         try:
+            user_id = habit.user_id
             db.session.delete(habit)
             db.session.commit()
+            user_cache.bump(user_id)
+            live_updates.publish(user_id, removed_habit_delta(habit_id))
             flash('Habit deleted successfully!', 'success')
             return redirect(url_for('web.dashboard'))
         except Exception as e:
@@ -172,8 +193,12 @@ def edit_habit(habit_id):
     if request.method == 'POST':
         habit_name = request.form['habit_name']
         habit.habit_name = habit_name
+        user_id = habit.user_id
+        delta = renamed_habit_delta(habit)
         try:
             db.session.commit()
+            user_cache.bump(user_id)
+            live_updates.publish(user_id, delta)
             flash('Habit updated successfully!', 'success')
             return redirect(url_for('web.dashboard'))
         except Exception as e:
@@ -191,7 +216,10 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and check_password_hash(user.password_hash, form.password.data):
+        if user and user.check_password(form.password.data):
+            if db.session.is_modified(user):
+                # The stored hash was upgraded to the current PASSWORD_HASH_METHOD
+                db.session.commit()
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             if not next_page or not next_page.startswith('/'):
@@ -217,13 +245,18 @@ def profile():
 
     form = UpdateProfileForm()
     if form.validate_on_submit():
-        if check_password_hash(current_user.password_hash, form.current_password.data):
-            current_user.username = form.username.data
-            current_user.email = form.email.data
+        # current_user is a cached snapshot; changes go through the row itself
+        user = db.session.get(User, current_user.id)
+        if user.check_password(form.current_password.data):
+            user.username = form.username.data
+            user.email = form.email.data
             if form.new_password.data:
-                current_user.password_hash = generate_password_hash(form.new_password.data)
+                user.set_password(form.new_password.data)
+            user_id = user.id
             try:
                 db.session.commit()
+                user_cache.bump(user_id)
+                identity_cache.invalidate(user_id)
                 flash('Your profile has been updated!', 'success')
                 return redirect(url_for('web.profile'))
             except Exception as e:
@@ -234,7 +267,7 @@ def profile():
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.email.data = current_user.email
-    user_badges = UserBadge.query.filter_by(user_id=current_user.id).all()
+    user_badges = UserBadge.query.options(joinedload(UserBadge.badge)).filter_by(user_id=current_user.id).all()
     return render_template('profile.html', form=form, user_badges=user_badges)
 
 
@@ -246,8 +279,8 @@ def register():
         return redirect(url_for('web.dashboard'))
     form = RegisterForm()
     if form.validate_on_submit():
-        password_hash = generate_password_hash(form.password.data)
-        new_user = User(username=form.username.data, email=form.email.data, password_hash=password_hash)
+        new_user = User(username=form.username.data, email=form.email.data)
+        new_user.set_password(form.password.data)
         try:
             db.session.add(new_user)
             db.session.commit()
@@ -264,7 +297,12 @@ def register():
 def google_auth():
     """Handles the OAuth 2.0 callback from Google, fetches credentials, and saves them for the current user."""
 
-    flow = get_google_flow()
+    try:
+        flow = get_google_flow()
+    except GoogleNotConfigured as e:
+        current_app.logger.error(e)
+        flash('Google Calendar is not available right now.', 'danger')
+        return redirect(url_for('web.dashboard'))
     authorization_url, state = flow.authorization_url(
         access_type='offline',
         include_granted_scopes='true',
@@ -282,6 +320,9 @@ def oauth2callback():
     flow = get_google_flow()
     flow.fetch_token(authorization_response=request.url)
     credentials = flow.credentials
-    current_user.set_google_credentials(credentials)
+    user_id = current_user.id
+    db.session.get(User, user_id).set_google_credentials(credentials)
     db.session.commit()
+    user_cache.bump(user_id)
+    identity_cache.invalidate(user_id)
     return redirect(url_for('web.dashboard'))
@@ -0,0 +1,7 @@
+from app.asgi import create_asgi_app
+from app.calendar_sync import start_in_process_worker
+
+"""Serves the app over ASGI, e.g. `uvicorn asgi:application --workers 4`."""
+
+application = create_asgi_app()
+start_in_process_worker(application.app)
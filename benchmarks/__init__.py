@@ -0,0 +1 @@
+"""Benchmarks for the habit tracker. Run modules with `python -m benchmarks.<name>`."""
@@ -0,0 +1,57 @@
+"""Times the range analytics for 40 habits x 2 years and checks that the
+matrix sliced from the stats histories matches the one built from a range
+query over the raw completions.
+
+    python -m benchmarks.bench_analytics
+"""
+
+import sys
+import time
+from datetime import date, timedelta
+from app import db
+from app.analytics import range_analytics, load_habits, load_matrix, history_matrix
+from app.stats import rebuild_stats
+from benchmarks.common import make_app, QueryCounter, seed_user
+
+HABITS = 40
+DAYS = 730
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def run():
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        user_id = seed_user('analyst', HABITS, DAYS, created_days_ago=DAYS + 30).id
+        rebuild_stats()
+        end = date.today()
+        start = end - timedelta(days=DAYS - 1)
+
+        habits = load_habits(user_id)
+        from_history = history_matrix(habits, start, end)
+        from_range = load_matrix(user_id, [habit.id for habit in habits], start, end)
+        if not (from_history == from_range).all():
+            print('FAIL: history matrix differs from the range query matrix.')
+            return 1
+
+        with QueryCounter(db.engine) as counter:
+            range_analytics(user_id, start, end)
+        analytics_ms = best_of(lambda: range_analytics(user_id, start, end))
+        fallback_ms = best_of(lambda: load_matrix(user_id, [habit.id for habit in habits], start, end))
+
+    print(f'{HABITS} habits x {DAYS} days')
+    print(f'range_analytics: {analytics_ms:.1f} ms, {counter.count} queries')
+    print(f'range query fallback matrix: {fallback_ms:.1f} ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
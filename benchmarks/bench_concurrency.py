@@ -0,0 +1,233 @@
+"""Concurrency benchmark: the read API under many simultaneous clients, served
+by the WSGI app on a thread pool (as a threaded WSGI server runs it) and by
+the ASGI app's native async handlers (app/asgi.py).
+
+Both tiers run in this process against the same seeded database with the
+cache disabled, so every request reaches the database and the numbers compare
+the serving models rather than a network stack. Each client sends its
+requests one after another; latency includes the time spent waiting for a
+worker thread or a pooled connection. --db-latency-ms adds a sleep to every
+SQL statement inside the driver (SQLite only), to mimic a database across a
+network where a waiting thread does nothing useful.
+
+    python -m benchmarks.bench_concurrency
+    python -m benchmarks.bench_concurrency --clients 1000 --db-latency-ms 2 --output concurrency.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app import db
+from app.asgi import AsyncAPI, wsgi_environ
+from app.models import User, Habit
+from benchmarks.common import make_full_app, api_headers
+from benchmarks.datagen import generate
+from benchmarks.load import LoadConfig, percentile
+
+
+class ConcurrencyConfig(LoadConfig):
+    CACHE_BACKEND = 'null'
+    INSTRUMENTATION_ENABLED = False
+
+
+def request_paths(habit_id):
+    return [
+        '/api/habits/',
+        f'/api/habits/{habit_id}',
+        '/api/completions/?limit=50',
+        f'/api/habits/{habit_id}/analytics',
+        '/api/analytics?include=daily,weekly',
+        '/api/gamification/user_badges',
+        '/api/gamification/leaderboards/streak',
+    ]
+
+
+def make_scopes(app, count):
+    """One GET scope per (user, path) for the first `count` users, with their JWTs."""
+    with app.app_context():
+        users = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id).limit(count)]
+        habits = dict(db.session.query(Habit.user_id, db.func.min(Habit.id)).filter(
+            Habit.user_id.in_(users)
+        ).group_by(Habit.user_id).all())
+    scopes = []
+    for user_id in users:
+        authorization = api_headers(app, user_id)['Authorization']
+        for path in request_paths(habits[user_id]):
+            path, _, query = path.partition('?')
+            scopes.append({
+                'type': 'http', 'method': 'GET', 'scheme': 'http', 'http_version': '1.1',
+                'path': path, 'root_path': '', 'query_string': query.encode(),
+                'headers': [(b'authorization', authorization.encode()), (b'host', b'localhost')],
+            })
+    return scopes
+
+
+def add_db_latency(engine, seconds, async_driver=False):
+    """Sleeps `seconds` in the driver before every statement on new connections of `engine`."""
+    def sleep(statement):
+        time.sleep(seconds)
+
+    @event.listens_for(engine, 'connect')
+    def install(dbapi_connection, connection_record):
+        if async_driver:
+            # aiosqlite runs sqlite3 on its own thread; the callback must be set there
+            dbapi_connection.run_async(lambda conn: conn._execute(conn._conn.set_trace_callback, sleep))
+        else:
+            dbapi_connection.set_trace_callback(sleep)
+
+
+def wsgi_caller(app, executor):
+    def handle(scope):
+        status = {}
+
+        def start_response(line, headers, exc_info=None):
+            status['code'] = int(line.split(' ', 1)[0])
+        iterable = app(wsgi_environ(scope, b''), start_response)
+        try:
+            body = b''.join(iterable)
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        return status['code'], body
+
+    async def call(scope):
+        return await asyncio.get_running_loop().run_in_executor(executor, handle, scope)
+    return call
+
+
+def asgi_caller(api):
+    async def call(scope):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+        await api(scope, receive, send)
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+    return call
+
+
+async def drive(call, scopes, clients, per_client):
+    timings, statuses = [], Counter()
+
+    async def client(number):
+        for i in range(per_client):
+            scope = scopes[(number * per_client + i) % len(scopes)]
+            start = time.perf_counter()
+            status, _ = await call(scope)
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses[status] += 1
+
+    # Warm up every route once, so one-off work (leaderboard build, compiled queries) is not timed
+    for scope in scopes[:len(request_paths(0))]:
+        await call(scope)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    wall = time.perf_counter() - start
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(timings) / wall, 1),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p90_ms': round(percentile(timings, 0.90), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'threads': threading.active_count(),
+    }
+
+
+def run(args):
+    directory = None
+    database_uri = args.database_uri
+    if not database_uri:
+        directory = tempfile.mkdtemp(prefix='bench-concurrency-')
+        database_uri = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+    class Config(ConcurrencyConfig):
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': args.pool_size, 'max_overflow': 0}
+        # aiosqlite defaults to NullPool, which would open a connection (and a thread) per request
+        ASYNC_SQLALCHEMY_ENGINE_OPTIONS = {'poolclass': AsyncAdaptedQueuePool, 'pool_size': args.pool_size, 'max_overflow': 0}
+
+    try:
+        app = make_full_app(database_uri, Config)
+        with app.app_context():
+            db.create_all()
+            if not args.reuse or User.query.first() is None:
+                started = time.perf_counter()
+                counts = generate(args.users, args.habits, args.days, args.density)
+                print(f"Seeded {counts['users']} users, {counts['habits']} habits, {counts['completions']} completions "
+                      f"in {time.perf_counter() - started:.1f}s")
+            # Drop the seeding connections so --db-latency-ms applies to every pooled one
+            db.engine.dispose()
+            engine = db.engine
+        scopes = make_scopes(app, args.users)
+        api = AsyncAPI(app)
+        if args.db_latency_ms:
+            add_db_latency(engine, args.db_latency_ms / 1000)
+            add_db_latency(api.db.engines[None].sync_engine, args.db_latency_ms / 1000, async_driver=True)
+
+        results = {}
+        executor = ThreadPoolExecutor(args.threads, thread_name_prefix='wsgi')
+        results['wsgi'] = asyncio.run(drive(wsgi_caller(app, executor), scopes, args.clients, args.requests))
+        executor.shutdown()
+        results['asgi'] = asyncio.run(drive(asgi_caller(api), scopes, args.clients, args.requests))
+        asyncio.run(api.db.dispose())
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{args.clients} concurrent clients x {args.requests} requests, {args.threads} WSGI threads, "
+          f"pool size {args.pool_size}, db latency {args.db_latency_ms} ms")
+    print(f"{'tier':<6} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'threads':>8}  statuses")
+    for tier, result in results.items():
+        print(f"{tier:<6} {result['throughput_rps']:>9.1f} {result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['max_ms']:>9.2f} {result['threads']:>8}  {result['statuses']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(),
+                'clients': args.clients, 'requests_per_client': args.requests, 'wsgi_threads': args.threads,
+                'pool_size': args.pool_size, 'db_latency_ms': args.db_latency_ms,
+                'dataset': {'users': args.users, 'habits': args.habits, 'days': args.days, 'density': args.density},
+                'results': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.output}')
+
+    errors = [tier for tier, result in results.items() if set(result['statuses']) != {'200'}]
+    for tier in errors:
+        print(f"ERROR: {tier} returned {results[tier]['statuses']}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='Database to use; defaults to a temporary SQLite file.')
+    parser.add_argument('--reuse', action='store_true', help='Use the data already in the database if present.')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--habits', type=int, default=10, help='Habits per user.')
+    parser.add_argument('--days', type=int, default=180, help='Days of history per habit.')
+    parser.add_argument('--density', type=float, default=0.7, help='Share of days with a completion.')
+    parser.add_argument('--clients', type=int, default=1000, help='Concurrent clients.')
+    parser.add_argument('--requests', type=int, default=5, help='Requests per client.')
+    parser.add_argument('--threads', type=int, default=32, help='Worker threads of the WSGI tier.')
+    parser.add_argument('--pool-size', type=int, default=32, help='Connection pool size of both tiers.')
+    parser.add_argument('--db-latency-ms', type=float, default=0, help='Sleep added to every SQL statement (SQLite only).')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    sys.exit(run(parser.parse_args()))
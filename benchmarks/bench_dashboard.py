@@ -0,0 +1,41 @@
+"""Shows that the dashboard aggregation runs a constant number of queries
+as the number of habits grows.
+
+    python -m benchmarks.bench_dashboard
+"""
+
+import sys
+from app import db
+from app.dashboard import get_dashboard_data
+from benchmarks.common import make_app, QueryCounter, timer, seed_user
+
+HABIT_COUNTS = (1, 10, 50, 200)
+DAYS = 60
+
+
+def run():
+    app = make_app()
+    rows = []
+    with app.app_context():
+        db.create_all()
+        for habit_count in HABIT_COUNTS:
+            user = seed_user(f'user{habit_count}', habit_count, DAYS)
+            db.session.refresh(user)
+            timings = {}
+            with QueryCounter(db.engine) as counter, timer(timings, 'ms'):
+                get_dashboard_data(user)
+            rows.append((habit_count, counter.count, timings['ms']))
+
+    print(f"{'habits':>8} {'queries':>8} {'ms':>10}")
+    for habit_count, queries, ms in rows:
+        print(f'{habit_count:>8} {queries:>8} {ms:>10.2f}')
+
+    query_counts = {queries for _, queries, _ in rows}
+    if len(query_counts) != 1:
+        print('FAIL: query count grows with the number of habits.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
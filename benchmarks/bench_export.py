@@ -0,0 +1,152 @@
+"""Export throughput: every completion of every user written to CSV and XLSX
+by app/export.py, from a table of --rows completions (10M by default).
+
+Each export runs in a fresh interpreter so its peak memory can be reported;
+the streaming exports must stay under --max-rss-mb however large the table is.
+--buffered adds the old approach (.all() then write) for comparison; at 10M
+rows it needs several GB. The table is seeded once into a SQLite file (or
+--database-uri) and kept with --reuse.
+
+    python -m benchmarks.bench_export
+    python -m benchmarks.bench_export --rows 1000000 --buffered
+    python -m benchmarks.bench_export --database-uri sqlite:////tmp/export.db --reuse --formats csv
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import Habit, HabitCompletion
+from benchmarks.common import make_app
+from benchmarks.datagen import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPORT = """
+import csv, json, os, resource, time
+from collections import Counter
+from benchmarks.common import make_app
+from app import db
+from app.export import DATASETS, csv_chunks, export_select, write_xlsx
+app = make_app({database_uri!r})
+with app.app_context():
+    db.session.execute(db.text('SELECT 1'))
+    base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    totals = Counter()
+    start = time.perf_counter()
+    if {mode!r} == 'csv':
+        with open({output!r}, 'w', newline='', encoding='utf-8') as f:
+            for chunk in csv_chunks('completions', None, {batch_size!r}, totals):
+                f.write(chunk)
+    elif {mode!r} == 'xlsx':
+        write_xlsx({output!r}, ['completions'], None, {batch_size!r}, totals)
+    else:
+        rows = db.session.execute(export_select('completions')).all()
+        totals['completions'] = len(rows)
+        with open({output!r}, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow([header for header, _ in DATASETS['completions']])
+            writer.writerows(rows)
+    elapsed = time.perf_counter() - start
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'rows': totals['completions'], 'seconds': elapsed, 'rows_per_s': totals['completions'] / elapsed,
+    'peak_growth_mb': (peak_kb - base_kb) / 1024, 'file_mb': os.path.getsize({output!r}) / 2 ** 20,
+}}))
+"""
+
+
+def seed(rows, users, habits):
+    """Creates users x habits habits, then `rows` completions spread evenly over
+    them on consecutive days, inserted without rebuilding the derived columns."""
+    generate(users, habits, 0)
+    habit_rows = db.session.query(Habit.id, Habit.user_id).order_by(Habit.id).all()
+    days = math.ceil(rows / len(habit_rows))
+    today = date.today()
+    batch, inserted = [], 0
+    for d in range(days):
+        day = today - timedelta(days=d)
+        for habit_id, user_id in habit_rows:
+            if inserted + len(batch) == rows:
+                break
+            batch.append({'habit_id': habit_id, 'user_id': user_id, 'date_completed': day})
+            if len(batch) == 50000:
+                db.session.execute(HabitCompletion.__table__.insert(), batch)
+                inserted += len(batch)
+                batch = []
+    if batch:
+        db.session.execute(HabitCompletion.__table__.insert(), batch)
+        inserted += len(batch)
+    db.session.commit()
+    return inserted
+
+
+def export(database_uri, mode, output, batch_size):
+    result = subprocess.run(
+        [sys.executable, '-c', EXPORT.format(database_uri=database_uri, mode=mode, output=output, batch_size=batch_size)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(result.strip().splitlines()[-1])
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix='bench-export-')
+    database_uri = args.database_uri or f"sqlite:///{os.path.join(directory, 'export.db')}"
+    try:
+        app = make_app(database_uri)
+        with app.app_context():
+            db.create_all()
+            if not args.reuse or HabitCompletion.query.first() is None:
+                started = time.perf_counter()
+                inserted = seed(args.rows, args.users, args.habits)
+                print(f'Seeded {inserted:,} completions in {time.perf_counter() - started:.1f}s')
+
+        modes = args.formats.split(',') + (['buffered'] if args.buffered else [])
+        results = {}
+        for mode in modes:
+            output = os.path.join(directory, f"export-{mode}.{'xlsx' if mode == 'xlsx' else 'csv'}")
+            results[mode] = export(database_uri, mode, output, args.batch_size)
+            os.remove(output)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{'export':<10} {'rows':>12} {'seconds':>9} {'rows/s':>11} {'peak MB':>9} {'file MB':>9}")
+    for mode, result in results.items():
+        print(f"{mode:<10} {result['rows']:>12,} {result['seconds']:>9.1f} {result['rows_per_s']:>11,.0f} "
+              f"{result['peak_growth_mb']:>9.1f} {result['file_mb']:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(), 'batch_size': args.batch_size, 'results': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.output}')
+
+    failures = [mode for mode in modes if mode != 'buffered' and results[mode]['peak_growth_mb'] > args.max_rss_mb]
+    for mode in failures:
+        print(f"FAIL: the {mode} export grew the process by {results[mode]['peak_growth_mb']:.0f} MB "
+              f"(limit {args.max_rss_mb} MB).")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='Database to use; defaults to a temporary SQLite file.')
+    parser.add_argument('--reuse', action='store_true', help='Use the completions already in the database if present.')
+    parser.add_argument('--rows', type=int, default=10_000_000, help='Completions to seed.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--habits', type=int, default=10, help='Habits per user.')
+    parser.add_argument('--formats', default='csv,xlsx', help='Comma-separated streaming exports to time.')
+    parser.add_argument('--buffered', action='store_true', help='Also time loading every row with .all() first.')
+    parser.add_argument('--batch-size', type=int, default=5000, help='Rows per round trip.')
+    parser.add_argument('--max-rss-mb', type=float, default=150, help='Peak memory growth allowed for a streaming export.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""Measures cold start: importing the app and running create_app() in a fresh
+interpreter, with the Google libraries left for first use (the default) and
+with them imported up front as startup used to do. Also times the first
+Google OAuth flow, which is where the deferred cost is now paid.
+
+    python -m benchmarks.bench_import
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = 7
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOOGLE_MODULES = (
+    'google.oauth2.credentials', 'google_auth_oauthlib.flow',
+    'googleapiclient.discovery', 'google.auth.transport.requests',
+)
+
+STARTUP = """
+import json, sys, time
+start = time.perf_counter()
+for name in {preload!r}:
+    __import__(name)
+from benchmarks.common import make_full_app
+app = make_full_app()
+elapsed = (time.perf_counter() - start) * 1000
+loaded = sorted(name for name in sys.modules if name.split('.')[0] in ('google', 'googleapiclient', 'google_auth_oauthlib'))
+result = {{'ms': elapsed, 'google_modules': len(loaded)}}
+if {first_use!r}:
+    from app.google_integration import google_integration
+    with app.test_request_context():
+        start = time.perf_counter()
+        google_integration.flow('http://localhost/oauth2callback')
+        result['first_flow_ms'] = (time.perf_counter() - start) * 1000
+print(json.dumps(result))
+"""
+
+
+def measure(preload=(), first_use=False, env=None):
+    results = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP.format(preload=list(preload), first_use=first_use)],
+            cwd=ROOT, env=dict(os.environ, **(env or {})), capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    summary = {'ms': statistics.median(result['ms'] for result in results), 'google_modules': results[0]['google_modules']}
+    if first_use:
+        summary['first_flow_ms'] = statistics.median(result['first_flow_ms'] for result in results)
+    return summary
+
+
+def run():
+    # The lazy run points at a file that does not exist: startup must not need it
+    lazy = measure(env={'GOOGLE_CREDENTIALS_FILE': os.path.join(ROOT, 'missing-credentials.json')})
+    eager = measure(preload=GOOGLE_MODULES)
+
+    credentials = os.path.join(ROOT, 'benchmark-credentials.json')
+    with open(credentials, 'w') as f:
+        json.dump({'web': {
+            'client_id': 'benchmark', 'client_secret': 'benchmark', 'redirect_uris': ['http://localhost/oauth2callback'],
+            'auth_uri': 'https://accounts.google.com/o/oauth2/auth', 'token_uri': 'https://oauth2.googleapis.com/token',
+        }}, f)
+    try:
+        first_use = measure(first_use=True, env={'GOOGLE_CREDENTIALS_FILE': credentials})
+    finally:
+        os.remove(credentials)
+
+    print(f'median of {RUNS} fresh interpreters')
+    print(f"{'startup':<40} {'ms':>8} {'google modules':>15}")
+    print(f"{'create_app, Google loaded on first use':<40} {lazy['ms']:>8.1f} {lazy['google_modules']:>15}")
+    print(f"{'create_app, Google imported up front':<40} {eager['ms']:>8.1f} {eager['google_modules']:>15}")
+    print(f"saved per cold start: {eager['ms'] - lazy['ms']:.1f} ms ({(1 - lazy['ms'] / eager['ms']) * 100:.0f}%)")
+    print(f"first OAuth flow after startup: {first_use['first_flow_ms']:.1f} ms")
+    if lazy['google_modules']:
+        print('FAIL: create_app() imported Google modules.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,148 @@
+"""Login throughput under concurrency: a burst of POST /api/auth/login calls
+from many clients, with password hashing on the request threads
+(PASSWORD_HASH_WORKERS=0) and in the hashing process pool (app/passwords.py).
+
+Requests run on a thread pool, as a threaded WSGI server runs them. While the
+burst lasts, a probe client keeps calling a cheap cached endpoint
+(GET /api/habits/) to show how much the logins slow everyone else down.
+
+    python -m benchmarks.bench_login
+    python -m benchmarks.bench_login --logins 400 --clients 64 --workers 4 --method scrypt:16384:8:1
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Habit
+from app.passwords import password_hasher
+from benchmarks.common import BenchmarkConfig, make_full_app, api_headers
+from benchmarks.load import percentile
+
+PASSWORD = 'benchmark-password'
+
+
+def seed(users, method):
+    password_hash = generate_password_hash(PASSWORD, method)
+    db.session.add_all([
+        User(username=f'login{i}', email=f'login{i}@example.com', password_hash=password_hash) for i in range(users)
+    ])
+    db.session.flush()
+    db.session.add(Habit(user_id=User.query.first().id, habit_name='Probe'))
+    db.session.commit()
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        'count': len(timings),
+        'p50_ms': round(percentile(timings, 0.50), 1),
+        'p99_ms': round(percentile(timings, 0.99), 1),
+        'max_ms': round(timings[-1], 1),
+    }
+
+
+def burst(app, args):
+    """Sends args.logins logins from args.clients concurrent clients while probing; returns the results."""
+    headers = api_headers(app, 1)
+    login_timings, probe_timings, statuses = [], [], {}
+    done = threading.Event()
+
+    def login(i):
+        start = time.perf_counter()
+        response = app.test_client().post('/api/auth/login', json={'username': f'login{i % args.users}', 'password': PASSWORD})
+        login_timings.append((time.perf_counter() - start) * 1000)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    def probe():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/api/habits/', headers=headers)
+            probe_timings.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+    # Start the pool and fill the caches before timing
+    login(0)
+    app.test_client().get('/api/habits/', headers=headers)
+    login_timings.clear()
+    statuses.clear()
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as executor:
+        list(executor.map(login, range(args.logins)))
+    wall = time.perf_counter() - start
+    done.set()
+    prober.join()
+    return {
+        'logins_per_s': round(len(login_timings) / wall, 1),
+        'wall_s': round(wall, 2),
+        'login': summary(login_timings),
+        'probe': summary(probe_timings),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run(args):
+    results = {}
+    for tier, workers in (('inline', 0), ('pool', args.workers)):
+        class Config(BenchmarkConfig):
+            PASSWORD_HASH_METHOD = args.method
+            PASSWORD_HASH_WORKERS = workers
+            PASSWORD_HASH_MAX_PENDING = args.logins
+            PASSWORD_HASH_QUEUE_TIMEOUT = 600
+            # One connection per client thread; SQLite in memory is per connection, so use a file
+            SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'check_same_thread': False}}
+
+        path = f'/tmp/bench-login-{os.getpid()}.db'
+        try:
+            app = make_full_app(f'sqlite:///{path}', Config)
+            with app.app_context():
+                db.create_all()
+                seed(args.users, args.method)
+            results[tier] = burst(app, args)
+        finally:
+            password_hasher.shutdown()
+            if os.path.exists(path):
+                os.remove(path)
+
+    print(f"{args.logins} logins from {args.clients} concurrent clients, {args.method}, "
+          f"{args.workers} hashing processes, {os.cpu_count()} CPUs")
+    print(f"{'hashing':<8} {'logins/s':>9} {'login p50':>10} {'login p99':>10} {'probe p50':>10} {'probe p99':>10}  statuses")
+    for tier, result in results.items():
+        print(f"{tier:<8} {result['logins_per_s']:>9.1f} {result['login']['p50_ms']:>10.1f} {result['login']['p99_ms']:>10.1f} "
+              f"{result['probe']['p50_ms']:>10.1f} {result['probe']['p99_ms']:>10.1f}  {result['statuses']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(), 'method': args.method, 'logins': args.logins,
+                'clients': args.clients, 'workers': args.workers, 'cpus': os.cpu_count(), 'results': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.output}')
+
+    errors = [tier for tier, result in results.items() if set(result['statuses']) != {'200'}]
+    for tier in errors:
+        print(f"ERROR: {tier} returned {results[tier]['statuses']}")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=32, help='Concurrent clients (request threads).')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 2) // 2, 1),
+                        help='Hashing processes of the pool tier.')
+    parser.add_argument('--method', default=BenchmarkConfig.PASSWORD_HASH_METHOD, help='Werkzeug hashing method.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    sys.exit(run(parser.parse_args()))
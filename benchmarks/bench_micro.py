@@ -0,0 +1,126 @@
+"""Micro-benchmarks for Habit.update_streak, check_and_award_badges and the
+Marshmallow schemas, reported as per-call timings in microseconds.
+
+    python -m benchmarks.bench_micro
+    python -m benchmarks.bench_micro --output micro.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import Habit, HabitCompletion, Badge, UserBadge
+from app.gamification import check_and_award_badges
+from app.schemas import HabitSchema, HabitCompletionSchema, UserBadgeSchema, UserSchema
+from app.stats import rebuild_stats
+from benchmarks.common import make_app, seed_user
+
+
+def measure(fn, number=1000, setup=None):
+    """Calls fn `number` times, timing each call; `setup` runs untimed before each call."""
+    samples = []
+    for _ in range(number):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'calls': number,
+        'min_us': round(samples[0], 2),
+        'median_us': round(statistics.median(samples), 2),
+        'p95_us': round(samples[int(len(samples) * 0.95) - 1], 2),
+    }
+
+
+def streak_cases():
+    today = date.today()
+    habit = Habit(habit_name='Streak', current_streak=0, longest_streak=0)
+    states = {
+        'update_streak.first': (0, 0, None),
+        'update_streak.consecutive': (10, 10, today - timedelta(days=1)),
+        'update_streak.after_gap': (10, 10, today - timedelta(days=5)),
+        'update_streak.same_day': (10, 10, today),
+    }
+
+    def reset(state):
+        def setup():
+            habit.current_streak, habit.longest_streak, habit.last_completed = state
+        return setup
+    return [(name, habit.update_streak, reset(state), 10000) for name, state in states.items()]
+
+
+def badge_cases():
+    """Users in three situations: every badge earned, nothing earned yet but
+    nothing qualifies, and every badge newly awarded on each call."""
+    earned = seed_user('earned', 5, 40)
+    idle = seed_user('idle', 5, 0)
+    qualifying = seed_user('qualifying', 5, 40)
+    rebuild_stats()
+    badge_ids = [badge.id for badge in Badge.query]
+    db.session.add_all([UserBadge(user_id=earned.id, badge_id=badge_id) for badge_id in badge_ids])
+    db.session.commit()
+    earned_id, idle_id, qualifying_id = earned.id, idle.id, qualifying.id
+
+    def revoke():
+        UserBadge.query.filter_by(user_id=qualifying_id).delete()
+        db.session.commit()
+    return [
+        ('check_and_award_badges.all_earned', lambda: check_and_award_badges(earned_id), None, 500),
+        ('check_and_award_badges.none_qualify', lambda: check_and_award_badges(idle_id), None, 500),
+        ('check_and_award_badges.award', lambda: check_and_award_badges(qualifying_id), revoke, 200),
+    ]
+
+
+def schema_cases():
+    user = seed_user('schemas', 100, 10)
+    db.session.add(UserBadge(user_id=user.id, badge_id=Badge.query.first().id, earned_at=datetime.utcnow()))
+    db.session.commit()
+    habits = Habit.query.filter_by(user_id=user.id).order_by(Habit.id).all()
+    completions = HabitCompletion.query.filter_by(user_id=user.id).order_by(HabitCompletion.id).all()
+    user_badges = UserBadge.query.filter_by(user_id=user.id).all()
+    habit_schema, habits_schema = HabitSchema(session=db.session), HabitSchema(many=True)
+    completions_schema, user_badges_schema = HabitCompletionSchema(many=True), UserBadgeSchema(many=True)
+    user_schema = UserSchema(session=db.session)
+    registration = {'username': 'someone', 'email': 'someone@example.com', 'password': 'secret-password'}
+    return [
+        ('HabitSchema.dump', lambda: habit_schema.dump(habits[0]), None, 2000),
+        (f'HabitSchema.dump_many[{len(habits)}]', lambda: habits_schema.dump(habits), None, 100),
+        ('HabitSchema.validate', lambda: habit_schema.validate({'habit_name': 'Read'}), None, 2000),
+        (f'HabitCompletionSchema.dump_many[{len(completions)}]', lambda: completions_schema.dump(completions), None, 50),
+        (f'UserBadgeSchema.dump_many[{len(user_badges)}]', lambda: user_badges_schema.dump(user_badges), None, 2000),
+        ('UserSchema.validate', lambda: user_schema.validate(registration), None, 2000),
+    ]
+
+
+def run(output=None):
+    app = make_app()
+    results = {}
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Badge(name=name, description=name) for name in ('Beginner', 'Consistency', 'Pro')])
+        db.session.commit()
+        cases = streak_cases() + badge_cases() + schema_cases()
+
+        print(f"{'benchmark':<44} {'calls':>6} {'min us':>9} {'median us':>10} {'p95 us':>9}")
+        for name, fn, setup, number in cases:
+            fn()  # warm up caches and compiled serializers
+            result = results[name] = measure(fn, number, setup)
+            print(f"{name:<44} {number:>6} {result['min_us']:>9.1f} {result['median_us']:>10.1f} {result['p95_us']:>9.1f}")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'created_at': datetime.utcnow().isoformat(), 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    sys.exit(run(parser.parse_args().output))
@@ -0,0 +1,78 @@
+"""Checks that the fast serializers match the Marshmallow schemas and compares
+their speed on 10k rows.
+
+    python -m benchmarks.bench_serializers
+"""
+
+import sys
+import time
+from datetime import datetime
+from app import db
+from app.models import Habit, HabitCompletion, Badge, UserBadge
+from app.schemas import HabitSchema, HabitCompletionSchema, UserBadgeSchema
+from app.serializers import (
+    HABIT_COLUMNS, COMPLETION_COLUMNS, habit_rows, user_badge_rows,
+    serialize_habit, serialize_completion, serialize_user_badge
+)
+from benchmarks.common import make_app, seed_user
+
+ROWS = 10000
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def run():
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        # 100 habits x 100 days = 10k completions
+        user = seed_user('bench', 100, ROWS // 100)
+        db.session.add_all([Habit(user_id=user.id, habit_name=f'Extra {i}') for i in range(ROWS - 100)])
+        badges = [Badge(name=f'Badge {i}', description='Earned it', icon='beginner.png') for i in range(ROWS)]
+        db.session.add_all(badges)
+        db.session.flush()
+        db.session.add_all([UserBadge(user_id=user.id, badge_id=badge.id, earned_at=datetime.utcnow()) for badge in badges])
+        db.session.commit()
+        user_id = user.id
+
+        cases = [
+            ('habits', HabitSchema(many=True),
+             lambda: Habit.query.filter_by(user_id=user_id).order_by(Habit.id).all(),
+             lambda: [serialize_habit(row) for row in habit_rows(Habit.user_id == user_id)]),
+            ('completions', HabitCompletionSchema(many=True),
+             lambda: HabitCompletion.query.filter_by(user_id=user_id).order_by(HabitCompletion.id).all(),
+             lambda: [serialize_completion(row) for row in db.session.execute(
+                 db.select(*COMPLETION_COLUMNS).where(HabitCompletion.user_id == user_id).order_by(HabitCompletion.id)
+             )]),
+            ('user_badges', UserBadgeSchema(many=True),
+             lambda: UserBadge.query.filter_by(user_id=user_id).order_by(UserBadge.id).all(),
+             lambda: [serialize_user_badge(row) for row in user_badge_rows(user_id)]),
+        ]
+
+        failed = False
+        print(f"{'endpoint':<12} {'rows':>6} {'schema ms':>10} {'fast ms':>9} {'speedup':>8}")
+        for name, schema, load, fast in cases:
+            db.session.expunge_all()
+            expected = schema.dump(load())
+            if fast() != expected:
+                print(f'FAIL: {name} fast serializer output differs from {type(schema).__name__}.')
+                failed = True
+
+            def slow():
+                db.session.expunge_all()
+                return schema.dump(load())
+            schema_ms = best_of(slow)
+            fast_ms = best_of(fast)
+            print(f'{name:<12} {len(expected):>6} {schema_ms:>10.1f} {fast_ms:>9.1f} {schema_ms / fast_ms:>7.1f}x')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,130 @@
+"""Calendar outbox check: drains queued events against a fake Calendar API.
+
+Three habits are queued through enqueue_calendar_event and sent by
+CalendarOutboxWorker to benchmarks/fake_calendar.py, through the real Google
+client:
+- one insert succeeds first time and stores the returned event id
+- one gets 503 then 500 and succeeds on the third attempt, each retry waiting
+  at least the shortest jittered backoff
+- one always gets 503 and is marked failed after CALENDAR_OUTBOX_MAX_ATTEMPTS,
+  and is not sent again
+
+    python -m benchmarks.calendar_outbox
+"""
+
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from app import db
+from app.calendar_sync import CalendarOutboxWorker, enqueue_calendar_event
+from app.models import CalendarOutbox, Habit
+from benchmarks.common import BenchmarkConfig, make_full_app, seed_user
+from benchmarks.fake_calendar import FakeCalendar
+
+OK, FLAKY, DOWN = 'Outbox ok', 'Outbox flaky', 'Outbox down'
+SCRIPT = {OK: [], FLAKY: [503, 500], DOWN: None}
+
+
+class OutboxConfig(BenchmarkConfig):
+    CALENDAR_OUTBOX_MAX_ATTEMPTS = 3
+    CALENDAR_OUTBOX_BACKOFF_BASE = 0.2  # Seconds; the retries below wait 0.1-0.2s and 0.2-0.4s
+    CALENDAR_OUTBOX_BACKOFF_MAX = 1
+    CALENDAR_OUTBOX_POLL_INTERVAL = 0.05
+
+
+def fake_credentials():
+    """Authorized-user credentials with a token that stays valid, so nothing is refreshed."""
+    expiry = datetime.utcnow() + timedelta(days=1)
+    return json.dumps({
+        'token': 'fake-token', 'refresh_token': 'fake-refresh-token',
+        'client_id': 'fake-client', 'client_secret': 'fake-secret',
+        'expiry': expiry.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    })
+
+
+def enqueue(app):
+    """Queues one insert per scripted habit; returns {summary: outbox id}."""
+    with app.app_context():
+        db.create_all()
+        user = seed_user('calendar', 0, 0)
+        user.google_credentials = fake_credentials()
+        entries = {}
+        for summary in SCRIPT:
+            habit = Habit(user_id=user.id, habit_name=summary)
+            db.session.add(habit)
+            db.session.flush()
+            entries[summary] = enqueue_calendar_event(user, habit)
+        db.session.commit()
+        return {summary: entry.id for summary, entry in entries.items()}
+
+
+def drain_until_settled(app, worker, timeout=30):
+    """Drains repeatedly, letting retries come due, until no row is pending."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        worker.drain()
+        with app.app_context():
+            if not CalendarOutbox.query.filter(CalendarOutbox.status.in_(('pending', 'in_progress'))).count():
+                return True
+        time.sleep(app.config['CALENDAR_OUTBOX_POLL_INTERVAL'])
+    return False
+
+
+def check(entry, requests, expected_status, expected_attempts, config):
+    statuses = [status for status, _ in requests]
+    failures = []
+    if entry.status != expected_status:
+        failures.append(f'status {entry.status}, expected {expected_status}')
+    if entry.attempts != expected_attempts:
+        failures.append(f'{entry.attempts} failed attempts, expected {expected_attempts}')
+    if len(requests) != expected_attempts + (expected_status == 'done'):
+        failures.append(f'{len(requests)} requests {statuses}')
+    if expected_status == 'done' and not (entry.event_id or '').startswith('fake-event-'):
+        failures.append(f'event id {entry.event_id!r} was not stored')
+    if expected_status == 'failed' and '503' not in (entry.last_error or ''):
+        failures.append(f'last error {entry.last_error!r} does not name the 503')
+    for attempt, ((_, previous), (_, current)) in enumerate(zip(requests, requests[1:]), 1):
+        shortest = min(config['CALENDAR_OUTBOX_BACKOFF_MAX'], config['CALENDAR_OUTBOX_BACKOFF_BASE'] * 2 ** (attempt - 1)) * 0.5
+        if current - previous < shortest:
+            failures.append(f'retry {attempt} came after {current - previous:.2f}s, backoff is at least {shortest:.2f}s')
+    return failures
+
+
+def run():
+    with FakeCalendar(script=SCRIPT) as fake:
+        class Config(OutboxConfig):
+            GOOGLE_CALENDAR_API_ENDPOINT = fake.url
+        app = make_full_app(config_class=Config)
+        ids = enqueue(app)
+        worker = CalendarOutboxWorker(app)
+        try:
+            settled = drain_until_settled(app, worker)
+            # The failed row must stay failed: nothing is sent once the backoff cap has passed
+            sent = len(fake.requests)
+            time.sleep(app.config['CALENDAR_OUTBOX_BACKOFF_MAX'])
+            worker.drain()
+            resent = len(fake.requests) - sent
+        finally:
+            worker.stop()
+
+        failures = [] if settled else ['outbox did not settle within 30s']
+        if resent:
+            failures.append(f'{resent} requests sent after every row had settled')
+        expected = {OK: ('done', 0), FLAKY: ('done', 2), DOWN: ('failed', app.config['CALENDAR_OUTBOX_MAX_ATTEMPTS'])}
+        print(f"{'habit':<14} {'status':<8} {'attempts':>8} {'requests':<16} event_id")
+        with app.app_context():
+            for summary, (status, attempts) in expected.items():
+                entry = db.session.get(CalendarOutbox, ids[summary])
+                requests = fake.requests_for(summary)
+                statuses = ','.join(str(code) for code, _ in requests)
+                print(f'{summary:<14} {entry.status:<8} {entry.attempts:>8} {statuses:<16} {entry.event_id or "-"}')
+                failures.extend(f'{summary}: {problem}' for problem in check(entry, requests, status, attempts, app.config))
+
+    for failure in failures:
+        print('FAIL:', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,114 @@
+"""Shared helpers for the benchmark scripts: a lightweight app factory and a SQL query counter."""
+
+import time
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+from flask import Flask
+from sqlalchemy import event
+from config import Config
+from app import db
+
+
+class BenchmarkConfig(Config):
+    """Config used by the benchmarks; defaults to an in-memory SQLite database."""
+
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    CALENDAR_WORKER_IN_PROCESS = False
+    RATELIMIT_ENABLED = False
+    CACHE_BACKEND = 'lru'  # One process, so the in-process cache is consistent
+    CONDITIONAL_GET_LRU = True
+
+
+def make_app(database_uri=None, config_class=BenchmarkConfig):
+    """Creates a minimal app with only the database extension initialized,
+    so benchmarks measure the code under test and not the blueprints.
+    """
+    app = Flask('benchmarks')
+    app.config.from_object(config_class)
+    if database_uri:
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    db.init_app(app)
+    return app
+
+
+def make_full_app(database_uri=None, config_class=BenchmarkConfig):
+    """Creates the complete application (all blueprints) for endpoint benchmarks."""
+    from app import create_app
+
+    class Config(config_class):
+        pass
+    if database_uri:
+        Config.SQLALCHEMY_DATABASE_URI = database_uri
+    return create_app(Config)
+
+
+def login_web(client, username, password):
+    """Logs the test client in through the web login form."""
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302, 'web login failed'
+
+
+def api_headers(app, user_id):
+    """Returns an Authorization header carrying a JWT for the user."""
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+
+class QueryCounter:
+    """Counts SQL statements executed against an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self.executions = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+        self.executions.append((statement, parameters, executemany))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+@contextmanager
+def timer(results, key):
+    """Stores the elapsed wall time in milliseconds under results[key]."""
+    start = time.perf_counter()
+    yield
+    results[key] = (time.perf_counter() - start) * 1000
+
+
+def seed_user(username, habit_count, days, created_days_ago=None, password=None):
+    """Creates a user with `habit_count` habits, each completed on every one of the last `days` days."""
+    from app.models import User, Habit, HabitCompletion
+
+    today = date.today()
+    created_days_ago = created_days_ago or days
+    user = User(username=username, email=f'{username}@example.com', password_hash='x',
+                created_at=datetime.utcnow() - timedelta(days=created_days_ago))
+    if password:
+        user.set_password(password)
+    db.session.add(user)
+    db.session.flush()
+    habits = [Habit(user_id=user.id, habit_name=f'Habit {i}') for i in range(habit_count)]
+    db.session.add_all(habits)
+    db.session.flush()
+    rows = [
+        {'habit_id': habit.id, 'user_id': user.id, 'date_completed': today - timedelta(days=d)}
+        for habit in habits for d in range(days)
+    ]
+    if rows:
+        db.session.execute(HabitCompletion.__table__.insert(), rows)
+    db.session.commit()
+    return user
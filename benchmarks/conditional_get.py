@@ -0,0 +1,149 @@
+"""Conditional GET check: a poll with a current ETag costs zero queries.
+
+Every @conditional() endpoint is requested once, then again with the ETag it
+returned in If-None-Match. The second request must get 304 Not Modified while
+no statement runs on the database, through the Flask app and, for the
+endpoints it serves natively, through the ASGI app. After a write, the old
+ETag must get a 200 with a new one again.
+
+    python -m benchmarks.conditional_get
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from app import db
+from app.asgi import AsyncAPI, NATIVE_ENDPOINTS
+from app.models import Habit, HabitCompletion
+from app.stats import rebuild_stats
+from benchmarks.common import BenchmarkConfig, QueryCounter, api_headers, login_web, make_full_app, seed_user
+
+PASSWORD = 'benchmark-password'
+
+
+class ConditionalConfig(BenchmarkConfig):
+    CONDITIONAL_GET_ENABLED = True
+    CONDITIONAL_GET_LRU = True
+
+
+def seed(app):
+    with app.app_context():
+        db.create_all()
+        user = seed_user('poller', 3, 10, password=PASSWORD)
+        rebuild_stats()
+        return {
+            'user_id': user.id,
+            'habit_id': Habit.query.filter_by(user_id=user.id).order_by(Habit.id).first().id,
+            'completion_id': HabitCompletion.query.filter_by(user_id=user.id).order_by(HabitCompletion.id).first().id,
+        }
+
+
+def endpoints(ids):
+    """Returns (endpoint, client, url) for every view decorated with @conditional()."""
+    habit_id, completion_id = ids['habit_id'], ids['completion_id']
+    return [
+        ('habits_api.get_habits', 'api', '/api/habits/'),
+        ('habits_api.get_habit', 'api', f'/api/habits/{habit_id}'),
+        ('completions_api.get_completions', 'api', '/api/completions/?limit=50'),
+        ('completions_api.get_completion', 'api', f'/api/completions/{completion_id}'),
+        ('gamification_api.get_user_badges', 'api', '/api/gamification/user_badges'),
+        ('auth_api.profile', 'api', '/api/auth/profile'),
+        ('analytics_api.get_habit_analytics', 'api', f'/api/habits/{habit_id}/analytics'),
+        ('analytics_api.get_range_analytics', 'api', '/api/analytics'),
+        ('web.dashboard', 'web', '/dashboard'),
+        ('web.habit_analytics', 'web', f'/analytics/{habit_id}'),
+    ]
+
+
+def asgi_get(api, url, headers):
+    """GETs `url` from the ASGI app; returns (status, {lowercase header: value})."""
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'method': 'GET', 'scheme': 'http', 'http_version': '1.1',
+        'path': path, 'root_path': '', 'query_string': query.encode(),
+        'headers': [(b'host', b'localhost')] + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode(): value.decode() for name, value in message['headers']}
+
+    asyncio.run(api(scope, receive, send))
+    return response['status'], response['headers']
+
+
+def check_poll(name, get, engine, failures):
+    """Requests twice through `get(extra_headers)` -> (status, headers); the second
+    request, with the first one's ETag, must be a 304 that runs no statement."""
+    status, headers = get({})
+    etag = headers.get('ETag') or headers.get('etag')
+    if status != 200 or not etag:
+        failures.append(f'{name}: first request got {status} with ETag {etag!r}')
+        return None
+    with QueryCounter(engine) as queries:
+        status, _ = get({'If-None-Match': etag})
+    print(f'{name:<44} {status:>6} {queries.count:>8}')
+    if status != 304:
+        failures.append(f'{name}: HTTP {status} with a current ETag, expected 304')
+    if queries.count:
+        failures.append(f'{name}: {queries.count} queries on a revalidation, expected 0')
+    return etag
+
+
+def run():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        # A file database, so the ASGI app's aiosqlite engine sees the same rows
+        app = make_full_app(f'sqlite:///{path}', config_class=ConditionalConfig)
+        ids = seed(app)
+        api = AsyncAPI(app)
+        api_client, web_client = app.test_client(), app.test_client()
+        auth = api_headers(app, ids['user_id'])
+        login_web(web_client, 'poller', PASSWORD)
+        with app.app_context():
+            sync_engine = db.engine
+        async_engine = api.db.engines[None].sync_engine
+
+        def wsgi(client, url, headers):
+            def get(extra):
+                response = client.get(url, headers=dict(headers, **extra))
+                response.get_data()
+                return response.status_code, response.headers
+            return get
+
+        failures = []
+        etags = {}
+        print(f"{'endpoint':<44} {'status':>6} {'queries':>8}")
+        for endpoint, client_name, url in endpoints(ids):
+            client, headers = (api_client, auth) if client_name == 'api' else (web_client, {})
+            etags[endpoint] = check_poll(f'wsgi {endpoint}', wsgi(client, url, headers), sync_engine, failures)
+            if endpoint in NATIVE_ENDPOINTS:
+                check_poll(f'asgi {endpoint}', lambda extra: asgi_get(api, url, dict(auth, **extra)), async_engine, failures)
+
+        # A write bumps the version: the tag from before it must not get a 304
+        day = (date.today() - timedelta(days=30)).isoformat()
+        response = api_client.post('/api/completions/', json={'habit_id': ids['habit_id'], 'date_completed': day}, headers=auth)
+        if response.status_code != 201:
+            failures.append(f'write: HTTP {response.status_code}')
+        response = api_client.get('/api/habits/', headers=dict(auth, **{'If-None-Match': etags['habits_api.get_habits'] or ''}))
+        print(f"{'wsgi habits_api.get_habits after a write':<44} {response.status_code:>6} {'-':>8}")
+        if response.status_code != 200 or response.headers.get('ETag') == etags['habits_api.get_habits']:
+            failures.append(f'after a write: HTTP {response.status_code} with ETag {response.headers.get("ETag")!r}, expected 200 with a new one')
+    finally:
+        os.remove(path)
+
+    for failure in failures:
+        print('FAIL:', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,112 @@
+"""A small fake of the Google Calendar events API for local runs and checks.
+
+It accepts event inserts at /calendar/v3/calendars/<id>/events and answers
+with a new event id. Failures are scripted per event summary: `script` maps a
+summary to the HTTP statuses to return to its next inserts, in order, after
+which inserts succeed; a summary mapped to None always fails with 503. Every
+insert is recorded in `requests`.
+
+Point the app at it with GOOGLE_CALENDAR_API_ENDPOINT:
+
+    python -m benchmarks.fake_calendar --port 8085
+    GOOGLE_CALENDAR_API_ENDPOINT=http://localhost:8085/calendar/v3/ flask calendar drain
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EVENTS_PATH = re.compile(r'^/calendar/v3/calendars/[^/]+/events/?(\?.*)?$')
+
+
+class FakeCalendar:
+    """Serves the fake API on a daemon thread; use as a context manager."""
+
+    def __init__(self, port=0, script=None):
+        self.script = {summary: (None if statuses is None else list(statuses))
+                       for summary, statuses in (script or {}).items()}
+        self.requests = []  # (summary, status, time.monotonic())
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        """The API endpoint to set as GOOGLE_CALENDAR_API_ENDPOINT."""
+        return f'http://127.0.0.1:{self._server.server_port}/calendar/v3/'
+
+    def requests_for(self, summary):
+        with self._lock:
+            return [(status, at) for name, status, at in self.requests if name == summary]
+
+    def insert(self, event):
+        """Returns (status, body) for an insert of `event` and records it."""
+        summary = event.get('summary', '')
+        with self._lock:
+            statuses = self.script.get(summary, [])
+            if statuses is None:
+                status = 503
+            else:
+                status = statuses.pop(0) if statuses else 200
+            self.requests.append((summary, status, time.monotonic()))
+            if status != 200:
+                return status, {'error': {'code': status, 'message': 'Scripted failure'}}
+            return status, dict(event, id=f'fake-event-{next(self._ids)}', status='confirmed')
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not EVENTS_PATH.match(self.path):
+                    return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    event = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._send(400, {'error': {'code': 400, 'message': 'Invalid JSON'}})
+                self._send(*fake.insert(event))
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-calendar', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8085)
+    fake = FakeCalendar(parser.parse_args().port)
+    print(f'Fake Calendar API at {fake.url}')
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,269 @@
+"""In-process load driver for every route in app/api/ and app/web/routes.py.
+
+Seeds a database with benchmarks.datagen (or reuses one it filled earlier),
+then calls each route `--requests` times through the Flask test client and
+reports latency percentiles, queries per request and status codes. Results
+can be written to JSON and compared with an earlier run.
+
+    python -m benchmarks.load --output before.json
+    python -m benchmarks.load --output after.json --compare before.json
+    python -m benchmarks.load --database-uri sqlite:////tmp/bench.db --reuse --requests 200
+
+The Google OAuth routes (/google_auth, /oauth2callback) are skipped because
+they call out to Google.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+from app import db
+from app.models import User, Habit, HabitCompletion
+from benchmarks.common import BenchmarkConfig, make_full_app, QueryCounter, login_web, api_headers
+from benchmarks.datagen import generate, PASSWORD
+
+# client: 'api' sends the load user's JWT, 'web' is logged in through the form,
+# 'anon' is a new client per request and 'fresh_web' a new logged-in client per request.
+# build(i) returns (url, request kwargs) for the i-th request.
+Scenario = namedtuple('Scenario', 'name client method build')
+SKIPPED = ('web.google_auth', 'web.oauth2callback')
+
+
+class LoadConfig(BenchmarkConfig):
+    # Record server errors as 500 responses instead of raising them in the driver
+    PROPAGATE_EXCEPTIONS = False
+
+
+class Pools:
+    """Rows created up front for routes that consume one per request (deletes,
+    first completion of the day), so the timed requests all take the same path."""
+
+    def __init__(self, app, user_id, count):
+        self.app = app
+        self.user_id = user_id
+        self.count = count
+        self._habits = {}
+
+    def habits(self, name):
+        if name not in self._habits:
+            with self.app.app_context():
+                habits = [Habit(user_id=self.user_id, habit_name=f'{name} {i}') for i in range(self.count)]
+                db.session.add_all(habits)
+                db.session.commit()
+                self._habits[name] = [habit.id for habit in habits]
+        return self._habits[name]
+
+    def completions(self):
+        if 'completions' not in self._habits:
+            with self.app.app_context():
+                self._habits['completions'] = [row[0] for row in db.session.query(HabitCompletion.id).filter(
+                    HabitCompletion.user_id == self.user_id
+                ).order_by(HabitCompletion.id).limit(self.count)]
+        return self._habits['completions']
+
+
+def scenarios(ids, pools, run_id):
+    """Returns the Scenario list: reads first, then writes, then deletes."""
+    today = date.today()
+    habit_id = ids['habit_ids'][0]
+    username = ids['username']
+    month_ago = (today - timedelta(days=30)).isoformat()
+
+    def fixed(url, **kwargs):
+        return lambda i: (url, kwargs)
+
+    def old_day(i, offset=0):
+        # Days before any generated history, unique per request
+        return (today - timedelta(days=ids['days'] + 1 + offset + i)).isoformat()
+
+    return [
+        Scenario('api.auth.profile', 'api', 'GET', fixed('/api/auth/profile')),
+        Scenario('api.habits.list', 'api', 'GET', fixed('/api/habits/')),
+        Scenario('api.habits.get', 'api', 'GET', fixed(f'/api/habits/{habit_id}')),
+        Scenario('api.completions.list', 'api', 'GET', fixed('/api/completions/?limit=100')),
+        Scenario('api.completions.list_filtered', 'api', 'GET',
+                 fixed(f'/api/completions/?habit_id={habit_id}&start={month_ago}')),
+        Scenario('api.completions.ndjson', 'api', 'GET', fixed(f'/api/completions/?format=ndjson&start={month_ago}')),
+        Scenario('api.export.csv', 'api', 'GET', fixed('/api/export/')),
+        Scenario('api.export.xlsx', 'api', 'GET', fixed('/api/export/?format=xlsx')),
+        Scenario('api.completions.get', 'api', 'GET', lambda i: (f'/api/completions/{pools.completions()[i]}', {})),
+        Scenario('api.gamification.badges', 'api', 'GET', fixed('/api/gamification/badges')),
+        Scenario('api.gamification.user_badges', 'api', 'GET', fixed('/api/gamification/user_badges')),
+        Scenario('api.gamification.leaderboard', 'api', 'GET', fixed('/api/gamification/leaderboards/streak')),
+        Scenario('api.analytics.habit', 'api', 'GET', fixed(f'/api/habits/{habit_id}/analytics')),
+        Scenario('api.analytics.range', 'api', 'GET',
+                 fixed(f'/api/analytics?start={(today - timedelta(days=89)).isoformat()}&end={today.isoformat()}')),
+        Scenario('web.index', 'anon', 'GET', fixed('/')),
+        Scenario('web.login.form', 'anon', 'GET', fixed('/login')),
+        Scenario('web.register.form', 'anon', 'GET', fixed('/register')),
+        Scenario('web.dashboard', 'web', 'GET', fixed('/dashboard')),
+        Scenario('web.habit_analytics', 'web', 'GET', fixed(f'/analytics/{habit_id}')),
+        Scenario('web.add_habit.form', 'web', 'GET', fixed('/add_habit')),
+        Scenario('web.edit_habit.form', 'web', 'GET', fixed(f'/edit_habit/{habit_id}')),
+        Scenario('web.delete_habit.form', 'web', 'GET', fixed(f'/delete_habit/{habit_id}')),
+        Scenario('web.profile', 'web', 'GET', fixed('/profile')),
+
+        Scenario('api.auth.login', 'anon', 'POST', fixed('/api/auth/login', json={
+            'username': username, 'password': PASSWORD})),
+        Scenario('api.auth.register', 'anon', 'POST', lambda i: ('/api/auth/register', {'json': {
+            'username': f'api-{run_id}-{i}', 'email': f'api-{run_id}-{i}@example.com', 'password': PASSWORD}})),
+        Scenario('api.auth.logout', 'api', 'POST', fixed('/api/auth/logout')),
+        Scenario('api.habits.create', 'api', 'POST', lambda i: ('/api/habits/', {'json': {'habit_name': f'Load {i}'}})),
+        Scenario('api.habits.update', 'api', 'PUT', lambda i: (f'/api/habits/{habit_id}', {
+            'json': {'habit_name': f'Renamed {i}'}})),
+        Scenario('api.completions.create', 'api', 'POST', lambda i: ('/api/completions/', {
+            'json': {'habit_id': habit_id, 'date_completed': old_day(i)}})),
+        Scenario('api.completions.bulk', 'api', 'POST', lambda i: ('/api/completions/bulk', {'json': {'completions': [
+            {'habit_id': habit_id, 'date_completed': old_day(i * 10 + d, offset=pools.count)} for d in range(10)
+        ]}})),
+        Scenario('web.login', 'anon', 'POST', fixed('/login', data={'username': username, 'password': PASSWORD})),
+        Scenario('web.register', 'anon', 'POST', lambda i: ('/register', {'data': {
+            'username': f'web-{run_id}-{i}', 'email': f'web-{run_id}-{i}@example.com', 'password': PASSWORD}})),
+        Scenario('web.logout', 'fresh_web', 'GET', fixed('/logout')),
+        Scenario('web.add_habit', 'web', 'POST', lambda i: ('/add_habit', {'data': {'habit_name': f'Web {i}'}})),
+        Scenario('web.edit_habit', 'web', 'POST', lambda i: (f'/edit_habit/{habit_id}', {
+            'data': {'habit_name': f'Edited {i}'}})),
+        Scenario('web.complete_habit', 'web', 'POST',
+                 lambda i: (f'/complete_habit/{pools.habits("Complete")[i]}', {})),
+        Scenario('web.complete_habit.live', 'web', 'POST', lambda i: (
+            f'/complete_habit/{pools.habits("Complete live")[i]}', {'headers': {'Accept': 'application/json'}})),
+        Scenario('web.profile.update', 'web', 'POST', fixed('/profile', data={
+            'username': username, 'email': f'{username}@example.com', 'current_password': PASSWORD})),
+
+        Scenario('api.completions.delete', 'api', 'DELETE',
+                 lambda i: (f'/api/completions/{pools.completions()[i]}', {})),
+        Scenario('api.habits.delete', 'api', 'DELETE', lambda i: (f'/api/habits/{pools.habits("Delete api")[i]}', {})),
+        Scenario('web.delete_habit', 'web', 'POST', lambda i: (f'/delete_habit/{pools.habits("Delete web")[i]}', {})),
+    ]
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted samples."""
+    return samples[max(int(round(fraction * len(samples))) - 1, 0)]
+
+
+def summarize(timings, queries, statuses):
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p90_ms': round(percentile(timings, 0.90), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def seed_or_reuse(app, args):
+    """Returns the load user's IDs, generating the dataset unless --reuse finds one."""
+    with app.app_context():
+        db.create_all()
+        user = User.query.filter_by(username='bench0').first() if args.reuse else None
+        if user is None:
+            started = time.perf_counter()
+            counts = generate(args.users, args.habits, args.days, args.density)
+            print(f"Seeded {counts['users']} users, {counts['habits']} habits, {counts['completions']} completions "
+                  f"in {time.perf_counter() - started:.1f}s")
+            ids = counts['first']
+        else:
+            ids = {'user_id': user.id, 'username': user.username, 'habit_ids': [
+                habit_id for (habit_id,) in db.session.query(Habit.id).filter_by(user_id=user.id).order_by(Habit.id)
+            ]}
+        first_day = db.session.query(db.func.min(HabitCompletion.date_completed)).scalar() or date.today()
+        return dict(ids, days=(date.today() - first_day).days + 1)
+
+
+def compare(results, baseline_file):
+    with open(baseline_file) as f:
+        baseline = json.load(f)['routes']
+    print(f"\n{'route vs ' + baseline_file:<34} {'p50 ms':>16} {'p95 ms':>16} {'queries':>12}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        print(f"{name:<34} {before['p50_ms']:>7.2f} -> {result['p50_ms']:<6.2f} "
+              f"{before['p95_ms']:>7.2f} -> {result['p95_ms']:<6.2f} "
+              f"{before['queries_mean']:>4.1f} -> {result['queries_mean']:<4.1f}")
+
+
+def run(args):
+    app = make_full_app(args.database_uri, LoadConfig)
+    ids = seed_or_reuse(app, args)
+    run_id = int(time.time())
+    api_client, web_client = app.test_client(), app.test_client()
+    headers = api_headers(app, ids['user_id'])
+    login_web(web_client, ids['username'], PASSWORD)
+
+    with app.app_context():
+        engine = db.engine
+        database = engine.url.render_as_string(hide_password=True)
+    results = {}
+    print(f"{'route':<34} {'n':>5} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'queries':>8}  statuses")
+    # Requests run outside any app context so each gets its own, with a fresh session
+    pools = Pools(app, ids['user_id'], args.requests)
+    for scenario in scenarios(ids, pools, run_id):
+        timings, queries, statuses = [], [], Counter()
+        for i in range(args.requests):
+            url, kwargs = scenario.build(i)
+            if scenario.client == 'api':
+                client, kwargs = api_client, dict(kwargs, headers=headers)
+            elif scenario.client == 'web':
+                client = web_client
+            else:
+                client = app.test_client()
+                if scenario.client == 'fresh_web':
+                    login_web(client, ids['username'], PASSWORD)
+            with QueryCounter(engine) as counter:
+                start = time.perf_counter()
+                response = client.open(url, method=scenario.method, **kwargs)
+                response.get_data()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(counter.count)
+            statuses[response.status_code] += 1
+        result = results[scenario.name] = summarize(timings, queries, statuses)
+        print(f"{scenario.name:<34} {result['requests']:>5} {result['p50_ms']:>8.2f} {result['p90_ms']:>8.2f} "
+              f"{result['p99_ms']:>8.2f} {result['queries_mean']:>8.1f}  {dict(statuses)}")
+
+    errors = [name for name, result in results.items() if any(code.startswith('5') for code in result['statuses'])]
+    for name in errors:
+        print(f'ERROR: {name} returned server errors: {results[name]["statuses"]}')
+    print(f"Skipped: {', '.join(SKIPPED)}")
+
+    if args.output:
+        report = {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'database': database,
+            'dataset': {'users': args.users, 'habits': args.habits, 'days': args.days,
+                        'density': args.density, 'reused': args.reuse},
+            'requests_per_route': args.requests,
+            'routes': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', help='Database to use; defaults to an in-memory SQLite database.')
+    parser.add_argument('--reuse', action='store_true', help='Use the data already in the database if present.')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--habits', type=int, default=10, help='Habits per user.')
+    parser.add_argument('--days', type=int, default=180, help='Days of history per habit.')
+    parser.add_argument('--density', type=float, default=0.7, help='Share of days with a completion.')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per route.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Print the changes against an earlier --output file.')
+    sys.exit(run(parser.parse_args()))
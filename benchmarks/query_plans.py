@@ -0,0 +1,171 @@
+"""Query plan and query count regression check for every API and web endpoint.
+
+Each endpoint is called through the Flask test client against a seeded SQLite
+database. Every statement it runs is re-run under EXPLAIN QUERY PLAN, and the
+check fails when one of them scans a core table instead of searching an index,
+or when an endpoint runs more queries than recorded in query_budget.json.
+Scenarios ending in .304 repeat a request with the ETag it returned and must
+get 304 Not Modified, with a budget of zero queries.
+
+    python -m benchmarks.query_plans            # check
+    python -m benchmarks.query_plans --update   # accept the current query counts
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, timedelta
+from app import db
+from app.models import Habit, HabitCompletion, Badge
+from app.stats import rebuild_stats
+from benchmarks.common import make_full_app, QueryCounter, seed_user, login_web, api_headers
+
+BUDGET_FILE = os.path.join(os.path.dirname(__file__), 'query_budget.json')
+CORE_TABLES = {'user', 'habit', 'habit_completion', 'habit_stats', 'user_badge', 'calendar_outbox'}
+HABITS = 20
+DAYS = 90
+PASSWORD = 'benchmark-password'
+# Scans an endpoint may do by design: the first leaderboard read builds the
+# ranking index from every user's badge count.
+ALLOWED_SCANS = {'api.leaderboard.first': {'user_badge'}}
+
+
+def seed(app):
+    """Creates one user with history plus three spare habits; returns the IDs the scenarios need."""
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Badge(name=name, description=name) for name in ('Beginner', 'Consistency', 'Pro')])
+        user = seed_user('planner', HABITS, DAYS, password=PASSWORD)
+        seed_user('neighbour', HABITS, DAYS)
+        spare = [Habit(user_id=user.id, habit_name=f'Spare {i}') for i in range(3)]
+        db.session.add_all(spare)
+        db.session.commit()
+        rebuild_stats()
+        completion = HabitCompletion.query.filter_by(user_id=user.id).order_by(HabitCompletion.id).first()
+        return {
+            'user_id': user.id,
+            'habit_id': Habit.query.filter_by(user_id=user.id).order_by(Habit.id).first().id,
+            'spare_ids': [habit.id for habit in spare],
+            'completion_id': completion.id,
+        }
+
+
+def scenarios(ids):
+    """Returns (name, client, method, url, kwargs) for every endpoint."""
+    today = date.today()
+    habit_id, completion_id = ids['habit_id'], ids['completion_id']
+    old_day = (today - timedelta(days=DAYS + 30)).isoformat()
+    return [
+        ('api.habits.list', 'api', 'GET', '/api/habits/', {}),
+        ('api.habits.get', 'api', 'GET', f'/api/habits/{habit_id}', {}),
+        ('api.habits.create', 'api', 'POST', '/api/habits/', {'json': {'habit_name': 'Planned'}}),
+        ('api.habits.update', 'api', 'PUT', f'/api/habits/{habit_id}', {'json': {'habit_name': 'Renamed'}}),
+        ('api.completions.list', 'api', 'GET', '/api/completions/?limit=50', {}),
+        ('api.completions.list_filtered', 'api', 'GET',
+         f'/api/completions/?habit_id={habit_id}&start={(today - timedelta(days=30)).isoformat()}', {}),
+        ('api.completions.ndjson', 'api', 'GET', '/api/completions/?format=ndjson', {}),
+        ('api.completions.create', 'api', 'POST', '/api/completions/',
+         {'json': {'habit_id': habit_id, 'date_completed': old_day}}),
+        ('api.completions.bulk', 'api', 'POST', '/api/completions/bulk', {'json': {'completions': [
+            {'habit_id': habit_id, 'date_completed': (today - timedelta(days=DAYS + d)).isoformat()} for d in range(1, 11)
+        ]}}),
+        ('api.export.csv', 'api', 'GET', '/api/export/', {}),
+        ('api.export.xlsx', 'api', 'GET', '/api/export/?format=xlsx', {}),
+        ('api.completions.get', 'api', 'GET', f'/api/completions/{completion_id}', {}),
+        ('api.completions.delete', 'api', 'DELETE', f'/api/completions/{completion_id}', {}),
+        ('api.gamification.badges', 'api', 'GET', '/api/gamification/badges', {}),
+        ('api.gamification.user_badges', 'api', 'GET', '/api/gamification/user_badges', {}),
+        ('api.auth.profile', 'api', 'GET', '/api/auth/profile', {}),
+        ('api.analytics.habit', 'api', 'GET', f'/api/habits/{habit_id}/analytics', {}),
+        ('api.analytics.range', 'api', 'GET',
+         f'/api/analytics?start={(today - timedelta(days=DAYS)).isoformat()}&end={today.isoformat()}', {}),
+        ('web.dashboard', 'web', 'GET', '/dashboard', {}),
+        ('web.habit_analytics', 'web', 'GET', f'/analytics/{habit_id}', {}),
+        ('web.complete_habit', 'web', 'POST', f'/complete_habit/{ids["spare_ids"][0]}', {}),
+        ('web.complete_habit.live', 'web', 'POST', f'/complete_habit/{ids["spare_ids"][2]}',
+         {'headers': {'Accept': 'application/json'}}),
+        ('web.add_habit', 'web', 'POST', '/add_habit', {'data': {'habit_name': 'From the web'}}),
+        ('web.edit_habit', 'web', 'POST', f'/edit_habit/{habit_id}', {'data': {'habit_name': 'Edited'}}),
+        ('web.profile', 'web', 'GET', '/profile', {}),
+        ('api.habits.delete', 'api', 'DELETE', f'/api/habits/{ids["spare_ids"][1]}', {}),
+        ('api.leaderboard.first', 'api', 'GET', '/api/gamification/leaderboards/streak', {}),
+        ('api.leaderboard.warm', 'api', 'GET', '/api/gamification/leaderboards/week?offset=5', {}),
+        ('api.habits.list.304', 'api', 'GET', '/api/habits/', {'revalidate': True}),
+        ('api.completions.list.304', 'api', 'GET', '/api/completions/?limit=50', {'revalidate': True}),
+        ('api.gamification.user_badges.304', 'api', 'GET', '/api/gamification/user_badges', {'revalidate': True}),
+        ('api.analytics.range.304', 'api', 'GET', '/api/analytics', {'revalidate': True}),
+        ('web.dashboard.304', 'web', 'GET', '/dashboard', {'revalidate': True}),
+    ]
+
+
+def full_scans(connection, executions, allowed=()):
+    """Returns the plan lines of statements that scan a core table not in `allowed`."""
+    problems = []
+    for statement, parameters, executemany in executions:
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+            continue
+        for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+            detail = row[-1]
+            table = detail.split()[1].strip('"') if detail.startswith('SCAN ') else None
+            if table in CORE_TABLES and table not in allowed:
+                problems.append(f'{detail}  <-  {" ".join(statement.split())[:160]}')
+    return problems
+
+
+def run(update=False):
+    app = make_full_app()
+    ids = seed(app)
+    api_client, web_client = app.test_client(), app.test_client()
+    headers = api_headers(app, ids['user_id'])
+    login_web(web_client, 'planner', PASSWORD)
+
+    budget = {}
+    if os.path.exists(BUDGET_FILE):
+        with open(BUDGET_FILE) as f:
+            budget = json.load(f)
+
+    counts, failures = {}, []
+    with app.app_context():
+        engine = db.engine
+    print(f"{'endpoint':<32} {'status':>6} {'queries':>8} {'budget':>7}")
+    for name, client_name, method, url, kwargs in scenarios(ids):
+        client = api_client if client_name == 'api' else web_client
+        kwargs = dict(kwargs)
+        revalidate = kwargs.pop('revalidate', False)
+        if client_name == 'api':
+            kwargs['headers'] = dict(kwargs.get('headers', {}), **headers)
+        if revalidate:
+            # A poll that sends back the ETag of the previous response; only the poll is counted
+            etag = client.open(url, method=method, **kwargs).headers.get('ETag', '')
+            kwargs['headers'] = dict(kwargs.get('headers', {}), **{'If-None-Match': etag})
+        with QueryCounter(engine) as counter:
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+        counts[name] = counter.count
+        limit = budget.get(name)
+        print(f'{name:<32} {response.status_code:>6} {counter.count:>8} {limit if limit is not None else "-":>7}')
+        if response.status_code >= 500:
+            failures.append(f'{name}: HTTP {response.status_code}')
+        if revalidate and response.status_code != 304:
+            failures.append(f'{name}: HTTP {response.status_code}, expected 304 Not Modified')
+        if not update and limit is not None and counter.count > limit:
+            failures.append(f'{name}: {counter.count} queries, budget is {limit}')
+        with engine.connect() as connection:
+            failures.extend(f'{name}: {problem}' for problem in full_scans(connection, counter.executions, ALLOWED_SCANS.get(name, ())))
+
+    if update:
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(counts, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Wrote {BUDGET_FILE}')
+
+    for failure in failures:
+        print('FAIL:', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--update', action='store_true', help='Record the current query counts as the budget.')
+    sys.exit(run(parser.parse_args().update))
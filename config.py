@@ -1,6 +1,5 @@
 import os
 from datetime import timedelta
-import json
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your_secret_key_here'  # Replace with your actual secret key
@@ -10,15 +9,86 @@ class Config:
     MYSQL_DB = os.environ.get('MYSQL_DB') or 'habit_tracker'  # Replace with your MySQL database name
     os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # Use '0' for production to enforce secure transport
 
-    SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+    MYSQL_DRIVER = os.environ.get('MYSQL_DRIVER') or 'pymysql'  # 'pymysql' or 'mysqldb' (the mysqlclient package, faster C driver)
+    MYSQL_REPLICA_HOST = os.environ.get('MYSQL_REPLICA_HOST')  # If set, @read_only routes query this read replica
+
+    SQLALCHEMY_DATABASE_URI = f"mysql+{MYSQL_DRIVER}://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
+    SQLALCHEMY_BINDS = {'replica': f"mysql+{MYSQL_DRIVER}://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_REPLICA_HOST}/{MYSQL_DB}"} if MYSQL_REPLICA_HOST else {}
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE') or 'default'  # 'default', 'gunicorn', 'threaded' or 'batch', see app/engines.py
+    DB_POOL_SIZE = int(os.environ['DB_POOL_SIZE']) if os.environ.get('DB_POOL_SIZE') else None  # The DB_* settings below override the profile when set
+    DB_MAX_OVERFLOW = int(os.environ['DB_MAX_OVERFLOW']) if os.environ.get('DB_MAX_OVERFLOW') else None
+    DB_POOL_TIMEOUT = int(os.environ['DB_POOL_TIMEOUT']) if os.environ.get('DB_POOL_TIMEOUT') else None  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ['DB_POOL_RECYCLE']) if os.environ.get('DB_POOL_RECYCLE') else None  # Seconds; keep below the server's wait_timeout
+    DB_POOL_PRE_PING = os.environ['DB_POOL_PRE_PING'] == '1' if os.environ.get('DB_POOL_PRE_PING') else None
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ['DB_STATEMENT_TIMEOUT_MS']) if os.environ.get('DB_STATEMENT_TIMEOUT_MS') else None  # MySQL max_execution_time for SELECTs
+    DB_REPLICA_READ_YOUR_WRITES_SECONDS = int(os.environ.get('DB_REPLICA_READ_YOUR_WRITES_SECONDS') or 5)  # Users who wrote this recently read from the primary
+    ASYNC_DB_ENGINE_PROFILE = os.environ.get('ASYNC_DB_ENGINE_PROFILE') or 'asgi'  # Pool profile of the ASGI tier's async engines (asgi.py)
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS') or 32)  # Threads running non-native requests under ASGI
+    ASGI_MAX_CONCURRENCY = int(os.environ.get('ASGI_MAX_CONCURRENCY') or 40)  # Async requests in flight at once (the asgi pool's size + overflow); the rest wait without holding a connection
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     REMEMBER_COOKIE_DURATION = timedelta(days=7)  # User will stay logged in for 7 days
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'your_jwt_secret_key_here'  # Replace with your JWT secret key
     SESSION_COOKIE_NAME = 'habit_tracker_session'  # Name for the session cookie
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)  # Matches REMEMBER_COOKIE_DURATION
-    SESSION_REFRESH_EACH_REQUEST = True  # Refreshes session on every request
-    
-    # Load Google OAuth credentials from file
-    GOOGLE_CREDENTIALS_FILE = 'credentials.json'  # Replace with the actual path to your Google credentials file
-    with open(GOOGLE_CREDENTIALS_FILE) as f:
-        GOOGLE_CREDENTIALS = json.load(f)['web']  # Make sure the file contains the correct JSON structure
+    SESSION_REFRESH_EACH_REQUEST = False  # Only send the session cookie when the session changes
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 30)  # Seconds a cached user identity is trusted; 0 disables the cache
+    IDENTITY_CACHE_SIZE = 10000  # Users kept in each process's identity cache
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'  # Werkzeug method and cost; older hashes are upgraded at login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)  # Hashing processes per app process; 0 hashes on the request thread
+    PASSWORD_HASH_MAX_PENDING = 16  # Hashes queued or running per app process before requests wait
+    PASSWORD_HASH_QUEUE_TIMEOUT = 10  # Seconds a request waits for a hashing slot before a 503
+    DASHBOARD_RECENT_DAYS = int(os.environ.get('DASHBOARD_RECENT_DAYS') or 180)  # Days of completions shown on the dashboard calendar
+    LIVE_UPDATES_ENABLED = os.environ.get('LIVE_UPDATES_ENABLED', '1') == '1'  # Push dashboard changes to open pages over Socket.IO
+    LIVE_UPDATES_MESSAGE_QUEUE = os.environ.get('LIVE_UPDATES_MESSAGE_QUEUE')  # e.g. 'redis://localhost:6379/2'; needed with several worker processes
+    COMPLETIONS_PAGE_SIZE = int(os.environ.get('COMPLETIONS_PAGE_SIZE') or 100)  # Default page size for /api/completions/
+    COMPLETIONS_MAX_PAGE_SIZE = 1000
+    COMPLETIONS_STREAM_BATCH = 1000  # Rows fetched per round trip when streaming NDJSON
+    EXPORT_BATCH_SIZE = 5000  # Rows fetched per round trip by the CSV/XLSX exports
+    BULK_COMPLETIONS_MAX = int(os.environ.get('BULK_COMPLETIONS_MAX') or 5000)  # Max items per /api/completions/bulk request
+    BADGE_CATALOG_TTL = int(os.environ.get('BADGE_CATALOG_TTL') or 300)  # Seconds the badge catalog is cached in-process
+    ANALYTICS_MAX_RANGE_DAYS = int(os.environ.get('ANALYTICS_MAX_RANGE_DAYS') or 1096)  # Longest range accepted by /api/analytics
+    LEADERBOARD_MAX_LIMIT = 100  # Largest page size for /api/gamification/leaderboards/<metric>
+    LEADERBOARD_PRELOAD = os.environ.get('LEADERBOARD_PRELOAD') == '1'  # Build the ranking indexes in the background at startup
+    LEADERBOARD_REBUILD_INTERVAL = int(os.environ.get('LEADERBOARD_REBUILD_INTERVAL') or 300)  # Seconds between rebuilds of the per-process rankings; unused with CACHE_BACKEND=redis
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or ('redis' if os.environ.get('REDIS_URL') else 'null')  # 'redis' (shared by all workers), 'null', or 'lru' (only with a single process)
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL') or os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 10000)  # Entry limit of the in-process LRU backend
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL') or 300)  # Seconds; writes invalidate entries immediately regardless
+    CACHE_KEY_PREFIX = 'ht'
+    CACHE_COALESCE_TIMEOUT = 30  # Seconds a request waits for an identical in-flight computation before running its own
+    CONDITIONAL_GET_ENABLED = os.environ.get('CONDITIONAL_GET_ENABLED', '1') == '1'  # ETag/Last-Modified from the cache versions, 304 without queries; needs CACHE_BACKEND=redis
+    CONDITIONAL_GET_LRU = os.environ.get('CONDITIONAL_GET_LRU') == '1'  # Also with CACHE_BACKEND=lru; only when a single process serves the app
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI') or 'memory://'  # 'memory://' (per process) or e.g. 'redis://localhost:6379/1' (shared by all workers)
+    RATELIMIT_STRATEGY = os.environ.get('RATELIMIT_STRATEGY') or 'fixed-window'  # or 'moving-window' (smoother, more storage work per request)
+    RATELIMIT_HEADERS_ENABLED = True  # X-RateLimit-* and Retry-After headers
+    RATELIMIT_IN_MEMORY_FALLBACK_ENABLED = True  # Count in-process while the storage server is unreachable
+    RATELIMIT_KEY_PREFIX = 'ht-limits'
+    RATELIMIT_PER_IP = os.environ.get('RATELIMIT_PER_IP') or '300/minute'  # Per client IP on each expensive endpoint; put ProxyFix in front when behind a proxy
+    RATELIMIT_COMPLETIONS_PER_USER = os.environ.get('RATELIMIT_COMPLETIONS_PER_USER') or '60/minute'  # GET /api/completions/ and /bulk
+    RATELIMIT_COMPLETIONS_WRITE_PER_USER = os.environ.get('RATELIMIT_COMPLETIONS_WRITE_PER_USER') or '120/minute'  # POST /api/completions/, one check-in per request
+    RATELIMIT_ANALYTICS_PER_USER = os.environ.get('RATELIMIT_ANALYTICS_PER_USER') or '30/minute'  # Analytics APIs and /analytics/<id>
+    RATELIMIT_DASHBOARD_PER_USER = os.environ.get('RATELIMIT_DASHBOARD_PER_USER') or '120/minute'  # Web actions redirect here, so it allows more
+    RATELIMIT_EXPORT_PER_USER = os.environ.get('RATELIMIT_EXPORT_PER_USER') or '10/hour'  # GET /api/export/ reads the whole history
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'  # Per-request query/latency histograms on /metrics
+    INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN')  # /metrics requires "Authorization: Bearer <token>"; without a token it is only served in debug mode
+    INSTRUMENTATION_PROFILE_DIR = os.environ.get('INSTRUMENTATION_PROFILE_DIR')  # If set, cProfile dumps of slow requests are written here
+    INSTRUMENTATION_PROFILE_THRESHOLD_MS = int(os.environ.get('INSTRUMENTATION_PROFILE_THRESHOLD_MS') or 500)
+
+    # Google OAuth credentials, read from the file on first use of a Google feature
+    GOOGLE_CREDENTIALS_FILE = os.environ.get('GOOGLE_CREDENTIALS_FILE') or 'credentials.json'  # Replace with the actual path to your Google credentials file
+    GOOGLE_CREDENTIALS = None  # Or set the file's 'web' section here to skip reading the file
+    GOOGLE_CALENDAR_API_ENDPOINT = os.environ.get('GOOGLE_CALENDAR_API_ENDPOINT')  # e.g. http://localhost:8085/calendar/v3/ for a fake server
+    GOOGLE_SERVICE_CACHE_SIZE = int(os.environ.get('GOOGLE_SERVICE_CACHE_SIZE') or 256)  # Built Calendar clients kept per process
+    GOOGLE_TOKEN_REFRESH_MARGIN = 300  # Seconds before expiry at which access tokens are refreshed
+
+    # Google Calendar outbox worker
+    CALENDAR_WORKER_IN_PROCESS = os.environ.get('CALENDAR_WORKER_IN_PROCESS', '1') == '1'  # Set to '0' when running `flask calendar worker` separately
+    CALENDAR_WORKER_THREADS = int(os.environ.get('CALENDAR_WORKER_THREADS') or 4)
+    CALENDAR_OUTBOX_BATCH_SIZE = 50
+    CALENDAR_OUTBOX_POLL_INTERVAL = 1.0  # Seconds between polls when the outbox is empty
+    CALENDAR_OUTBOX_MAX_ATTEMPTS = 8
+    CALENDAR_OUTBOX_BACKOFF_BASE = 5  # Seconds before the first retry, doubled on each attempt
+    CALENDAR_OUTBOX_BACKOFF_MAX = 3600
+    CALENDAR_OUTBOX_LEASE_SECONDS = 300  # In-progress rows are reclaimed after this long
+    CALENDAR_STATS_LOG_INTERVAL = 300  # Seconds between calendar client cache stats log lines
@@ -1,8 +1,23 @@
 from app import create_app
+from app.live import socketio
+from app.calendar_sync import start_in_process_worker
 
-"""Starts the Flask app with debug mode enabled if run directly."""
+"""Starts the Flask app with debug mode enabled if run directly.
+
+The app is only created under the __main__ guard: the password hashing pool
+spawns processes that re-import this module, and each would otherwise build
+an app and start its workers. WSGI servers call the factory instead, e.g.
+`gunicorn --threads 100 'run:create_server()'`.
+"""
+
+
+def create_server():
+    """Creates the app and starts its in-process calendar worker."""
+    app = create_app()
+    start_in_process_worker(app)
+    return app
 
-app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # Serves the Socket.IO endpoint of the live dashboard updates as well
+    socketio.run(create_server(), debug=True)